@@ -0,0 +1,113 @@
+import os
+import json
+import threading
+from typing import List, Optional
+
+
+class WalkCursor:
+    """
+    Resumable position of one root's walk.
+    A directory is "done" once its own files are committed and every child subtree
+    is done. Done children collapse into their parent, so the saved cursor stays about
+    the size of the walk frontier, not the tree. "In flight" directories have been
+    listed but may be only partly committed; on resume they are the only ones whose
+    existing rows are queried.
+    """
+
+    def __init__(self, root: str, done=(), in_flight=()):
+        self.root = os.path.normpath(root)
+        self.done = set(done)
+        self.resumed = set(in_flight)  # in flight at the last checkpoint, not re-listed yet
+        self.complete = False
+        self._outstanding = {}  # listed dir -> files + child subtrees still open
+        self._done_children = {}
+        self._lock = threading.Lock()
+
+    def skip(self, directory: str) -> bool:
+        return directory in self.done
+
+    def listed(self, directory: str, files: int, subdirs: int, done_subdirs=()):
+        """Must be called before any of the directory's files/subdirs are queued."""
+        with self._lock:
+            self.resumed.discard(directory)
+            self._done_children.setdefault(directory, set()).update(done_subdirs)
+            self._outstanding[directory] = files + subdirs
+            if not self._outstanding[directory]:
+                self._finish(directory)
+
+    def files_committed(self, directories):
+        """Called by the DB writer with the directory of every file in the commit."""
+        with self._lock:
+            for directory in directories:
+                self._outstanding[directory] -= 1
+                if not self._outstanding[directory]:
+                    self._finish(directory)
+
+    def _finish(self, directory: str):
+        while True:
+            del self._outstanding[directory]
+            self.done -= self._done_children.pop(directory, set())
+            if directory == self.root:
+                self.complete = True
+                self.done.clear()
+                return
+            self.done.add(directory)
+            parent = os.path.dirname(directory)
+            self._done_children.setdefault(parent, set()).add(directory)
+            self._outstanding[parent] -= 1
+            if self._outstanding[parent]:
+                return
+            directory = parent
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "complete": self.complete,
+                "done": sorted(self.done),
+                "in_flight": sorted(set(self._outstanding) | self.resumed),
+            }
+
+
+# --- Persistence (ScanMission.checkpoint_json) ---
+
+# Scan modes a mission can be resumed in: "index" continues from the walk cursors, "fast"
+# walks again from the start (its spool does not survive a crash). Estimates keep no cursor.
+RESUMABLE_MODES = ("index", "fast")
+
+
+def plan_checkpoint(gold_paths: List[str], target_paths: List[str], schedule: str = "walk",
+                    chunking: bool = False, similarity: bool = False, mode: str = "index") -> str:
+    """Initial checkpoint: every root of the mission, not started yet (+ the options a resume needs)."""
+    roots = [{"path": os.path.normpath(p), "tag": "MASTER", "complete": False} for p in gold_paths]
+    roots += [{"path": os.path.normpath(p), "tag": "TARGET", "complete": False} for p in target_paths]
+    return json.dumps({"mode": mode, "schedule": schedule, "chunking": chunking, "similarity": similarity,
+                       "roots": roots})
+
+
+def checkpoint_mode(checkpoint: dict) -> str:
+    """Scan mode of a mission; checkpoints written before it was recorded are index scans, agent ones "remote"."""
+    if "mode" in checkpoint:
+        return checkpoint["mode"]
+    return "remote" if "ingest" in checkpoint else "index"
+
+
+def root_entry(mission, root: str) -> Optional[dict]:
+    if not mission.checkpoint_json:
+        return None
+    root = os.path.normpath(root)
+    for entry in json.loads(mission.checkpoint_json)["roots"]:
+        if entry["path"] == root:
+            return entry
+    return None
+
+
+def save_cursor(session, mission, cursor: WalkCursor, tag: str):
+    """Writes the cursor into the mission row; caller commits together with the file rows."""
+    data = json.loads(mission.checkpoint_json) if mission.checkpoint_json else {"roots": []}
+    entry = next((e for e in data["roots"] if e["path"] == cursor.root), None)
+    if entry is None:
+        entry = {"path": cursor.root, "tag": tag}
+        data["roots"].append(entry)
+    entry.update(cursor.state())
+    mission.checkpoint_json = json.dumps(data)
+    session.add(mission)
@@ -0,0 +1,155 @@
+import os
+import hashlib
+from typing import List, Tuple
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app.database.models import engine, FileChunk, FileRecord
+from app.database.catalog import Catalog
+
+# Content-defined chunking (FastCDC-style) for partial duplicates: VM/disk images,
+# PST archives, edited videos. Files at or above CHUNK_MIN_FILE are chunked during the
+# same read pass as their MD5 (Scanner.calculate_hash), on the hashing workers.
+CHUNK_MIN_FILE = int(os.getenv("SENTRY_CHUNK_MIN_FILE", 64 * 1024 * 1024))
+CHUNK_MIN = 16 * 1024
+CHUNK_AVG = 64 * 1024
+CHUNK_MAX = 256 * 1024
+_BUFFER = 8 * 1024 * 1024  # numpy works on this much at a time
+
+# Fixed seed: chunk boundaries (and so fingerprints) must be identical across runs and hosts
+GEAR = np.random.default_rng(0x5E47C0DE).integers(0, 2 ** 32, 256, dtype=np.uint32)
+
+
+def gear_hash(data: np.ndarray) -> np.ndarray:
+    """
+    Rolling gear hash h[i] = (h[i-1] << 1) + GEAR[data[i]] (mod 2^32) for every position.
+    With a 32-bit state only the last 32 bytes contribute, so h[i] = sum(GEAR[data[i-k]] << k)
+    for k < 32, built with 5 doubling steps instead of a byte loop.
+    """
+    h = GEAR[data]
+    tmp = np.empty_like(h)  # Ping-pong buffers: no allocation per step
+    shift = 1
+    while shift < 32:
+        np.left_shift(h[:-shift], np.uint32(shift), out=tmp[shift:])
+        tmp[shift:] += h[shift:]
+        tmp[:shift] = h[:shift]
+        h, tmp = tmp, h
+        shift *= 2
+    return h
+
+
+def _mask(bits: int) -> np.uint32:
+    # High bits: in a gear hash the low bits only see the last few bytes
+    return np.uint32(((1 << bits) - 1) << (32 - bits))
+
+
+class Chunker:
+    """
+    Streaming FastCDC with normalized chunking: below the average size a cut needs a
+    stricter mask (2 more bits), above it a looser one, which narrows the size spread.
+    Feed consecutive blocks of the file to update(); finish() returns every chunk
+    as (length, 8-byte BLAKE2b digest).
+    """
+
+    def __init__(self, min_size: int = CHUNK_MIN, avg_size: int = CHUNK_AVG, max_size: int = CHUNK_MAX):
+        self.min_size, self.avg_size, self.max_size = min_size, avg_size, max_size
+        bits = avg_size.bit_length() - 1
+        self.mask_s, self.mask_l = _mask(bits + 2), _mask(bits - 2)
+        self._buf = bytearray()  # Bytes since the last cut
+        self.chunks: List[Tuple[int, bytes]] = []
+
+    def update(self, block: bytes):
+        self._buf += block
+        if len(self._buf) >= _BUFFER:
+            self._cut(final=False)
+
+    def finish(self) -> List[Tuple[int, bytes]]:
+        self._cut(final=True)
+        return self.chunks
+
+    def _cut(self, final: bool):
+        data = np.frombuffer(self._buf, dtype=np.uint8)
+        h = gear_hash(data)
+        # Cut "after byte i": chunk end offsets
+        strict = np.flatnonzero((h & self.mask_s) == 0) + 1
+        loose = np.flatnonzero((h & self.mask_l) == 0) + 1
+        n, start = len(data), 0
+        while start < n:
+            # The window never crosses the previous cut: every position tested is >= min_size into the chunk
+            end = None
+            i = np.searchsorted(strict, start + self.min_size)
+            if i < len(strict) and strict[i] < start + self.avg_size:
+                end = int(strict[i])
+            else:
+                j = np.searchsorted(loose, start + self.avg_size)
+                if j < len(loose) and loose[j] < start + self.max_size:
+                    end = int(loose[j])
+                elif n - start >= self.max_size:
+                    end = start + self.max_size
+                elif final:
+                    end = n
+            if end is None:
+                break  # Needs more data to decide
+            self.chunks.append((end - start, hashlib.blake2b(self._buf[start:end], digest_size=8).digest()))
+            start = end
+        del data  # Releases the buffer export before resizing
+        del self._buf[:start]
+
+
+def store_chunks(session: Session, file_id: int, chunks):
+    """Replaces a file's chunk list (rows updated in place, e.g. by the watcher, start clean)."""
+    session.connection().exec_driver_sql("DELETE FROM filechunk WHERE file_id = ?", (file_id,))
+    if chunks:
+        session.execute(insert(FileChunk), [
+            {"file_id": file_id, "digest": digest, "size": size} for size, digest in chunks
+        ])
+
+
+def chunk_overlap(min_ratio: float = 0.5, limit: int = 100) -> dict:
+    """
+    Partial duplicates: TARGET files sharing chunks with any MASTER file, excluding exact
+    duplicates (the Reaper's job). Shared bytes are what chunk-level dedup, or keeping a
+    delta against the gold copy, would save.
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS temp.master_chunks")
+        conn.exec_driver_sql("CREATE TEMP TABLE master_chunks (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        conn.exec_driver_sql(
+            "INSERT OR IGNORE INTO master_chunks SELECT c.digest FROM filechunk c "
+            "JOIN filerecord f ON f.id = c.file_id WHERE f.tag = 'MASTER'"
+        )
+        rows = conn.exec_driver_sql(
+            "SELECT c.file_id, sum(c.size), sum(CASE WHEN mc.digest IS NULL THEN 0 ELSE c.size END) "
+            "FROM filechunk c JOIN filerecord f ON f.id = c.file_id AND f.tag = 'TARGET' "
+            "LEFT JOIN master_chunks mc ON mc.digest = c.digest "
+            "WHERE f.digest IS NULL OR NOT EXISTS ("
+            "  SELECT 1 FROM filerecord m WHERE m.digest = f.digest AND m.tag = 'MASTER') "
+            "GROUP BY c.file_id"
+        ).fetchall()
+        matches = sorted((r for r in rows if r[1] and r[2] / r[1] >= min_ratio), key=lambda r: r[2], reverse=True)
+
+        files = []
+        with Session(bind=conn) as session:
+            catalog = Catalog(session)
+            for file_id, total, shared in matches[:limit]:
+                # Closest gold copy: the MASTER file sharing the most bytes
+                keeper = conn.exec_driver_sql(
+                    "SELECT m.file_id FROM filechunk t "
+                    "JOIN filechunk m ON m.digest = t.digest "
+                    "JOIN filerecord mf ON mf.id = m.file_id AND mf.tag = 'MASTER' "
+                    "WHERE t.file_id = ? GROUP BY m.file_id ORDER BY sum(t.size) DESC LIMIT 1", (file_id,)
+                ).scalar()
+                files.append({
+                    "path": catalog.path_of(session.get(FileRecord, file_id)),
+                    "size": total, "shared_bytes": shared, "overlap": round(shared / total, 4),
+                    "keeper": catalog.path_of(session.get(FileRecord, keeper)) if keeper else None,
+                })
+        conn.exec_driver_sql("DROP TABLE temp.master_chunks")
+    return {
+        "chunked_files": len(rows),
+        "partial_duplicates": len(matches),
+        "estimated_savings_bytes": sum(r[2] for r in matches),
+        "min_ratio": min_ratio,
+        "files": files,
+    }
@@ -0,0 +1,167 @@
+import os
+import glob
+import time
+import threading
+from typing import Callable, Optional
+
+from app.core.metrics import Metrics
+
+THERMAL_PATH = os.getenv("SENTRY_THERMAL_PATH", "/sys/class/thermal")
+MAX_TEMP_C = float(os.getenv("SENTRY_MAX_TEMP_C", "75"))
+
+
+class WorkerPool:
+    """
+    A resizable set of daemon threads all running the same `work(keep_going)` loop.
+    Shrinking is cooperative: a worker whose slot is above the new size finishes
+    its current item, sees keep_going() turn False and exits.
+    """
+
+    def __init__(self, name: str, work: Callable, size: int, min_size: int = 1, max_size: int = 16):
+        self.name = name
+        self.work = work
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.size = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.resize(size)
+
+    def resize(self, size: int) -> int:
+        size = max(self.min_size, min(self.max_size, int(size)))
+        with self._lock:
+            if self._stopped.is_set():
+                return self.size
+            self.size = size
+            for slot in range(size):
+                t = self._threads.get(slot)
+                if t is None or not t.is_alive():
+                    t = threading.Thread(target=self._run, args=(slot,), name=f"{self.name}-{slot}", daemon=True)
+                    self._threads[slot] = t
+                    t.start()
+        return size
+
+    def _run(self, slot: int):
+        self.work(lambda: not self._stopped.is_set() and slot < self.size)
+
+    def alive(self) -> int:
+        return sum(1 for t in list(self._threads.values()) if t.is_alive())
+
+    def stop(self):
+        self._stopped.set()
+        for t in list(self._threads.values()):
+            t.join()
+
+
+def read_temperature(thermal_path: str = THERMAL_PATH) -> Optional[float]:
+    """Hottest thermal zone in °C, or None when the platform exposes no sensors."""
+    hottest = None
+    for zone in glob.glob(os.path.join(thermal_path, "thermal_zone*", "temp")):
+        try:
+            with open(zone) as f:
+                value = int(f.read().strip()) / 1000.0
+        except (OSError, ValueError):
+            continue
+        hottest = value if hottest is None else max(hottest, value)
+    return hottest
+
+
+class ConcurrencyController:
+    """
+    Adaptive worker sizing for the scanner pipeline.
+    Every `interval` seconds it samples throughput (bytes_read), CPU load and SoC
+    temperature, then hill-climbs the hashing pool towards the best sustained MB/s:
+    keep moving in the same direction while throughput improves, reverse when it drops.
+    Above `max_temp_c` it always sheds a hasher (a thermally throttled Pi 5 is slower
+    than one running fewer threads). Walkers are sized from the file backlog:
+    an empty backlog means hashers are starving, a full one means walkers can rest.
+    """
+
+    def __init__(self, hash_pool: WorkerPool, walk_pool: WorkerPool, metrics: Metrics,
+                 backlog: Callable[[], float] = lambda: 0.5, interval: float = 5.0,
+                 max_temp_c: float = MAX_TEMP_C, thermal_path: str = None, tolerance: float = 0.05):
+        self.hash_pool = hash_pool
+        self.walk_pool = walk_pool
+        self.metrics = metrics
+        self.backlog = backlog
+        self.interval = interval
+        self.max_temp_c = max_temp_c
+        self.thermal_path = thermal_path or THERMAL_PATH
+        self.tolerance = tolerance
+        self.direction = 1
+        self.history = []
+        self._last_bytes = metrics.counters.get("bytes_read", 0)
+        self._last_time = time.monotonic()
+        self._last_mbps = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sentry-concurrency", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.step()
+
+    def step(self) -> dict:
+        """Takes one sample and applies one sizing decision."""
+        now = time.monotonic()
+        total = self.metrics.counters.get("bytes_read", 0)
+        elapsed = max(now - self._last_time, 1e-6)
+        mbps = (total - self._last_bytes) / elapsed / (1024 * 1024)
+        self._last_bytes, self._last_time = total, now
+
+        temp = read_temperature(self.thermal_path)
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            load = None
+
+        hashers = self.hash_pool.size
+        step = 0
+        if temp is not None and temp >= self.max_temp_c:
+            reason, self.direction, step = "thermal", -1, -1
+        elif self._last_mbps is None:
+            reason, step = "probe", self.direction
+        elif mbps < self._last_mbps * (1 - self.tolerance):
+            reason = "regressed"
+            self.direction = -self.direction
+            step = self.direction
+        elif mbps > self._last_mbps * (1 + self.tolerance):
+            reason, step = "improved", self.direction
+        else:
+            reason = "plateau"
+
+        # Don't pile more hashers on a saturated CPU
+        if step > 0 and load is not None and load > 1.5:
+            reason, step = "cpu_saturated", 0
+        hashers = self.hash_pool.resize(hashers + step)
+        self._last_mbps = mbps
+
+        backlog = self.backlog()
+        walkers = self.walk_pool.size
+        if backlog < 0.1:
+            walkers = self.walk_pool.resize(walkers + 1)
+        elif backlog > 0.9:
+            walkers = self.walk_pool.resize(walkers - 1)
+
+        decision = {
+            "ts": time.time(), "mbps": round(mbps, 2), "temp_c": temp,
+            "load": round(load, 2) if load is not None else None,
+            "hash_workers": hashers, "walk_workers": walkers, "reason": reason,
+        }
+        self.history = self.history[-99:] + [decision]
+        m = self.metrics
+        m.set_gauge("hash_workers", hashers)
+        m.set_gauge("walk_workers", walkers)
+        m.set_gauge("throughput_mbps", decision["mbps"])
+        if temp is not None:
+            m.set_gauge("soc_temperature_c", temp)
+        return decision
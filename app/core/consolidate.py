@@ -0,0 +1,169 @@
+import os
+import fcntl
+import shutil
+from typing import Dict, List, Optional
+from sqlmodel import Session
+
+from app.database.catalog import Catalog
+from app.core.merkle import subtree_dirs
+from app.core.throttle import Throttle
+
+FICLONE = 0x40049409  # ioctl(dest_fd, FICLONE, src_fd): share all extents, copy-on-write
+REFLINK_FS = {"btrfs", "xfs", "bcachefs", "ocfs2"}
+NO_HARDLINK_FS = {"vfat", "msdos", "exfat", "fuseblk", "cifs", "smb3", "9p"}  # fuseblk: ntfs-3g/exfat-fuse
+STRATEGIES = ("reflink", "hardlink")
+TMP_SUFFIX = ".sentry-link"
+_CHUNK = 500
+
+
+def _mounts() -> List[tuple]:
+    """(mount point, fs type), longest mount point first."""
+    mounts = []
+    try:
+        with open("/proc/self/mountinfo") as f:
+            for line in f:
+                left, right = line.split(" - ", 1)
+                point = left.split()[4].replace("\\040", " ")
+                mounts.append((point, right.split()[0]))
+    except OSError:
+        pass
+    return sorted(mounts, key=lambda m: len(m[0]), reverse=True)
+
+
+class Filesystems:
+    """Caches, per directory, what decides which strategy is possible: device, mount and fs type."""
+
+    def __init__(self):
+        self._mounts = _mounts()
+        self._dirs: Dict[str, Optional[tuple]] = {}
+
+    def info(self, directory: str) -> Optional[tuple]:
+        if directory not in self._dirs:
+            try:
+                dev = os.stat(directory).st_dev
+            except OSError:
+                self._dirs[directory] = None
+                return None
+            real = os.path.realpath(directory)
+            point, fstype = next(((p, t) for p, t in self._mounts
+                                  if real == p or real.startswith(p.rstrip("/") + "/")), ("/", ""))
+            self._dirs[directory] = (dev, point, fstype)
+        return self._dirs[directory]
+
+    def strategies(self, path: str, keeper: str) -> List[str]:
+        a, b = self.info(os.path.dirname(path)), self.info(os.path.dirname(keeper))
+        if not a or not b:
+            return []
+        eligible = []
+        # FICLONE needs one filesystem (and, on older kernels, one mount); btrfs subvolumes differ in st_dev
+        if a[2] in REFLINK_FS and a[1:] == b[1:]:
+            eligible.append("reflink")
+        if a[0] == b[0] and a[2] not in NO_HARDLINK_FS:
+            eligible.append("hardlink")
+        return eligible
+
+
+def with_keepers(session: Session, catalog: Catalog, kill_list: List[dict], fs: Filesystems = None,
+                 keep_unmatched: bool = False) -> List[dict]:
+    """
+    Per-file consolidation plan: tree items are expanded into their files (tagged with
+    "tree_id") and every file gets a MASTER "keeper" (same size + digest, preferring one
+    on the same device), the strategies possible between the two, and both stored mtimes.
+    Files only covered by a fingerprint pack have no keeper on disk; they are left out
+    unless keep_unmatched, then with keeper None.
+    """
+    fs = fs or Filesystems()
+    conn = session.connection()
+    files = [item for item in kill_list if item.get("kind") != "tree"]
+    for tree in (item for item in kill_list if item.get("kind") == "tree"):
+        dirs = subtree_dirs(session, tree["dir_id"])
+        for i in range(0, len(dirs), _CHUNK):
+            chunk = dirs[i:i + _CHUNK]
+            for row_id, dir_id, filename, size in conn.exec_driver_sql(
+                f"SELECT id, dir_id, filename, size_bytes FROM filerecord WHERE dir_id IN ({','.join('?' * len(chunk))})",
+                tuple(chunk),
+            ):
+                files.append({"path": os.path.join(catalog.dir_path(dir_id), filename),
+                              "size": size, "id": row_id, "dir_id": dir_id, "tree_id": tree["dir_id"]})
+
+    mtimes: Dict[int, Optional[float]] = {}
+    keepers: Dict[int, List[tuple]] = {}
+    for i in range(0, len(files), _CHUNK):
+        chunk = [item["id"] for item in files[i:i + _CHUNK]]
+        for row_id, mtime, dir_id, filename, keeper_mtime in conn.exec_driver_sql(
+            "SELECT t.id, t.mtime, m.dir_id, m.filename, m.mtime FROM filerecord t "
+            "LEFT JOIN filerecord m ON m.digest = t.digest AND m.size_bytes = t.size_bytes AND m.tag = 'MASTER' "
+            f"WHERE t.id IN ({','.join('?' * len(chunk))})", tuple(chunk),
+        ):
+            mtimes[row_id] = mtime
+            if dir_id is not None:
+                keepers.setdefault(row_id, []).append((os.path.join(catalog.dir_path(dir_id), filename), keeper_mtime))
+
+    plan = []
+    for item in files:
+        best, best_mtime, best_strategies = None, None, []
+        for keeper, keeper_mtime in keepers.get(item["id"], ()):
+            eligible = fs.strategies(item["path"], keeper)
+            if best is None or len(eligible) > len(best_strategies):
+                best, best_mtime, best_strategies = keeper, keeper_mtime, eligible
+        if best is not None or keep_unmatched:
+            plan.append({**item, "mtime": mtimes.get(item["id"]), "keeper": best,
+                         "keeper_mtime": best_mtime, "strategies": best_strategies})
+    return plan
+
+
+def reclaim_report(plan: List[dict]) -> dict:
+    """Candidates and bytes each consolidation strategy could reclaim."""
+    report = {}
+    for strategy in STRATEGIES:
+        items = [item for item in plan if strategy in item["strategies"]]
+        report[strategy] = {"files": len(items), "bytes": sum(item["size"] for item in items)}
+    return report
+
+
+def same_content(a: str, b: str, throttle: Throttle, chunk: int = 1024 * 1024) -> bool:
+    """Byte-for-byte comparison, charged to each file's device budget."""
+    sa, sb = os.stat(a), os.stat(b)
+    if sa.st_size != sb.st_size:
+        return False
+    if (sa.st_dev, sa.st_ino) == (sb.st_dev, sb.st_ino):
+        return True
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            da, db = fa.read(chunk), fb.read(chunk)
+            throttle.read(sa.st_dev, len(da))
+            throttle.read(sb.st_dev, len(db))
+            if da != db:
+                return False
+            if not da:
+                return True
+
+
+def link(path: str, keeper: str, strategy: str):
+    """
+    Replaces `path` with a hardlink to, or a reflink of, `keeper`. The new file is built
+    next to the old one and renamed over it, so `path` never goes missing.
+    A reflink keeps the duplicate's own permissions and times; a hardlink *is* the keeper:
+    any in-place write through `path` afterwards modifies the MASTER copy too, which is why
+    the Reaper only hardlinks on an explicit link="hardlink".
+    """
+    tmp = path + TMP_SUFFIX
+    try:
+        if strategy == "hardlink":
+            os.link(keeper, tmp)
+        else:
+            st = os.stat(path)
+            with open(keeper, "rb") as src, open(tmp, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(path, tmp)
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
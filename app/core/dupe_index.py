@@ -0,0 +1,99 @@
+import numpy as np
+from sqlmodel import Session
+
+from app.database.models import engine
+
+TAG_CODES = {"MASTER": 1, "TARGET": 2}
+_MIX = np.uint64(0x9E3779B97F4A7C15)  # Golden-ratio multiplier to fold size into the key
+
+
+class DuplicateIndex:
+    """
+    In-memory analysis engine for the Reaper.
+    Holds four parallel arrays (25 bytes per hashed file: 64-bit hash prefix, size,
+    tag code, row id), so 20M files cost a predictable ~500 MB. MASTER coverage is
+    found with a vectorized sort + searchsorted; only prefix hits are confirmed
+    against the full 16-byte digest in SQLite.
+    """
+
+    def __init__(self, prefix, size, tag, row_id):
+        self.prefix = prefix
+        self.size = size
+        self.tag = tag
+        self.row_id = row_id
+
+    @classmethod
+    def load(cls, session: Session = None, batch: int = 500_000) -> "DuplicateIndex":
+        own = session is None
+        session = session or Session(engine)
+        try:
+            conn = session.connection()
+            total = conn.exec_driver_sql("SELECT COUNT(*) FROM filerecord WHERE digest IS NOT NULL").scalar()
+            prefix = np.empty(total, dtype=np.uint64)
+            size = np.empty(total, dtype=np.int64)
+            tag = np.empty(total, dtype=np.uint8)
+            row_id = np.empty(total, dtype=np.int64)
+
+            cursor = conn.exec_driver_sql(
+                "SELECT id, size_bytes, CASE tag WHEN 'MASTER' THEN 1 WHEN 'TARGET' THEN 2 ELSE 0 END, "
+                "substr(digest, 1, 8) FROM filerecord WHERE digest IS NOT NULL"
+            )
+            filled = 0
+            while filled < total:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                n = min(len(rows), total - filled)
+                ids, sizes, tags, prefixes = zip(*rows[:n])
+                sl = slice(filled, filled + n)
+                row_id[sl] = ids
+                size[sl] = sizes
+                tag[sl] = tags
+                prefix[sl] = np.frombuffer(b"".join(p.ljust(8, b"\0") for p in prefixes), dtype=">u8")
+                filled += n
+            cursor.close()
+        finally:
+            if own: session.close()
+        return cls(prefix[:filled], size[:filled], tag[:filled], row_id[:filled])
+
+    def __len__(self):
+        return len(self.row_id)
+
+    @property
+    def nbytes(self) -> int:
+        return self.prefix.nbytes + self.size.nbytes + self.tag.nbytes + self.row_id.nbytes
+
+    def _keys(self, mask):
+        with np.errstate(over="ignore"):
+            return self.prefix[mask] ^ (self.size[mask].astype(np.uint64) * _MIX)
+
+    def covered_targets(self) -> np.ndarray:
+        """Row ids of TARGET files whose (prefix, size) also appears on a MASTER file."""
+        master = self.tag == TAG_CODES["MASTER"]
+        target = self.tag == TAG_CODES["TARGET"]
+        master_keys = np.unique(self._keys(master))
+        if not len(master_keys):
+            return np.empty(0, dtype=np.int64)
+        target_keys = self._keys(target)
+        pos = np.searchsorted(master_keys, target_keys)
+        pos[pos == len(master_keys)] = 0
+        return self.row_id[target][master_keys[pos] == target_keys]
+
+
+def confirm_covered(session: Session, row_ids, batch: int = 500):
+    """
+    Confirms prefix hits against full digests (and sizes).
+    Yields (id, dir_id, filename, size_bytes) for TARGET rows with a real MASTER twin.
+    """
+    conn = session.connection()
+    ids = [int(i) for i in row_ids]
+    for start in range(0, len(ids), batch):
+        chunk = ids[start:start + batch]
+        marks = ",".join("?" * len(chunk))
+        yield from conn.exec_driver_sql(
+            f"SELECT t.id, t.dir_id, t.filename, t.size_bytes FROM filerecord t "
+            f"WHERE t.id IN ({marks}) AND EXISTS ("
+            f"  SELECT 1 FROM filerecord m WHERE m.digest = t.digest "
+            f"  AND m.size_bytes = t.size_bytes AND m.tag = 'MASTER')",
+            tuple(chunk),
+        ).fetchall()
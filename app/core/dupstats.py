@@ -0,0 +1,90 @@
+from typing import List, Optional
+from sqlmodel import Session
+
+from app.database.models import engine, SIZE_BUCKETS
+from app.database.catalog import Catalog
+
+# Readers of the trigger-maintained summary tables (models.HashGroup / models.DupStat):
+# every figure here is a lookup over a few hundred rows, never a regroup of filerecord.
+
+
+def _human(n: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n} {unit}"
+        n //= 1024
+    return f"{n} TiB"
+
+
+def bucket_label(bucket: int) -> str:
+    if bucket == 0:
+        return f"< {_human(SIZE_BUCKETS[0])}"
+    if bucket == len(SIZE_BUCKETS):
+        return f">= {_human(SIZE_BUCKETS[-1])}"
+    return f"{_human(SIZE_BUCKETS[bucket - 1])} - {_human(SIZE_BUCKETS[bucket])}"
+
+
+def file_count(session: Session) -> int:
+    return session.connection().exec_driver_sql("SELECT coalesce(sum(files), 0) FROM dupstat").scalar()
+
+
+def top_groups(session: Session, limit: Optional[int] = 20) -> List[tuple]:
+    """(digest, size, copies, masters) of the duplicate groups wasting the most bytes, biggest first."""
+    sql = ("SELECT digest, size_bytes, copies, masters FROM hashgroup WHERE copies > 1 "
+           "ORDER BY size_bytes * (copies - 1) DESC")  # Served by ix_hashgroup_wasted
+    if limit is None:
+        return session.connection().exec_driver_sql(sql).fetchall()
+    return session.connection().exec_driver_sql(sql + " LIMIT ?", (limit,)).fetchall()
+
+
+def _breakdown(conn, key: str, join: str = "", limit: int = None) -> list:
+    sql = (f"SELECT {key}, sum(s.files), sum(s.bytes), sum(s.dup_files), sum(s.dup_bytes) "
+           f"FROM dupstat s {join} GROUP BY 1 HAVING sum(s.files) > 0 ORDER BY sum(s.dup_bytes) DESC")
+    rows = conn.exec_driver_sql(sql + (f" LIMIT {int(limit)}" if limit else "")).fetchall()
+    return [{"key": k, "files": f, "bytes": b, "dup_files": df, "dup_bytes": db} for k, f, b, df, db in rows]
+
+
+def dup_stats(top: int = 20, paths: int = 5) -> dict:
+    """
+    Duplicate figures by drive, extension and size bucket, plus the `top` largest
+    duplicate groups with up to `paths` locations each.
+    """
+    with Session(engine) as session:
+        conn = session.connection()
+        files, size, dup_files, dup_bytes = conn.exec_driver_sql(
+            "SELECT coalesce(sum(files), 0), coalesce(sum(bytes), 0), coalesce(sum(dup_files), 0), "
+            "coalesce(sum(dup_bytes), 0) FROM dupstat"
+        ).fetchone()
+        groups, redundant, reclaimable = conn.exec_driver_sql(
+            "SELECT count(*), coalesce(sum(size_bytes * (copies - 1)), 0), "
+            "       coalesce(sum(CASE WHEN masters > 0 THEN size_bytes * (copies - masters) ELSE 0 END), 0) "
+            "FROM hashgroup WHERE copies > 1"
+        ).fetchone()
+        by_size = _breakdown(conn, "s.bucket")
+        for row in by_size:
+            row["key"] = bucket_label(row["key"])
+
+        catalog = Catalog(session)
+        largest = []
+        for digest, group_size, copies, masters in top_groups(session, top):
+            rows = conn.exec_driver_sql(
+                "SELECT dir_id, filename FROM filerecord WHERE digest = ? LIMIT ?", (digest, paths)
+            ).fetchall()
+            largest.append({
+                "hash": digest.hex(), "size": group_size, "copies": copies, "masters": masters,
+                "wasted_bytes": group_size * (copies - 1),
+                "paths": [catalog.path_of(r) for r in rows],
+            })
+        return {
+            "files": files,
+            "bytes": size,
+            "dup_files": dup_files,              # Files with at least one other copy
+            "dup_bytes": dup_bytes,
+            "dup_groups": groups,
+            "redundant_bytes": redundant,        # Everything but one copy per group
+            "reclaimable_bytes": reclaimable,    # Copies outside MASTER of content that is on MASTER
+            "by_drive": _breakdown(conn, "d.name", "JOIN drive d ON d.id = s.drive_id"),
+            "by_extension": _breakdown(conn, "e.name", "JOIN extension e ON e.id = s.ext_id", limit=50),
+            "by_size": by_size,
+            "largest_groups": largest,
+        }
@@ -0,0 +1,221 @@
+import os
+import math
+import time
+import random
+from typing import Dict, List, Optional
+from sqlmodel import Session
+
+from app.database.models import engine
+from app.database.catalog import to_digest
+from app.core.fingerprint_pack import make_keys
+
+SAMPLE_PER_DIR = 32  # Files stat'ed per listed folder (reservoir), however many it holds
+
+
+class _Dir:
+    """One listed folder: its subfolders, file count and a uniform sample of (path, size)."""
+    __slots__ = ("subdirs", "files", "sample", "sample_bytes")
+
+    def __init__(self, subdirs: List[str], files: int, sample: List[tuple]):
+        self.subdirs = subdirs
+        self.files = files
+        self.sample = sample
+        self.sample_bytes = sum(size for _, size in sample)
+
+
+class Estimator:
+    """
+    Estimates reclaimable bytes on TARGET roots without a full scan, or even a full
+    metadata walk: the cost is bounded by `max_entries` directory entries read and
+    `max_seconds`, whatever the size of the share.
+
+    1. Random descent (Knuth's estimator): each probe starts at a random target root
+       and goes down one uniformly chosen subfolder at a time until a leaf. A folder
+       reached through branching factors b1..bk stands for b1*...*bk folders like it,
+       so each probe is an unbiased estimate of the tree's totals. Listings are cached,
+       so later probes mostly retrace folders already read.
+    2. In each folder on the path, SAMPLE_PER_DIR files are stat'ed (reservoir over the
+       listing) and scale up its file bytes; one of them, drawn proportionally to size,
+       stands for the folder's reclaimable fraction. It is fingerprinted only if its
+       size exists on MASTER, then checked against the MASTER index / fingerprint packs.
+       Without either, gold roots are size-matched (basis="size", an upper bound).
+    3. Probes are independent, so the 95% CI comes from the spread of their estimates.
+    """
+
+    def __init__(self, scanner, packs=None, budget: int = 400, max_seconds: float = 120.0,
+                 max_entries: int = 200_000, probes: int = 2000, seed: int = None):
+        self.scanner = scanner  # reuses calculate_hash(): same throttle + metrics as a scan
+        self.packs = packs or []
+        self.budget = budget  # Files fingerprinted at most
+        self.max_seconds = max_seconds
+        self.max_entries = max_entries
+        self.probes = probes
+        self.rng = random.Random(seed)
+        self.metrics = scanner.metrics
+        self.throttle = scanner.throttle
+        self.entries = 0
+        self._dirs: Dict[str, Optional[_Dir]] = {}
+
+    def _list(self, directory: str) -> Optional[_Dir]:
+        """Cached listing like the scanner's walk: no dotfiles, symlinked dirs not followed."""
+        if directory in self._dirs:
+            return self._dirs[directory]
+        listing = None
+        try:
+            with self.metrics.timer("walk"), os.scandir(directory) as it:
+                subdirs, files, sample = [], 0, []
+                for entry in it:
+                    self.entries += 1
+                    if entry.name.startswith('.'): continue
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink(): subdirs.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    files += 1
+                    if len(sample) < SAMPLE_PER_DIR:
+                        sample.append(entry)
+                    else:
+                        j = self.rng.randrange(files)
+                        if j < SAMPLE_PER_DIR:
+                            sample[j] = entry
+            sized = []
+            for entry in sample:
+                self.throttle.file()
+                try:
+                    sized.append((entry.path, entry.stat().st_size))
+                except OSError:
+                    continue
+            listing = _Dir(subdirs, files, sized)
+            self.metrics.incr("estimate_dirs_listed")
+        except OSError:
+            pass
+        self._dirs[directory] = listing
+        return listing
+
+    def _master_sizes(self, session: Session, gold_paths: List[str]):
+        """(sizes, basis, complete): MASTER index sizes if any, else a walk of the gold roots within the budgets."""
+        sizes = {r[0] for r in session.connection().exec_driver_sql(
+            "SELECT DISTINCT size_bytes FROM filerecord WHERE tag = 'MASTER' AND digest IS NOT NULL"
+        )}
+        if sizes or self.packs:
+            return sizes, "digest", True
+        stack = list(gold_paths)
+        limit = self.entries + self.max_entries // 2  # Leaves half the entry budget to the targets
+        while stack:
+            if self.entries >= limit or time.monotonic() - self._started > self.max_seconds / 2:
+                return sizes, "size", False
+            directory = stack.pop()
+            try:
+                with self.metrics.timer("walk"), os.scandir(directory) as it:
+                    for entry in it:
+                        self.entries += 1
+                        if entry.name.startswith('.'): continue
+                        try:
+                            if entry.is_dir():
+                                if not entry.is_symlink(): stack.append(entry.path)
+                                continue
+                            self.throttle.file()
+                            sizes.add(entry.stat().st_size)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return sizes, "size", True
+
+    def _in_master(self, session: Session, size: int, digest: bytes) -> bool:
+        if session.connection().exec_driver_sql(
+            "SELECT 1 FROM filerecord WHERE digest = ? AND size_bytes = ? AND tag = 'MASTER' LIMIT 1",
+            (digest, size),
+        ).first():
+            return True
+        keys = make_keys([size], [digest])
+        return any(pack.contains(keys)[0] for pack in self.packs)
+
+    def _spent(self, hashed: int) -> bool:
+        return (hashed >= self.budget or self.entries >= self.max_entries
+                or time.monotonic() - self._started > self.max_seconds)
+
+    def estimate(self, target_paths: List[str], gold_paths: List[str] = ()) -> dict:
+        self._started = started = time.monotonic()
+        m = self.metrics
+        verdicts: Dict[str, bool] = {}  # Sampled file -> reclaimable, so retraced folders cost nothing
+        hashed = 0
+        probes = []  # (files, bytes, reclaimable) estimates, one per probe
+        roots = [os.path.normpath(p) for p in target_paths]
+
+        with Session(engine) as session:
+            master_sizes, basis, gold_complete = self._master_sizes(session, gold_paths)
+
+            def reclaimable(path: str, size: int) -> bool:
+                nonlocal hashed
+                if path not in verdicts:
+                    found = False
+                    if size in master_sizes or any(p.has_size(size) for p in self.packs):
+                        if basis == "size":
+                            found = True
+                        else:
+                            try:
+                                dev = os.stat(path).st_dev
+                            except OSError:
+                                dev = None
+                            digest = to_digest(self.scanner.calculate_hash(path, dev=dev))
+                            hashed += 1
+                            found = digest is not None and self._in_master(session, size, digest)
+                    verdicts[path] = found
+                    m.incr("estimate_samples")
+                return verdicts[path]
+
+            with m.timer("estimate_sample"):
+                while roots and len(probes) < self.probes and not (len(probes) >= 2 and self._spent(hashed)):
+                    directory, weight = self.rng.choice(roots), len(roots)
+                    files = size = wasted = 0.0
+                    while directory is not None:
+                        listing = self._list(directory)
+                        if listing is None:
+                            break
+                        if listing.sample_bytes:
+                            # Bytes scaled up from the stat'ed sample; one size-weighted file for the reclaimable share
+                            dir_bytes = listing.files * listing.sample_bytes / len(listing.sample)
+                            path, file_size = self.rng.choices(listing.sample, [s for _, s in listing.sample])[0]
+                            files += weight * listing.files
+                            size += weight * dir_bytes
+                            wasted += weight * dir_bytes * reclaimable(path, file_size)
+                        else:
+                            files += weight * listing.files
+                        if not listing.subdirs:
+                            break
+                        weight *= len(listing.subdirs)
+                        directory = self.rng.choice(listing.subdirs)
+                    probes.append((files, size, wasted))
+                    m.incr("estimate_probes")
+
+        n = len(probes)
+
+        def mean_ci(k: int):
+            values = [p[k] for p in probes]
+            mean = sum(values) / n if n else 0.0
+            sd = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else mean
+            half = 1.96 * sd / math.sqrt(n) if n else 0.0
+            return mean, [int(max(0.0, mean - half)), int(mean + half)]
+
+        total_files, _ = mean_ci(0)
+        total_bytes, bytes_ci = mean_ci(1)
+        estimate, ci = mean_ci(2)
+        return {
+            "basis": basis,
+            "gold_complete": gold_complete,  # False: gold roots only partly size-matched, no longer an upper bound
+            "files": int(total_files),
+            "bytes": int(total_bytes),
+            "ci95_total_bytes": bytes_ci,
+            "sampled": len(verdicts),
+            "hashed": hashed,
+            "reclaimable_bytes": int(estimate),
+            "ci95_bytes": [ci[0], min(ci[1], bytes_ci[1])],
+            "reclaimable_ratio": round(estimate / total_bytes, 4) if total_bytes else 0.0,
+            "probes": n,
+            "dirs_listed": sum(1 for d in self._dirs.values() if d is not None),
+            "entries_read": self.entries,
+            "elapsed_s": round(time.monotonic() - started, 2),
+        }
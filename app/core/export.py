@@ -0,0 +1,205 @@
+import io
+import os
+import csv
+import json
+import zlib
+from typing import Iterable, Iterator, Optional
+from sqlmodel import Session
+
+from app.database.models import engine
+from app.database.catalog import Catalog
+from app.core.merkle import matching_trees
+
+# Streaming exports of the kill list, duplicate groups and the whole index, as ~64 KiB
+# chunks of NDJSON or CSV (optionally gzip). Rows are read in keyset pages, so memory
+# stays flat for any row count (only the directory path cache grows, with the number of
+# folders) and no read lock is held on the database while a slow client downloads.
+FORMATS = ("ndjson", "csv")
+PAGE = 1000
+_FLUSH = 64 * 1024
+
+
+def _group_pages(conn, masters_only: bool = False):
+    """Duplicate groups, most wasted bytes first, one page at a time: [(group row, [file rows])]."""
+    last = None
+    while True:
+        sql = ("SELECT digest, size_bytes, copies, masters, size_bytes * (copies - 1) AS wasted FROM hashgroup "
+               "WHERE copies > 1" + (" AND masters > 0" if masters_only else ""))
+        params = ()
+        if last:
+            # The "<=" bound is what lets SQLite seek ix_hashgroup_wasted instead of scanning it
+            sql += " AND size_bytes * (copies - 1) <= ? AND (size_bytes * (copies - 1) < ? OR digest > ?)"
+            params = (last[4], last[4], last[0])
+        groups = conn.exec_driver_sql(sql + " ORDER BY wasted DESC, digest LIMIT ?", params + (PAGE,)).fetchall()
+        if not groups:
+            return
+        files = {}
+        for row in conn.exec_driver_sql(
+            "SELECT f.digest, f.dir_id, f.filename, f.tag, d.name FROM filerecord f "
+            f"JOIN drive d ON d.id = f.drive_id WHERE f.digest IN ({','.join('?' * len(groups))}) ORDER BY f.id",
+            tuple(g[0] for g in groups),
+        ):
+            files.setdefault(row[0], []).append(row)
+        yield [(g, files.get(g[0], [])) for g in groups]
+        last = groups[-1]
+
+
+def kill_list_rows(session: Session, keep_drive: Optional[str] = None, packs=None) -> Iterator[dict]:
+    """
+    What the Reaper would remove, biggest duplicate groups first: matched TARGET folders,
+    then TARGET files with a MASTER copy (the keeper), then files only covered by
+    fingerprint `packs`. With keep_drive, keepers are the files on that drive instead of
+    MASTER ones (the CLI dry run's rule), and folders are not matched.
+    """
+    catalog = Catalog(session)
+    conn = session.connection()
+    covered = set()
+    if keep_drive is None:
+        trees, covered = matching_trees(session)
+        for dir_id, size, files in trees:
+            yield {"kind": "tree", "path": catalog.dir_path(dir_id), "size": size, "files": files,
+                   "hash": None, "keeper": None}
+
+    def path(f):
+        return os.path.join(catalog.dir_path(f[1]), f[2])
+
+    for page in _group_pages(conn, masters_only=keep_drive is None):
+        for (digest, size, *_), files in page:
+            if keep_drive is None:
+                keepers = [f for f in files if f[3] == "MASTER"]
+                doomed = [f for f in files if f[3] == "TARGET" and f[1] not in covered]
+            else:
+                keepers = [f for f in files if f[4] == keep_drive]
+                doomed = [f for f in files if f[4] != keep_drive]
+            if not keepers:
+                continue
+            for f in doomed:
+                yield {"kind": "file", "path": path(f), "size": size, "files": 1,
+                       "hash": digest.hex(), "keeper": path(keepers[0])}
+
+    if packs and keep_drive is None:
+        from app.core.fingerprint_pack import covered_by_packs
+        for row_id, dir_id, filename, size in covered_by_packs(session, packs):
+            if dir_id in covered:
+                continue
+            digest, masters = conn.exec_driver_sql(
+                "SELECT f.digest, coalesce(g.masters, 0) FROM filerecord f "
+                "LEFT JOIN hashgroup g ON g.digest = f.digest WHERE f.id = ?", (row_id,)
+            ).fetchone()
+            if masters:
+                continue  # Listed above, with its keeper
+            yield {"kind": "file", "path": os.path.join(catalog.dir_path(dir_id), filename), "size": size,
+                   "files": 1, "hash": digest.hex(), "keeper": None}
+
+
+def duplicate_groups(session: Session) -> Iterator[dict]:
+    """Every content stored more than once, most wasted bytes first, with all its copies."""
+    catalog = Catalog(session)
+    for page in _group_pages(session.connection()):
+        for (digest, size, copies, masters, wasted), files in page:
+            yield {"hash": digest.hex(), "size": size, "copies": copies, "masters": masters, "wasted_bytes": wasted,
+                   "files": [{"path": os.path.join(catalog.dir_path(dir_id), filename), "tag": tag, "drive": drive}
+                             for _, dir_id, filename, tag, drive in files]}
+
+
+def index_rows(session: Session) -> Iterator[dict]:
+    """The whole index, in id order."""
+    catalog = Catalog(session)
+    conn = session.connection()
+    last = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT f.id, f.dir_id, f.filename, d.name, f.tag, f.size_bytes, f.mtime, f.digest, f.visual_hash "
+            "FROM filerecord f JOIN drive d ON d.id = f.drive_id WHERE f.id > ? ORDER BY f.id LIMIT ?",
+            (last, PAGE * 5),
+        ).fetchall()
+        if not rows:
+            return
+        for row_id, dir_id, filename, drive, tag, size, mtime, digest, visual in rows:
+            yield {"id": row_id, "path": os.path.join(catalog.dir_path(dir_id), filename), "drive": drive,
+                   "tag": tag, "size": size, "mtime": mtime, "hash": digest.hex() if digest else None,
+                   "visual_hash": visual}
+        last = rows[-1][0]
+
+
+# name -> (row generator, CSV columns). Rows with a "files" list become one CSV line per file.
+EXPORTS = {
+    "kill-list": (kill_list_rows, ["kind", "path", "size", "files", "hash", "keeper"]),
+    "groups": (duplicate_groups, ["hash", "size", "copies", "masters", "wasted_bytes", "path", "tag", "drive"]),
+    "index": (index_rows, ["id", "path", "drive", "tag", "size", "mtime", "hash", "visual_hash"]),
+}
+
+
+def _ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    buf = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, separators=(",", ":")) + "\n"
+        buf.append(line)
+        size += len(line)
+        if size >= _FLUSH:
+            yield "".join(buf).encode("utf-8")
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def _csv(rows: Iterable[dict], columns) -> Iterator[bytes]:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        if "files" in row and isinstance(row["files"], list):
+            for f in row["files"]:
+                writer.writerow({**row, **f})
+        else:
+            writer.writerow(row)
+        if out.tell() >= _FLUSH:
+            yield out.getvalue().encode("utf-8")
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue().encode("utf-8")
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def _counted(rows: Iterable[dict], stats: dict) -> Iterator[dict]:
+    for row in rows:
+        stats["rows"] += 1
+        stats["bytes"] += row.get("size") or 0
+        yield row
+
+
+def export_stream(kind: str, fmt: str = "ndjson", compress: bool = False, stats: dict = None, **kwargs) -> Iterator[bytes]:
+    """
+    Encoded chunks of export `kind` (see EXPORTS); the Session lives as long as the generator.
+    `stats`, if given, is filled with the row count and summed "size" as rows go out.
+    """
+    make_rows, columns = EXPORTS[kind]
+    with Session(engine) as session:
+        rows = make_rows(session, **kwargs)
+        if stats is not None:
+            stats.update(rows=0, bytes=0)
+            rows = _counted(rows, stats)
+        chunks = _csv(rows, columns) if fmt == "csv" else _ndjson(rows)
+        yield from (_gzip(chunks) if compress else chunks)
+
+
+def export_filename(kind: str, fmt: str = "ndjson", compress: bool = False) -> str:
+    return f"sentry-{kind}.{fmt}" + (".gz" if compress else "")
+
+
+def write_export(kind: str, path: str, fmt: str = "ndjson", compress: bool = False, **kwargs) -> dict:
+    """CLI side: streams the export to a file; returns the row count and summed size."""
+    stats = {}
+    with open(path, "wb") as f:
+        for chunk in export_stream(kind, fmt, compress, stats=stats, **kwargs):
+            f.write(chunk)
+    return stats
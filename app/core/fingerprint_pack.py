@@ -0,0 +1,178 @@
+import os
+import struct
+import time
+import numpy as np
+from sqlmodel import Session
+
+from app.database.models import engine
+
+PACKS_DIR = os.getenv("SENTRY_PACKS_DIR", "/data/packs")
+
+MAGIC = b"SNTYFPK1"
+# magic, version, flags, count, bloom_bits, bloom_k, created
+HEADER = struct.Struct("<8sIIQQI4xd")
+HEADER_SIZE = 64
+FLAG_BLOOM = 1
+KEY = np.dtype("S24")  # big-endian u64 size + 16-byte MD5 -> byte order == (size, digest) order
+
+
+def make_keys(sizes, digests) -> np.ndarray:
+    """Packs (size, digest) pairs into sortable 24-byte keys."""
+    raw = b"".join(int(s).to_bytes(8, "big") + d for s, d in zip(sizes, digests))
+    return np.frombuffer(raw, dtype=KEY)
+
+
+class FingerprintPack:
+    """
+    A portable, read-only Gold Master fingerprint set.
+
+    File layout (little-endian header, 64 bytes):
+        magic "SNTYFPK1" | version | flags | count | bloom_bits | bloom_k | created
+        [bloom filter bit array, bloom_bits/8 bytes]   (if FLAG_BLOOM)
+        count x 24-byte keys sorted ascending          (size BE u64 + MD5)
+
+    The key array is memory-mapped, so a multi-TB master with millions of files
+    is queried with binary search straight from the page cache — nothing is
+    loaded into SQLite and the gold drive itself does not need to be present.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, flags, count, bloom_bits, bloom_k, created = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Sentry fingerprint pack")
+        self.version = version
+        self.count = count
+        self.created = created
+        offset = HEADER_SIZE
+        self.bloom = None
+        self.bloom_bits = bloom_bits
+        self.bloom_k = bloom_k
+        if flags & FLAG_BLOOM and bloom_bits:
+            self.bloom = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(bloom_bits // 8,))
+            offset += bloom_bits // 8
+        self.keys = np.memmap(path, dtype=KEY, mode="r", offset=offset, shape=(count,)) if count else np.empty(0, KEY)
+
+    # --- Build ---
+    @staticmethod
+    def export(path: str, tag: str = "MASTER", bloom: bool = True, bits_per_key: int = 10,
+               batch: int = 100_000) -> dict:
+        """
+        Writes every distinct (size, digest) with the given tag to a new pack file.
+        Rows are streamed `batch` at a time into one preallocated key array (24 bytes
+        per file), so the export never holds the whole result set as Python objects.
+        """
+        with Session(engine) as session:
+            conn = session.connection()
+            total = conn.exec_driver_sql(
+                "SELECT COUNT(*) FROM filerecord WHERE tag = ? AND digest IS NOT NULL", (tag,)
+            ).scalar()
+            keys = np.empty(total, dtype=KEY)
+            cursor = conn.exec_driver_sql(
+                "SELECT size_bytes, digest FROM filerecord WHERE tag = ? AND digest IS NOT NULL", (tag,)
+            )
+            filled = 0
+            while filled < total:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                n = min(len(rows), total - filled)
+                keys[filled:filled + n] = make_keys(*zip(*rows[:n]))
+                filled += n
+            cursor.close()
+        keys = np.unique(keys[:filled])
+
+        count = len(keys)
+        bloom_bits, bloom_k, bloom_arr = 0, 0, None
+        if bloom and count:
+            bloom_bits = max(64, ((count * bits_per_key + 63) // 64) * 64)
+            bloom_k = max(1, round(bits_per_key * 0.693))
+            bloom_arr = np.zeros(bloom_bits // 8, dtype=np.uint8)
+            for pos in _bloom_positions(keys, bloom_bits, bloom_k):
+                np.bitwise_or.at(bloom_arr, pos >> 3, (1 << (pos & 7)).astype(np.uint8))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            header = HEADER.pack(MAGIC, 1, FLAG_BLOOM if bloom_arr is not None else 0,
+                                 count, bloom_bits, bloom_k, time.time())
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            if bloom_arr is not None:
+                f.write(bloom_arr.tobytes())
+            f.write(keys.tobytes())
+        os.replace(tmp, path)
+        return {"path": path, "count": count, "bytes": os.path.getsize(path), "bloom": bloom_arr is not None}
+
+    # --- Query ---
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Vectorized membership test for an array of 24-byte keys."""
+        keys = np.asarray(keys, dtype=KEY)
+        hits = np.zeros(len(keys), dtype=bool)
+        if not self.count or not len(keys):
+            return hits
+        candidates = np.arange(len(keys))
+        if self.bloom is not None:
+            maybe = np.ones(len(keys), dtype=bool)
+            for pos in _bloom_positions(keys, self.bloom_bits, self.bloom_k):
+                bit = (self.bloom[pos >> 3] >> (pos & 7).astype(np.uint8)) & 1
+                maybe &= bit.astype(bool)
+            candidates = candidates[maybe]
+        if len(candidates):
+            probe = keys[candidates]
+            idx = np.searchsorted(self.keys, probe)
+            idx[idx == self.count] = 0
+            hits[candidates] = self.keys[idx] == probe
+        return hits
+
+    def has_size(self, size: int) -> bool:
+        """True when any packed file has exactly this size (keys are sorted by size first)."""
+        if not self.count:
+            return False
+        prefix = int(size).to_bytes(8, "big")
+        idx = np.searchsorted(self.keys, np.array([prefix + b"\0" * 16], dtype=KEY))[0]
+        return idx < self.count and bytes(self.keys[idx])[:8] == prefix
+
+    def info(self) -> dict:
+        return {"path": self.path, "count": self.count, "created": self.created,
+                "bloom": self.bloom is not None, "bytes": os.path.getsize(self.path)}
+
+
+def _bloom_positions(keys: np.ndarray, bits: int, k: int):
+    # Double hashing on the (already uniform) MD5 bytes: h1 + i*h2 mod m
+    raw = np.frombuffer(keys.tobytes(), dtype=np.uint8).reshape(-1, 24)
+    h1 = raw[:, 8:16].copy().view("<u8").ravel()
+    h2 = raw[:, 16:24].copy().view("<u8").ravel() | np.uint64(1)
+    m = np.uint64(bits)
+    with np.errstate(over="ignore"):
+        for i in range(k):
+            yield ((h1 + np.uint64(i) * h2) % m).astype(np.int64)
+
+
+def pack_path(name: str) -> str:
+    """Resolves a pack name (as used by the API) inside PACKS_DIR."""
+    name = os.path.basename(name)
+    if not name.endswith(".fpk"):
+        name += ".fpk"
+    return os.path.join(PACKS_DIR, name)
+
+
+def covered_by_packs(session: Session, packs, batch: int = 100_000):
+    """
+    Yields (id, dir_id, filename, size_bytes) for TARGET rows whose fingerprint
+    appears in any of the given packs.
+    """
+    cursor = session.connection().exec_driver_sql(
+        "SELECT id, dir_id, filename, size_bytes, digest FROM filerecord "
+        "WHERE tag = 'TARGET' AND digest IS NOT NULL"
+    )
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            break
+        keys = make_keys([r[3] for r in rows], [r[4] for r in rows])
+        hit = np.zeros(len(rows), dtype=bool)
+        for pack in packs:
+            hit |= pack.contains(keys)
+        for i in np.flatnonzero(hit):
+            yield rows[i][:4]
@@ -0,0 +1,216 @@
+import os
+import heapq
+import shutil
+import struct
+import time
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app.database.models import engine, FileRecord
+from app.database.catalog import Catalog, to_digest
+from app.core.metrics import Metrics
+from app.core.fingerprint_pack import make_keys
+
+SPOOL_DIR = os.getenv("SENTRY_SPOOL_DIR", "/data/spool")
+RUN_RECORDS = int(os.getenv("SENTRY_INGEST_RUN_RECORDS", "250000"))  # ~9 MB sort buffer
+FAN_IN = 64
+
+# size BE u64 | MD5 | tag | drive idx | path offset | path length
+# The first 24 bytes are the sort key, so raw byte order == (size, digest) order.
+RECORD = struct.Struct(">Q16sBHQH")
+KEY_LEN = 24
+TAGS = ("MASTER", "TARGET")
+
+
+class IngestSpool:
+    """
+    Fast-ingest sink for the Scanner.
+    Fingerprints are appended as fixed-width binary records; paths go to a separate
+    heap file. Every RUN_RECORDS records the buffer is sorted and spilled as a run.
+    groups() k-way merges the runs (heapq.merge, at most FAN_IN files at a time),
+    so memory stays flat no matter how many files were scanned, and load() inserts
+    only the duplicate groups into FileRecord, plus the TARGET files whose only copy
+    is already on MASTER (indexed earlier, or in the mission's fingerprint packs).
+    """
+
+    def __init__(self, mission_id: int, spool_dir: str = None, run_records: int = RUN_RECORDS,
+                 metrics: Metrics = None):
+        self.mission_id = mission_id
+        self.dir = os.path.join(spool_dir or SPOOL_DIR, f"mission_{mission_id}")
+        os.makedirs(self.dir, exist_ok=True)
+        self.run_records = run_records
+        self.metrics = metrics or Metrics()
+        self.drives = []
+        self.runs = []
+        self.count = 0
+        self._buf = bytearray()
+        self._buffered = 0
+        self._heap = open(os.path.join(self.dir, "paths.heap"), "wb")
+        self._heap_pos = 0
+
+    def append(self, path: str, size: int, file_hash: str, tag: str, drive: str):
+        digest = to_digest(file_hash)
+        if digest is None:
+            return
+        if drive not in self.drives:
+            self.drives.append(drive)
+        raw = path.encode("utf-8", "surrogateescape")
+        self._heap.write(raw)
+        self._buf += RECORD.pack(size, digest, TAGS.index(tag), self.drives.index(drive),
+                                 self._heap_pos, len(raw))
+        self._heap_pos += len(raw)
+        self._buffered += 1
+        self.count += 1
+        if self._buffered >= self.run_records:
+            self._spill()
+
+    def _spill(self):
+        if not self._buffered:
+            return
+        with self.metrics.timer("spool_sort"):
+            raw = np.frombuffer(bytes(self._buf), dtype=np.uint8).reshape(-1, RECORD.size)
+            keys = raw[:, :KEY_LEN].copy().view(f"S{KEY_LEN}").ravel()
+            ordered = raw[np.argsort(keys, kind="stable")]
+        path = os.path.join(self.dir, f"run_{len(self.runs):05d}.bin")
+        with open(path, "wb") as f:
+            f.write(ordered.tobytes())
+        self.runs.append(path)
+        self.metrics.incr("spool_runs")
+        self._buf = bytearray()
+        self._buffered = 0
+
+    # --- Merge ---
+    @staticmethod
+    def _read_run(path: str, chunk: int = 4096):
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(RECORD.size * chunk)
+                if not block:
+                    return
+                for i in range(0, len(block), RECORD.size):
+                    yield block[i:i + RECORD.size]
+
+    def _merge_to(self, runs, path):
+        with open(path, "wb") as f:
+            for rec in heapq.merge(*(self._read_run(r) for r in runs)):
+                f.write(rec)
+        for r in runs:
+            os.remove(r)
+
+    def _merged(self):
+        """Cascades merges until at most FAN_IN runs remain, then streams the final merge."""
+        self._spill()
+        self._heap.flush()
+        runs, level = list(self.runs), 0
+        with self.metrics.timer("spool_merge"):
+            while len(runs) > FAN_IN:
+                merged = []
+                for i in range(0, len(runs), FAN_IN):
+                    out = os.path.join(self.dir, f"merge_{level}_{i // FAN_IN:05d}.bin")
+                    self._merge_to(runs[i:i + FAN_IN], out)
+                    merged.append(out)
+                runs, level = merged, level + 1
+        self.runs = runs
+        return heapq.merge(*(self._read_run(r) for r in runs))
+
+    def groups(self, singles: bool = False):
+        """
+        Yields lists of unpacked records sharing (size, digest) — duplicates only, or
+        also lone TARGET records when `singles` (their copy may be outside the spool).
+        """
+        def wanted(group):
+            return len(group) > 1 or singles and group and group[0][KEY_LEN] == TAGS.index("TARGET")
+
+        group, key = [], None
+        for rec in self._merged():
+            if rec[:KEY_LEN] != key:
+                if wanted(group):
+                    yield [RECORD.unpack(r) for r in group]
+                group, key = [], rec[:KEY_LEN]
+            group.append(rec)
+        if wanted(group):
+            yield [RECORD.unpack(r) for r in group]
+
+    @staticmethod
+    def _on_master(session: Session, singles: list, packs) -> list:
+        """The lone TARGET records whose (size, digest) is on MASTER in the index or a pack."""
+        if not singles:
+            return []
+        found = set()
+        conn = session.connection()
+        for i in range(0, len(singles), 500):
+            chunk = singles[i:i + 500]
+            found.update(conn.exec_driver_sql(
+                "SELECT size_bytes, digest FROM filerecord WHERE tag = 'MASTER' AND digest IN "
+                f"({', '.join('?' * len(chunk))})", tuple(r[1] for r in chunk),
+            ))
+        hits = np.array([(r[0], r[1]) in found for r in singles], dtype=bool)
+        if packs:
+            keys = make_keys([r[0] for r in singles], [r[1] for r in singles])
+            for pack in packs:
+                hits |= pack.contains(keys)
+        return [r for r, hit in zip(singles, hits) if hit]
+
+    # --- Load ---
+    def load(self, batch: int = 1000, packs=()) -> dict:
+        """
+        Inserts every duplicate group into FileRecord (bulk insert, no per-row ORM), and
+        every lone TARGET file with a copy on MASTER: in the index already or in `packs`.
+        """
+        m = self.metrics
+        groups = covered = rows_loaded = 0
+        with m.timer("spool_load"), Session(engine) as session, \
+                open(os.path.join(self.dir, "paths.heap"), "rb") as heap:
+            catalog = Catalog(session)
+            drive_ids = [catalog.drive_id(d) for d in self.drives]
+            rows, singles = [], []
+
+            def add(records):
+                for size, digest, tag, drive, offset, length in records:
+                    heap.seek(offset)
+                    path = heap.read(length).decode("utf-8", "surrogateescape")
+                    fname = os.path.basename(path)
+                    rows.append({
+                        "mission_id": self.mission_id, "drive_id": drive_ids[drive],
+                        "dir_id": catalog.dir_id(os.path.dirname(path)), "filename": fname,
+                        "ext_id": catalog.ext_id(os.path.splitext(fname)[1].lower()),
+                        "size_bytes": size, "created_at": time.time(), "digest": digest,
+                        "tag": TAGS[tag],
+                    })
+
+            def add_covered():
+                nonlocal covered
+                found = self._on_master(session, singles, packs)
+                covered += len(found)
+                add(found)
+                singles.clear()
+
+            for group in self.groups(singles=True):
+                if len(group) == 1:
+                    singles.append(group[0])
+                    if len(singles) >= batch:
+                        add_covered()
+                else:
+                    groups += 1
+                    add(group)
+                if len(rows) >= batch:
+                    session.execute(insert(FileRecord), rows)
+                    rows_loaded += len(rows)
+                    rows = []
+            add_covered()
+            if rows:
+                session.execute(insert(FileRecord), rows)
+                rows_loaded += len(rows)
+            session.commit()
+        m.incr("duplicate_groups", groups)
+        m.incr("files_covered", covered)
+        m.incr("files_loaded", rows_loaded)
+        return {"spooled": self.count, "runs": len(self.runs), "groups": groups, "covered": covered,
+                "loaded": rows_loaded}
+
+    def close(self):
+        """Removes the run files and path heap."""
+        if not self._heap.closed:
+            self._heap.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
@@ -1,4 +1,7 @@
 import os
+from app.core.metrics import Metrics, REGISTRY
+from app.core.throttle import Throttle
+from app.core.quarantine import QUARANTINE_DIR
 
 class Janitor:
     """
@@ -6,23 +9,34 @@ class Janitor:
     Responsible for cleaning up empty directory structures 
     left behind after the Reaper deletes files.
     """
+
+    def __init__(self, metrics: Metrics = None, throttle: Throttle = None):
+        self.metrics = metrics or Metrics(parent=REGISTRY)
+        self.throttle = throttle or Throttle()
     
     def cleanup_ghosts(self, target_paths):
         removed_count = 0
+        m = self.metrics
         print(f"[Janitor] Starting ghost bust on: {target_paths}")
         
-        for root_path in target_paths:
-            if not os.path.exists(root_path):
-                continue
-                
-            # Walk BOTTOM-UP (topdown=False)
-            # This deletes nested empty folders (A/B/C -> deletes C, then B, then A)
-            for dirpath, dirnames, filenames in os.walk(root_path, topdown=False):
-                try:
-                    if not os.listdir(dirpath):
-                        os.rmdir(dirpath)
-                        removed_count += 1
-                except Exception as e:
-                    print(f"[Janitor] Failed to remove {dirpath}: {e}")
+        with self.throttle.priority():
+            for root_path in target_paths:
+                if not os.path.exists(root_path):
+                    continue
+                    
+                # Walk BOTTOM-UP (topdown=False)
+                # This deletes nested empty folders (A/B/C -> deletes C, then B, then A)
+                for dirpath, dirnames, filenames in m.timed_iter(os.walk(root_path, topdown=False), "walk"):
+                    if QUARANTINE_DIR in dirpath.split(os.sep):
+                        continue  # The purger owns it
+                    try:
+                        if not os.listdir(dirpath):
+                            self.throttle.file()
+                            with m.timer("rmdir"):
+                                os.rmdir(dirpath)
+                            removed_count += 1
+                            m.incr("ghost_dirs_removed")
+                    except Exception as e:
+                        print(f"[Janitor] Failed to remove {dirpath}: {e}")
                     
         return removed_count
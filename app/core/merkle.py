@@ -0,0 +1,146 @@
+import os
+import hashlib
+from typing import Dict, List, Optional
+from sqlmodel import Session
+
+_CHUNK = 500
+
+
+def subtree_dirs(session: Session, root_dir_id: int) -> List[int]:
+    """Directory ids under (and including) root_dir_id, parents before children."""
+    conn = session.connection()
+    order, frontier = [root_dir_id], [root_dir_id]
+    while frontier:
+        nxt = []
+        for i in range(0, len(frontier), _CHUNK):
+            chunk = frontier[i:i + _CHUNK]
+            nxt += [r[0] for r in conn.exec_driver_sql(
+                f"SELECT id FROM directory WHERE parent_id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+            )]
+        order += nxt
+        frontier = nxt
+    return order
+
+
+def compute_tree_digests(session: Session, root_dir_id: int, tag: str) -> int:
+    """
+    Bottom-up Merkle digests for every directory under a scanned root.
+    A directory's digest covers its children's names plus their fingerprints
+    (size + MD5 for files, tree digest for subdirectories), never its own name,
+    so "Backup of Photos 2019" matches "Photos 2019". A subtree containing a file
+    that could not be hashed gets no digest and can never match.
+    Caller commits.
+    """
+    conn = session.connection()
+    dirs = subtree_dirs(session, root_dir_id)
+    children: Dict[int, list] = {}
+    for i in range(0, len(dirs), _CHUNK):
+        chunk = dirs[i:i + _CHUNK]
+        for dir_id, parent_id, name in conn.exec_driver_sql(
+            f"SELECT id, parent_id, name FROM directory WHERE id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+        ):
+            if dir_id != root_dir_id:
+                children.setdefault(parent_id, []).append((dir_id, name))
+
+    trees: Dict[int, tuple] = {}  # dir_id -> (digest | None, bytes, files)
+    updates = []
+    for dir_id in reversed(dirs):
+        entries, total, count, hashable = [], 0, 0, True
+        for name, size, digest in conn.exec_driver_sql(
+            "SELECT DISTINCT filename, size_bytes, digest FROM filerecord WHERE dir_id = ?", (dir_id,)
+        ):
+            if digest is None:
+                hashable = False
+                continue
+            entries.append((name, b"F" + int(size).to_bytes(8, "big") + digest))
+            total, count = total + size, count + 1
+        for child_id, name in children.get(dir_id, ()):
+            digest, size, files = trees.pop(child_id)
+            if digest is None:
+                hashable = False
+                continue
+            entries.append((name, b"D" + digest))
+            total, count = total + size, count + files
+
+        tree_digest = None
+        if hashable:
+            h = hashlib.md5()
+            for name, fingerprint in sorted(entries):
+                h.update(name.encode("utf-8", "surrogateescape") + b"\0" + fingerprint)
+            tree_digest = h.digest()
+        trees[dir_id] = (tree_digest, total, count)
+        updates.append((tree_digest, total, count, tag, dir_id))
+
+    conn.exec_driver_sql(
+        "UPDATE directory SET tree_digest = ?, tree_bytes = ?, tree_files = ?, tree_tag = ? WHERE id = ?",
+        updates,
+    )
+    return len(updates)
+
+
+def matching_trees(session: Session):
+    """
+    Maximal TARGET subtrees whose Merkle digest also exists on a MASTER directory.
+    Returns (trees, covered): trees are (dir_id, tree_bytes, tree_files) rows,
+    covered is every directory id inside them (equal digests imply equal children).
+    Scan roots themselves are never returned: their matching children are.
+    """
+    rows = session.connection().exec_driver_sql(
+        "SELECT t.id, t.parent_id, t.tree_bytes, t.tree_files, "
+        "       coalesce(p.tree_tag, '') = 'TARGET' "
+        "FROM directory t LEFT JOIN directory p ON p.id = t.parent_id "
+        "WHERE t.tree_tag = 'TARGET' AND t.tree_files > 0 AND EXISTS ("
+        "  SELECT 1 FROM directory m WHERE m.tree_digest = t.tree_digest AND m.tree_tag = 'MASTER')"
+    ).fetchall()
+    covered = {r[0] for r in rows if r[4]}
+    trees = [(r[0], r[2], r[3]) for r in rows if r[4] and r[1] not in covered]
+    return trees, covered
+
+
+def verify_tree(session: Session, catalog, dir_id: int) -> Optional[str]:
+    """
+    Checks the directory on disk still holds exactly what was indexed (names and sizes),
+    including entries the scanner never records (dotfiles, ignored or empty folders).
+    Returns None when safe to remove as a whole, otherwise the reason.
+    """
+    conn = session.connection()
+    for sub_id in subtree_dirs(session, dir_id):
+        path = catalog.dir_path(sub_id)
+        files = dict(conn.exec_driver_sql(
+            "SELECT filename, size_bytes FROM filerecord WHERE dir_id = ?", (sub_id,)
+        ).fetchall())
+        subdirs = {r[0] for r in conn.exec_driver_sql(
+            "SELECT name FROM directory WHERE parent_id = ?", (sub_id,)
+        )}
+        try:
+            entries = list(os.scandir(path))
+        except OSError as e:
+            return f"{path}: {e}"
+        for entry in entries:
+            if entry.is_symlink():
+                return f"{entry.path}: symlink"
+            if entry.is_dir():
+                if entry.name not in subdirs:
+                    return f"{entry.path}: not indexed"
+            elif entry.name not in files:
+                return f"{entry.path}: not indexed"
+            elif entry.stat().st_size != files[entry.name]:
+                return f"{entry.path}: size changed"
+        if len(entries) != len(files) + len(subdirs):
+            return f"{path}: indexed entries missing"
+    return None
+
+
+def invalidate(session: Session, dir_ids, ancestor_of: int = None):
+    """Drops tree digests that no longer describe the disk (removed subtree + its ancestors)."""
+    conn = session.connection()
+    ids = list(dir_ids)
+    parent = ancestor_of
+    while parent is not None:
+        ids.append(parent)
+        parent = conn.exec_driver_sql("SELECT parent_id FROM directory WHERE id = ?", (parent,)).scalar()
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i + _CHUNK]
+        conn.exec_driver_sql(
+            f"UPDATE directory SET tree_digest = NULL WHERE id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+        )
@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Lightweight hot-path instrumentation.
+    Counters ("bytes_read") and stage timers ("walk", "hash_cpu", "db_commit") are
+    cheap enough to leave on in production. A per-mission instance forwards every
+    observation to its parent (the process-wide REGISTRY) so /metrics sees the totals.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}  # stage -> [count, total_seconds, max_seconds]
+
+    def incr(self, name: str, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.parent:
+            self.parent.incr(name, value)
+
+    def set_gauge(self, name: str, value):
+        with self._lock:
+            self.gauges[name] = value
+        if self.parent:
+            self.parent.set_gauge(name, value)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            t = self.timers.get(stage)
+            if t is None:
+                self.timers[stage] = [1, seconds, seconds]
+            else:
+                t[0] += 1
+                t[1] += seconds
+                if seconds > t[2]: t[2] = seconds
+        if self.parent:
+            self.parent.observe(stage, seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def cpu_timer(self, stage: str):
+        """Like timer(), but measures CPU time of the calling thread (not wall time)."""
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.thread_time() - start)
+
+    def timed_iter(self, iterable, stage: str):
+        """Wraps a generator (e.g. os.walk) so the time spent producing each item is recorded."""
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.observe(stage, time.perf_counter() - start)
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timers": {
+                    stage: {"count": c, "total_s": round(total, 6), "max_s": round(mx, 6)}
+                    for stage, (c, total, mx) in self.timers.items()
+                },
+            }
+
+
+# Process-wide totals (scraped by /metrics)
+REGISTRY = Metrics()
+
+
+def render_prometheus(metrics: Metrics = REGISTRY) -> str:
+    """Renders a Metrics instance in the Prometheus text exposition format."""
+    snap = metrics.snapshot()
+    lines = []
+    for name, value in sorted(snap["counters"].items()):
+        metric = f"sentry_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    for name, value in sorted(snap["gauges"].items()):
+        lines.append(f"# TYPE sentry_{name} gauge")
+        lines.append(f"sentry_{name} {value}")
+
+    if snap["timers"]:
+        lines.append("# HELP sentry_stage_seconds Time spent per pipeline stage.")
+        lines.append("# TYPE sentry_stage_seconds summary")
+        for stage, t in sorted(snap["timers"].items()):
+            lines.append(f'sentry_stage_seconds_sum{{stage="{stage}"}} {t["total_s"]}')
+            lines.append(f'sentry_stage_seconds_count{{stage="{stage}"}} {t["count"]}')
+        lines.append("# TYPE sentry_stage_seconds_max gauge")
+        for stage, t in sorted(snap["timers"].items()):
+            lines.append(f'sentry_stage_seconds_max{{stage="{stage}"}} {t["max_s"]}')
+    return "\n".join(lines) + "\n"
+
+
+def save_mission_metrics(session, mission, section: str, metrics: Metrics):
+    """
+    Stores a metrics snapshot on ScanMission.metrics_json under `section`
+    ("scanner", "reaper", "janitor") so each mission keeps its own breakdown.
+    Caller owns the commit.
+    """
+    data = json.loads(mission.metrics_json) if mission.metrics_json else {}
+    data[section] = metrics.snapshot()
+    mission.metrics_json = json.dumps(data)
+    session.add(mission)
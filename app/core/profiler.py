@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from app.core.reporter import REPORTS_DIR
+
+# kind ("scan" / "reaper") -> {"threads": {ident, ...}, "mission_id", "started"}
+# Registering a job is a set/dict write; nothing else runs until a profile is started.
+JOBS = {}
+_jobs_lock = threading.Lock()
+
+
+@contextmanager
+def track_job(kind: str, mission_id=None):
+    """
+    Marks the calling thread as part of the running `kind` job so the profiler can find it.
+    Worker threads of the same job (scanner pools) join the existing entry.
+    """
+    ident = threading.get_ident()
+    with _jobs_lock:
+        entry = JOBS.get(kind)
+        owner = entry is None
+        if owner:
+            entry = JOBS[kind] = {"threads": set(), "mission_id": mission_id, "started": time.time()}
+        added = ident not in entry["threads"]
+        entry["threads"].add(ident)
+    try:
+        yield
+    finally:
+        with _jobs_lock:
+            if added: entry["threads"].discard(ident)
+            if owner: JOBS.pop(kind, None)
+
+
+class ProfileSession:
+    """
+    On-demand sampling profiler.
+    A daemon thread reads the target job's Python stack every `interval` seconds
+    and folds it into collapsed-stack lines ("a;b;c 42") ready for flamegraph.pl
+    or speedscope. Optionally records a tracemalloc snapshot alongside.
+    """
+
+    def __init__(self, job: str, interval: float = 0.01, trace_malloc: bool = False,
+                 max_duration: float = 300.0, export_dir: str = None):
+        self.job = job
+        self.interval = interval
+        self.trace_malloc = trace_malloc
+        self.max_duration = max_duration
+        self.export_dir = export_dir or REPORTS_DIR
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.reports = None
+        self._stop = threading.Event()
+        self._finish_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        self._thread = threading.Thread(target=self._run, name="sentry-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self._finish()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        deadline = self.started + self.max_duration
+        while not self._stop.wait(self.interval):
+            if time.time() > deadline:
+                break
+            job = JOBS.get(self.job)
+            if not job:
+                continue
+            frames = sys._current_frames()
+            for ident in list(job["threads"]):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                self.stacks[self._fold(frame)] += 1
+                self.samples += 1
+        self._finish()
+
+    @staticmethod
+    def _fold(frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _finish(self) -> dict:
+        with self._finish_lock:
+            if self.reports is not None:
+                return self.reports
+
+            os.makedirs(self.export_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started))
+            reports = {"samples": self.samples, "duration_s": round(time.time() - self.started, 2)}
+
+            collapsed = f"profile_{self.job}_{stamp}.collapsed.txt"
+            with open(os.path.join(self.export_dir, collapsed), "w", encoding="utf-8") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            reports["collapsed"] = collapsed
+
+            if self.trace_malloc and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                allocations = f"profile_{self.job}_{stamp}.allocations.txt"
+                with open(os.path.join(self.export_dir, allocations), "w", encoding="utf-8") as f:
+                    f.write(f"TOP ALLOCATIONS ({self.job}, {stamp})\n")
+                    f.write("=" * 60 + "\n")
+                    for stat in snapshot.statistics("lineno")[:50]:
+                        f.write(f"{stat.size / 1024:10.1f} KiB  {stat.count:8d} blocks  {stat.traceback}\n")
+                reports["allocations"] = allocations
+
+            self.reports = reports
+            return reports
+
+
+# Only one capture at a time; the API drives these.
+_active = None
+
+
+def start_profile(job: str, **kwargs) -> ProfileSession:
+    global _active
+    if _active and _active.running:
+        raise RuntimeError("A profile capture is already running")
+    _active = ProfileSession(job, **kwargs)
+    _active.start()
+    return _active
+
+
+def stop_profile() -> dict:
+    if not _active:
+        raise RuntimeError("No profile capture has been started")
+    return _active.stop()
+
+
+def profile_status() -> dict:
+    if not _active:
+        return {"running": False, "jobs": sorted(JOBS)}
+    return {
+        "running": _active.running, "job": _active.job, "samples": _active.samples,
+        "jobs": sorted(JOBS), "reports": _active.reports,
+    }
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import threading
+from itertools import groupby
+from typing import List, Optional
+from sqlmodel import Session, select, func
+
+from app.database.models import engine, FileRecord, ReaperJournal
+from app.database.catalog import Catalog, to_digest
+from app.core.metrics import Metrics, REGISTRY
+from app.core.throttle import Throttle, get_throttle
+from app.core.merkle import compute_tree_digests
+from app.core.usage import UsageDelta
+
+QUARANTINE_DIR = ".sentry_quarantine"  # Dot-prefixed: never scanned, never a Merkle entry
+HOLD_S = float(os.getenv("SENTRY_QUARANTINE_HOLD_S", 7 * 86400))  # Undo window before the purger deletes
+PURGE_INTERVAL_S = float(os.getenv("SENTRY_PURGE_INTERVAL_S", 600))
+TRUNCATE_STEP = 256 * 1024 * 1024
+
+
+def quarantine_root(path: str) -> str:
+    """
+    <mount>/.sentry_quarantine for the filesystem holding `path`, so the move is a rename.
+    If the mount point itself isn't writable, the highest writable directory on the same device.
+    """
+    path = os.path.abspath(path)
+    dev = os.lstat(path).st_dev
+    chain = []
+    current = os.path.dirname(path)
+    while True:
+        chain.append(current)
+        parent = os.path.dirname(current)
+        if parent == current or os.stat(parent).st_dev != dev:
+            break
+        current = parent
+    for directory in reversed(chain):
+        if os.access(directory, os.W_OK):
+            return os.path.join(directory, QUARANTINE_DIR)
+    raise PermissionError(f"No writable directory on the device of {path}")
+
+
+def move_to_quarantine(path: str, mission_id: int) -> str:
+    """Renames path into the quarantine of its filesystem, keeping its relative layout. Returns the new path."""
+    root = quarantine_root(path)
+    stored = os.path.join(root, str(mission_id), os.path.relpath(os.path.abspath(path), os.path.dirname(root)))
+    candidate, n = stored, 0
+    while os.path.lexists(candidate):  # Same path quarantined twice in one mission
+        n += 1
+        candidate = f"{stored}~{n}"
+    os.makedirs(os.path.dirname(candidate), exist_ok=True)
+    os.rename(path, candidate)
+    return candidate
+
+
+def tree_manifest(session: Session, catalog: Catalog, root: str, dir_ids: List[int]) -> str:
+    """Index rows of a quarantined folder, so undo can put them back without re-hashing."""
+    rows = []
+    for i in range(0, len(dir_ids), 500):
+        for rec in session.exec(select(FileRecord).where(FileRecord.dir_id.in_(dir_ids[i:i + 500]))):
+            rows.append([os.path.relpath(catalog.path_of(rec), root), rec.size_bytes,
+                         rec.file_hash, rec.mtime, rec.visual_hash])
+    return json.dumps(rows)
+
+
+# --- Undo ---
+
+def restore(mission_id: Optional[int] = None, ids: Optional[List[int]] = None) -> dict:
+    """
+    Renames quarantined entries back and re-adds their index rows, with their folders'
+    usage. Entries whose original path has been re-used since are left in quarantine.
+    """
+    restored = conflicts = errors = 0
+    with Session(engine) as session:
+        query = select(ReaperJournal).where(ReaperJournal.status == "QUARANTINED")
+        if mission_id is not None:
+            query = query.where(ReaperJournal.mission_id == mission_id)
+        if ids:
+            query = query.where(ReaperJournal.id.in_(ids))
+        catalog = Catalog(session)
+        usage = UsageDelta()
+        for entry in session.exec(query).all():
+            if os.path.lexists(entry.original_path):
+                conflicts += 1
+                continue
+            try:
+                os.makedirs(os.path.dirname(entry.original_path), exist_ok=True)
+                os.rename(entry.stored_path, entry.original_path)
+            except OSError as e:
+                print(f"[Quarantine] Cannot restore {entry.original_path}: {e}")
+                errors += 1
+                continue
+            _prune_empty(os.path.dirname(entry.stored_path))
+            _reindex(session, catalog, entry, usage)
+            usage.apply(session)
+            entry.status = "RESTORED"
+            entry.finished_at = time.time()
+            session.add(entry)
+            session.commit()
+            restored += 1
+    return {"restored": restored, "conflicts": conflicts, "errors": errors}
+
+
+def _reindex(session: Session, catalog: Catalog, entry: ReaperJournal, usage: UsageDelta):
+    def add(path, size, file_hash, mtime, visual_hash):
+        fname = os.path.basename(path)
+        rec = FileRecord(
+            mission_id=entry.mission_id, drive_id=entry.drive_id,
+            dir_id=catalog.dir_id(os.path.dirname(path)), filename=fname,
+            ext_id=catalog.ext_id(os.path.splitext(fname)[1].lower()),
+            size_bytes=size, mtime=mtime, created_at=time.time(),
+            digest=to_digest(file_hash), visual_hash=visual_hash, tag="TARGET",
+        )
+        session.add(rec)
+        usage.add(rec)
+
+    if entry.manifest_json is None:
+        add(entry.original_path, entry.size_bytes, entry.digest.hex() if entry.digest else None,
+            os.stat(entry.original_path).st_mtime, None)
+        return
+    for rel, size, file_hash, mtime, visual_hash in json.loads(entry.manifest_json):
+        add(os.path.join(entry.original_path, rel), size, file_hash, mtime, visual_hash)
+    session.flush()
+    compute_tree_digests(session, catalog.dir_id(entry.original_path), "TARGET")
+
+
+# --- Deferred purge ---
+
+def purge(older_than: float = HOLD_S, mission_id: Optional[int] = None, metrics: Metrics = None) -> dict:
+    """
+    Deletes quarantined entries older than `older_than` seconds, under each mission's throttle.
+    Each entry is committed as PURGED on its own, so an interrupted purge just picks up again.
+    """
+    m = metrics or Metrics(parent=REGISTRY)
+    cutoff = time.time() - older_than
+    purged = freed = 0
+    with Session(engine) as session:
+        query = select(ReaperJournal).where(ReaperJournal.status == "QUARANTINED",
+                                            ReaperJournal.created_at <= cutoff)
+        if mission_id is not None:
+            query = query.where(ReaperJournal.mission_id == mission_id)
+        entries = session.exec(query.order_by(ReaperJournal.mission_id, ReaperJournal.id)).all()
+        for owner, group in groupby(entries, key=lambda e: e.mission_id):
+            throttle = get_throttle(owner)
+            with throttle.priority():
+                for entry in group:
+                    try:
+                        with m.timer("purge"):
+                            _purge_path(entry.stored_path, throttle)
+                    except OSError as e:
+                        print(f"[Quarantine] Purge failed for {entry.stored_path}: {e}")
+                        m.incr("purge_errors")
+                        continue
+                    _prune_empty(os.path.dirname(entry.stored_path))
+                    entry.status = "PURGED"
+                    entry.finished_at = time.time()
+                    session.add(entry)
+                    session.commit()
+                    purged += 1
+                    freed += entry.size_bytes
+                    m.incr("quarantine_purged", entry.files)
+                    m.incr("quarantine_bytes_freed", entry.size_bytes)
+    return {"purged": purged, "bytes_freed": freed}
+
+
+def _purge_file(path: str, throttle: Throttle):
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if st.st_size > TRUNCATE_STEP and not os.path.islink(path):
+        # Freeing a huge file's extents is real I/O on USB/SMB: shrink it in steps
+        # paced by the device budget instead of one long unlink.
+        with open(path, "r+b") as f:
+            size = st.st_size
+            while size > TRUNCATE_STEP:
+                size -= TRUNCATE_STEP
+                throttle.read(st.st_dev, TRUNCATE_STEP)
+                os.ftruncate(f.fileno(), size)
+    throttle.file()
+    os.remove(path)
+
+
+def _purge_path(path: str, throttle: Throttle):
+    if not os.path.isdir(path) or os.path.islink(path):
+        _purge_file(path, throttle)
+        return
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            _purge_file(os.path.join(dirpath, name), throttle)
+        for name in dirnames:
+            sub = os.path.join(dirpath, name)
+            if os.path.islink(sub):
+                _purge_file(sub, throttle)
+            else:
+                throttle.file()
+                os.rmdir(sub)
+    throttle.file()
+    os.rmdir(path)
+
+
+def _prune_empty(directory: str):
+    """Removes now-empty parents up to and including the .sentry_quarantine folder."""
+    while QUARANTINE_DIR in directory.split(os.sep):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        if os.path.basename(directory) == QUARANTINE_DIR:
+            return
+        directory = os.path.dirname(directory)
+
+
+def summary() -> List[dict]:
+    with Session(engine) as session:
+        rows = session.exec(
+            select(ReaperJournal.mission_id, ReaperJournal.status,
+                   func.count(ReaperJournal.id), func.sum(ReaperJournal.files),
+                   func.sum(ReaperJournal.size_bytes), func.min(ReaperJournal.created_at))
+            .where(ReaperJournal.action == "QUARANTINE")
+            .group_by(ReaperJournal.mission_id, ReaperJournal.status)
+        ).all()
+    return [{
+        "mission_id": mission_id, "status": status, "entries": entries,
+        "files": files, "bytes": size, "oldest": oldest,
+        "purge_after": oldest + HOLD_S if status == "QUARANTINED" else None,
+    } for mission_id, status, entries, files, size, oldest in rows]
+
+
+class Purger:
+    """Background thread purging expired quarantine entries every PURGE_INTERVAL_S."""
+
+    def __init__(self, interval: float = PURGE_INTERVAL_S, hold: float = HOLD_S):
+        self.interval = interval
+        self.hold = hold
+        self.metrics = Metrics(parent=REGISTRY)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sentry-purger", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                purge(self.hold, metrics=self.metrics)
+            except Exception as e:
+                print(f"[Quarantine] Purger error: {e}")
+
+
+PURGER = Purger()
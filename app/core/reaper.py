@@ -1,64 +1,379 @@
 import os
+import time
+import errno
+import shutil
+from sqlalchemy import case
 from sqlmodel import Session, select, func
-from app.database.models import FileRecord, engine
+from app.database.models import Directory, FileRecord, ReaperJournal, engine
+from app.database.catalog import Catalog
+from app.core.metrics import Metrics, REGISTRY
+from app.core.profiler import track_job
+from app.core.throttle import Throttle
+from app.core.merkle import matching_trees, subtree_dirs, verify_tree, invalidate
+from app.core.quarantine import move_to_quarantine, tree_manifest
+from app.core.consolidate import Filesystems, with_keepers, reclaim_report, same_content, link
+from app.core.verifier import Verifier
+from app.core.usage import UsageDelta
+
+# "sql" (GROUP BY in SQLite) or "numpy" (in-memory DuplicateIndex, for very large indexes)
+ANALYSIS_METHOD = os.getenv("SENTRY_ANALYSIS", "sql")
+# Deletes commit their journal rows and index deletes every COMMIT_EVERY files or COMMIT_S
+# seconds, so the SQLite write lock is never held for a whole clean. Quarantine commits
+# after every rename: a crash must not leave a file aside without its journal entry.
+COMMIT_EVERY = 100
+COMMIT_S = 1.0
+REFLINK_UNSUPPORTED = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY}
 
 class Reaper:
-    def __init__(self):
-        # No init params needed anymore; logic is Tag-based
-        pass
+    def __init__(self, metrics: Metrics = None, throttle: Throttle = None, packs=None,
+                 mission_id: int = None, mode: str = "delete", link: str = "auto", verify: bool = True):
+        # Logic is Tag-based; `packs` adds portable Gold Master fingerprints (FingerprintPack)
+        self.metrics = metrics or Metrics(parent=REGISTRY)
+        self.throttle = throttle or Throttle()
+        self.packs = packs or []
+        self.mission_id = mission_id  # Owner of the journal entries
+        self.mode = mode  # "delete", or "quarantine": rename aside now, purge later (app/core/quarantine.py)
+        # mode="consolidate": duplicates stay in place as copies of a MASTER keeper. "auto" and
+        # "reflink" only make copy-on-write reflinks and skip files where that is impossible;
+        # "hardlink" must be asked for: the target path then shares the MASTER's inode, and an
+        # in-place write through it changes the protected copy
+        self.link = link
+        self.verify = verify  # Sampled re-check of candidate vs keeper before deleting (app/core/verifier.py)
+        self.verification = None
+        self.planned = None  # Files the clean will act on, known once analysis is done (progress)
+        self.usage = UsageDelta()  # Folder usage of removed rows, applied before each commit
 
-    def analyze_duplicates(self):
+    def analyze_duplicates(self, method: str = None):
         """
         New Logic:
         1. Find duplicate hashes.
         2. Check if at least ONE copy exists in a 'MASTER' (Protected) path.
         3. If yes, mark all copies in 'TARGET' (Clean) paths for death.
+        Steps 1+2 are a single GROUP BY over the 16-byte digest index,
+        or a vectorized join in memory with method="numpy".
+        Whole TARGET folders whose Merkle digest matches a MASTER folder come
+        first as single "tree" items; their files are not listed again.
         """
+        trees, covered = self._analyze_trees()
+        if (method or ANALYSIS_METHOD) == "numpy":
+            files = self._analyze_numpy()
+        else:
+            files = self._analyze_sql()
+        if self.packs:
+            files += self._analyze_packs({item["id"] for item in files})
+        return trees + [item for item in files if item["dir_id"] not in covered]
+
+    def _analyze_trees(self):
+        with track_job("reaper"), Session(engine) as session:
+            with self.metrics.timer("reaper_tree_query"):
+                trees, covered = matching_trees(session)
+            catalog = Catalog(session)
+            return [{
+                "kind": "tree",
+                "path": catalog.dir_path(dir_id),
+                "size": size,
+                "files": files,
+                "dir_id": dir_id,
+            } for dir_id, size, files in trees], covered
+
+    def _analyze_sql(self):
         kill_list = []
-        with Session(engine) as session:
-            # Get hashes with duplicates
+        m = self.metrics
+        with track_job("reaper"), Session(engine) as session:
+            covered = (
+                select(FileRecord.digest)
+                .where(FileRecord.digest.is_not(None))
+                .group_by(FileRecord.digest)
+                .having(func.sum(case((FileRecord.tag == "MASTER", 1), else_=0)) > 0)
+                .having(func.sum(case((FileRecord.tag == "TARGET", 1), else_=0)) > 0)
+                .subquery()
+            )
             statement = (
-                select(FileRecord.file_hash)
-                .group_by(FileRecord.file_hash)
-                .having(func.count(FileRecord.id) > 1)
+                select(FileRecord)
+                .join(covered, FileRecord.digest == covered.c.digest)
+                .where(FileRecord.tag == "TARGET")
             )
             
-            duplicate_hashes = session.exec(statement).all()
-            
-            for f_hash in duplicate_hashes:
-                files = session.exec(select(FileRecord).where(FileRecord.file_hash == f_hash)).all()
-                
-                # The Critical Check
-                has_protected_copy = any(f.tag == "MASTER" for f in files)
-                candidates = [f for f in files if f.tag == "TARGET"]
-                
-                # Only delete TARGET files if a MASTER copy exists
-                if has_protected_copy and candidates:
-                    for c in candidates:
-                        kill_list.append({
-                            "path": c.path,
-                            "size": c.size_bytes,
-                            "id": c.id
-                        })
+            with m.timer("reaper_query"):
+                candidates = session.exec(statement).all()
+
+            catalog = Catalog(session)
+            for c in candidates:
+                kill_list.append({
+                    "path": catalog.path_of(c),
+                    "size": c.size_bytes,
+                    "id": c.id,
+                    "dir_id": c.dir_id
+                })
         return kill_list
 
+    def _analyze_numpy(self):
+        from app.core.dupe_index import DuplicateIndex, confirm_covered
+
+        kill_list = []
+        m = self.metrics
+        with track_job("reaper"), Session(engine) as session:
+            with m.timer("reaper_load"):
+                index = DuplicateIndex.load(session)
+            m.set_gauge("reaper_index_bytes", index.nbytes)
+            with m.timer("reaper_join"):
+                hits = index.covered_targets()
+            del index
+
+            catalog = Catalog(session)
+            with m.timer("reaper_query"):
+                for row_id, dir_id, filename, size in confirm_covered(session, hits):
+                    kill_list.append({
+                        "path": os.path.join(catalog.dir_path(dir_id), filename),
+                        "size": size,
+                        "id": row_id,
+                        "dir_id": dir_id
+                    })
+        return kill_list
+
+    def _analyze_packs(self, seen):
+        from app.core.fingerprint_pack import covered_by_packs
+
+        kill_list = []
+        with track_job("reaper"), Session(engine) as session:
+            catalog = Catalog(session)
+            with self.metrics.timer("reaper_pack_query"):
+                for row_id, dir_id, filename, size in covered_by_packs(session, self.packs):
+                    if row_id in seen: continue
+                    kill_list.append({
+                        "path": os.path.join(catalog.dir_path(dir_id), filename),
+                        "size": size,
+                        "id": row_id,
+                        "dir_id": dir_id
+                    })
+        return kill_list
+
+    def consolidation_plan(self, kill_list):
+        """Per-file keepers and eligible link strategies (see app/core/consolidate.py)."""
+        with track_job("reaper"), Session(engine) as session:
+            with self.metrics.timer("reaper_keeper_query"):
+                return with_keepers(session, Catalog(session), kill_list, Filesystems())
+
+    def reclaim_report(self, kill_list):
+        """Files/bytes each strategy would reclaim; delete and quarantine cover every candidate."""
+        report = {"delete": {"files": sum(item.get("files", 1) for item in kill_list),
+                             "bytes": sum(item["size"] for item in kill_list)}}
+        report.update(reclaim_report(self.consolidation_plan(kill_list)))
+        return report
+
     def execute_cleanup(self):
-        kill_list = self.analyze_duplicates()
+        with track_job("reaper"), self.throttle.priority():
+            kill_list = self.analyze_duplicates()
+            if self.mode == "consolidate":
+                # Links are only made after a full compare, no sampling stage needed
+                plan = self.consolidation_plan(kill_list)
+                self.planned = len(plan)
+                return self._execute_links(kill_list, plan)
+            if self.verify:
+                kill_list = self._verified(kill_list)
+            self.planned = sum(item.get("files", 1) for item in kill_list)
+            return {**self._execute(kill_list), "verification": self.verification}
+
+    def _verified(self, kill_list):
+        """
+        Drops items whose files changed since the scan or no longer match their keeper.
+        A folder with a failed file is not removed as a whole: its verified files are.
+        """
+        with track_job("reaper"), Session(engine) as session:
+            with self.metrics.timer("reaper_keeper_query"):
+                plan = with_keepers(session, Catalog(session), kill_list, Filesystems(), keep_unmatched=True)
+        passed, failed, self.verification = Verifier(self.throttle, self.metrics).verify(plan)
+        for item in failed[:20]:
+            print(f"[Reaper] Not deleting {item['path']}: {item['reason']}.")
+        bad_files = {item["id"] for item in failed}
+        bad_trees = {item["tree_id"] for item in failed if "tree_id" in item}
+        verified = [item for item in kill_list
+                    if (item["dir_id"] not in bad_trees if item.get("kind") == "tree" else item["id"] not in bad_files)]
+        # Files of rejected folders that did verify go file by file
+        verified += [{k: item[k] for k in ("path", "size", "id", "dir_id")}
+                     for item in passed if item.get("tree_id") in bad_trees]
+        return verified
+
+    def _journal(self, session, path: str, rec, stored: str = None, tree: dict = None, manifest: str = None,
+                 strategy: str = None, keeper: str = None):
+        """Records one action on disk; `rec` is the file's row (any row of the folder for trees)."""
+        if strategy:
+            action, status = strategy.upper(), "LINKED"
+        elif stored is None:
+            action, status = "DELETE", "DELETED"
+        else:
+            action, status = "QUARANTINE", "QUARANTINED"
+        session.add(ReaperJournal(
+            mission_id=self.mission_id if self.mission_id is not None else rec.mission_id,
+            action=action, status=status,
+            original_path=path, stored_path=stored, keeper_path=keeper, drive_id=rec.drive_id,
+            digest=None if tree else rec.digest,
+            size_bytes=tree["size"] if tree else rec.size_bytes,
+            files=tree["files"] if tree else 1,
+            manifest_json=manifest, created_at=time.time(),
+        ))
+
+    def _execute(self, kill_list):
         deleted = 0
         errors = 0
+        trees = 0
+        m = self.metrics
+        quarantine = self.mode == "quarantine"
         
-        with Session(engine) as session:
-            for item in kill_list:
+        # No autoflush: writes reach SQLite at commit time only, never across throttle sleeps
+        with Session(engine, autoflush=False) as session:
+            catalog = Catalog(session)
+            queue = list(kill_list)
+            pending, last_commit = 0, time.monotonic()
+            for item in queue:  # Trees that changed on disk append their files
+                if pending >= COMMIT_EVERY or (pending and time.monotonic() - last_commit >= COMMIT_S):
+                    self._commit(session)
+                    pending, last_commit = 0, time.monotonic()
                 try:
+                    if item.get("kind") == "tree":
+                        fallback = self._execute_tree(session, catalog, item)
+                        if fallback is None:
+                            trees += 1
+                            deleted += item["files"]
+                        else:
+                            queue.extend(fallback)
+                        pending = COMMIT_EVERY  # Bulk DELETEs: release the write lock now
+                        continue
+
+                    rec = session.get(FileRecord, item['id'])
                     if os.path.exists(item['path']):
-                        os.remove(item['path'])
-                    
+                        with m.timer("throttle_wait"):
+                            self.throttle.file()
+                        stored = None
+                        if quarantine:
+                            with m.timer("quarantine_rename"):
+                                stored = move_to_quarantine(item['path'], self.mission_id)
+                            m.incr("bytes_quarantined", item['size'])
+                        else:
+                            with m.timer("unlink"):
+                                os.remove(item['path'])
+                            m.incr("bytes_deleted", item['size'])
+                        if rec: self._journal(session, item['path'], rec, stored)
+
                     # Remove from DB
-                    rec = session.get(FileRecord, item['id'])
-                    if rec: session.delete(rec)
+                    if rec:
+                        self.usage.remove(rec)
+                        session.delete(rec)
                     deleted += 1
+                    pending += COMMIT_EVERY if quarantine else 1
+                    m.incr("files_deleted")
                 except Exception:
                     errors += 1
+                    pending += 1
+                    m.incr("delete_errors")
+            self._commit(session)
+
+        return {"deleted": deleted, "errors": errors, "trees": trees}
+
+    def _commit(self, session):
+        """Journal rows, index deletes and folder usage of the items so far, in one transaction."""
+        self.usage.apply(session)
+        with self.metrics.timer("db_commit"):
             session.commit()
-            
-        return {"deleted": deleted, "errors": errors}
+
+    def _execute_links(self, kill_list, plan):
+        """
+        Consolidation executor: each duplicate is compared byte for byte with its keeper,
+        then replaced by a reflink/hardlink to it. Its index row goes, like a deleted file's.
+        """
+        linked = errors = 0
+        m = self.metrics
+        with Session(engine) as session:
+            for tree in (item for item in kill_list if item.get("kind") == "tree"):
+                # Whole-folder matches are consolidated file by file; the folders stay
+                invalidate(session, subtree_dirs(session, tree["dir_id"]),
+                           ancestor_of=session.get(Directory, tree["dir_id"]).parent_id)
+            for n, item in enumerate(plan, 1):
+                strategy = "hardlink" if self.link == "hardlink" else "reflink"  # Never a silent hardlink
+                if strategy not in item["strategies"]:
+                    m.incr("link_ineligible")
+                    continue
+                try:
+                    with m.timer("throttle_wait"):
+                        self.throttle.file(2)
+                    with m.timer("link_verify"):
+                        if not same_content(item["path"], item["keeper"], self.throttle):
+                            print(f"[Reaper] {item['path']} differs from {item['keeper']}; left alone.")
+                            m.incr("link_mismatch")
+                            errors += 1
+                            continue
+                    rec = session.get(FileRecord, item["id"])
+                    if not os.path.samefile(item["path"], item["keeper"]):
+                        try:
+                            with m.timer(strategy):
+                                link(item["path"], item["keeper"], strategy)
+                        except OSError as e:
+                            if strategy == "reflink" and e.errno in REFLINK_UNSUPPORTED:
+                                m.incr("link_ineligible")  # e.g. XFS without reflink=1: left as it is
+                                continue
+                            raise
+                        if rec: self._journal(session, item["path"], rec, strategy=strategy, keeper=item["keeper"])
+                        m.incr(f"files_{strategy}ed")
+                        m.incr("bytes_linked", item["size"])
+                    if rec:
+                        self.usage.remove(rec)
+                        session.delete(rec)
+                    linked += 1
+                except Exception as e:
+                    print(f"[Reaper] Cannot consolidate {item['path']}: {e}")
+                    errors += 1
+                    m.incr("link_errors")
+                if n % 500 == 0:
+                    self._commit(session)
+            self._commit(session)
+        return {"deleted": 0, "linked": linked, "errors": errors, "trees": 0}
+
+    def _execute_tree(self, session, catalog: Catalog, item):
+        """
+        Removes (or quarantines) a matched folder as a whole. If the folder no longer holds exactly
+        what was indexed, returns per-file kill items instead (files whose size changed
+        are left alone).
+        """
+        m = self.metrics
+        dirs = subtree_dirs(session, item["dir_id"])
+        problem = verify_tree(session, catalog, item["dir_id"])
+        parent_id = session.get(Directory, item["dir_id"]).parent_id
+        if problem:
+            invalidate(session, dirs, ancestor_of=parent_id)  # These digests no longer describe the disk
+            m.incr("trees_skipped")
+            print(f"[Reaper] {item['path']} changed since the scan ({problem}); deleting file by file.")
+            fallback = []
+            for i in range(0, len(dirs), 500):
+                for rec in session.exec(select(FileRecord).where(FileRecord.dir_id.in_(dirs[i:i + 500]))):
+                    path = catalog.path_of(rec)
+                    if os.path.exists(path) and os.path.getsize(path) != rec.size_bytes: continue
+                    fallback.append({"path": path, "size": rec.size_bytes, "id": rec.id, "dir_id": rec.dir_id})
+            return fallback
+
+        rec = next(r for i in range(0, len(dirs), 500)
+                   for r in session.exec(select(FileRecord).where(FileRecord.dir_id.in_(dirs[i:i + 500])).limit(1)))
+        if self.mode == "quarantine":
+            manifest = tree_manifest(session, catalog, item["path"], dirs)
+            with m.timer("throttle_wait"):
+                self.throttle.file()
+            with m.timer("quarantine_rename"):
+                stored = move_to_quarantine(item["path"], self.mission_id)
+            m.incr("bytes_quarantined", item["size"])
+            self._journal(session, item["path"], rec, stored, tree=item, manifest=manifest)
+        else:
+            with m.timer("throttle_wait"):
+                self.throttle.file(item["files"])
+            with m.timer("rmtree"):
+                shutil.rmtree(item["path"])
+            m.incr("bytes_deleted", item["size"])
+            self._journal(session, item["path"], rec, tree=item)
+        # Database writes only after the (throttled) removal, so the write lock is taken late
+        invalidate(session, dirs, ancestor_of=parent_id)
+        self.usage.remove_dirs(session, dirs)
+        conn = session.connection()
+        for i in range(0, len(dirs), 500):
+            chunk = dirs[i:i + 500]
+            conn.exec_driver_sql(f"DELETE FROM filerecord WHERE dir_id IN ({','.join('?' * len(chunk))})", tuple(chunk))
+        m.incr("trees_deleted")
+        m.incr("files_deleted", item["files"])
+        return None
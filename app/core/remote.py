@@ -0,0 +1,142 @@
+import os
+import gzip
+import json
+import time
+from typing import Iterable, List, Optional
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app.database.models import engine, FileRecord, ScanMission
+from app.database.catalog import Catalog, to_digest
+from app.core.merkle import compute_tree_digests
+from app.core.usage import compute_usage
+
+# Wire format shared by app/workers/agent.py and the /api/ingest routes:
+# gzip(NDJSON), one {"p": path relative to the agent root, "s": size, "m": mtime,
+# "h": md5 hex, "v": visual hash} object per line.
+
+
+def encode_batch(records: Iterable[dict]) -> bytes:
+    lines = (json.dumps(r, separators=(",", ":")) for r in records)
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=6)
+
+
+def decode_batch(body: bytes) -> List[dict]:
+    return [json.loads(line) for line in gzip.decompress(body).decode("utf-8").splitlines() if line]
+
+
+def check_records(records: List[dict]):
+    """ValueError for a batch the index cannot take: every record needs a path and a size."""
+    for i, r in enumerate(records):
+        if not isinstance(r, dict) or not isinstance(r.get("p"), str) or not r["p"]:
+            raise ValueError(f"Record {i}: missing path")
+        if not isinstance(r.get("s"), int) or isinstance(r["s"], bool) or r["s"] < 0:
+            raise ValueError(f"Record {i}: missing or invalid size")
+        if not isinstance(r.get("h"), (str, type(None))):
+            raise ValueError(f"Record {i}: invalid hash")
+
+
+def _state(mission) -> dict:
+    return json.loads(mission.checkpoint_json) if mission.checkpoint_json else {"roots": []}
+
+
+def open_ingest(drive: str, tag: str, root: Optional[str] = None, mission_id: Optional[int] = None) -> dict:
+    """
+    Registers an agent's drive on a mission (a new one unless mission_id is given).
+    Files land under `root` in the index: /remote/<drive> by default, or the path the
+    share is mounted at here so the Reaper can act on it later.
+    Re-opening a drive (agent restarted) discards its rows: the walk order of a new
+    run does not line up with the old batch numbers.
+    """
+    root = os.path.abspath(root or os.path.join("/remote", drive))
+    with Session(engine) as session:
+        if mission_id is None:
+            mission = ScanMission(timestamp=time.time(), root_paths=root, status="INGESTING")
+        else:
+            mission = session.get(ScanMission, mission_id)
+            if mission is None:
+                raise KeyError(mission_id)
+            if root not in mission.root_paths.split(";"):
+                mission.root_paths = ";".join(p for p in (mission.root_paths, root) if p)
+            mission.status = "INGESTING"
+        session.add(mission)
+        session.flush()
+        state = _state(mission)
+        if drive in state.setdefault("ingest", {}):
+            session.connection().exec_driver_sql(
+                "DELETE FROM filerecord WHERE mission_id = ? AND drive_id = ?",
+                (mission.id, Catalog(session).drive_id(drive)),
+            )
+        entry = state["ingest"][drive] = {"seq": -1, "root": root, "tag": tag, "complete": False}
+        mission.checkpoint_json = json.dumps(state)
+        session.add(mission)
+        session.commit()
+        session.refresh(mission)
+        return {"mission_id": mission.id, "drive": drive, "root": root, "tag": tag, "seq": entry["seq"]}
+
+
+def merge_batch(mission_id: int, drive: str, seq: int, records: List[dict]) -> dict:
+    """
+    Inserts one agent batch into the mission as files of `drive`.
+    Batches carry a per-drive sequence number; replays (agent retries) are skipped,
+    and the high-water mark is committed in the same transaction as the rows.
+    Malformed records (see check_records) reject the whole batch with ValueError.
+    """
+    check_records(records)
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        state = _state(mission) if mission else {}
+        entry = state.get("ingest", {}).get(drive)
+        if entry is None:
+            raise KeyError(drive)
+        if seq <= entry["seq"]:
+            return {"accepted": 0, "duplicate": True}
+
+        root, tag = entry["root"], entry["tag"]
+        catalog = Catalog(session)
+        drive_id = catalog.drive_id(drive)
+        rows, rejected = [], 0
+        for r in records:
+            path = os.path.normpath(os.path.join(root, r["p"].lstrip("/")))
+            if path == root or os.path.commonpath([root, path]) != root:
+                rejected += 1  # "../" escapes
+                continue
+            fname = os.path.basename(path)
+            rows.append({
+                "mission_id": mission_id, "drive_id": drive_id,
+                "dir_id": catalog.dir_id(os.path.dirname(path)), "filename": fname,
+                "ext_id": catalog.ext_id(os.path.splitext(fname)[1].lower()),
+                "size_bytes": r["s"], "mtime": r.get("m"), "created_at": time.time(),
+                "digest": to_digest(r.get("h")), "visual_hash": r.get("v"), "tag": tag,
+            })
+        if rows:
+            session.execute(insert(FileRecord), rows)
+        entry["seq"] = seq
+        mission.checkpoint_json = json.dumps(state)
+        session.add(mission)
+        session.commit()
+    return {"accepted": len(rows), "rejected": rejected, "duplicate": False}
+
+
+def finish_ingest(mission_id: int, drive: str) -> dict:
+    """
+    Agent is done with a drive: tree digests (whole-folder matches), folder usage,
+    mission COMPLETE once all drives are.
+    """
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        state = _state(mission) if mission else {}
+        entry = state.get("ingest", {}).get(drive)
+        if entry is None:
+            raise KeyError(drive)
+        root_id = Catalog(session).dir_id(entry["root"], create=False)
+        if root_id is not None:
+            compute_tree_digests(session, root_id, entry["tag"])
+        compute_usage(session)
+        entry["complete"] = True
+        if all(e["complete"] for e in state["ingest"].values()):
+            mission.status = "COMPLETE"
+        mission.checkpoint_json = json.dumps(state)
+        session.add(mission)
+        session.commit()
+        return {"mission_id": mission_id, "drive": drive, "status": mission.status}
@@ -1,9 +1,23 @@
 import os
+import json
 import time
+import textwrap
+import threading
+from typing import Callable, Dict, Iterable, Iterator, Optional
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from reportlab.lib import colors
+from sqlmodel import Session
+
+from app.database.models import engine
+from app.database.catalog import Catalog
+
+REPORTS_DIR = os.getenv("SENTRY_REPORTS_DIR", "/app/reports")
+# Journal rows read per query while the manifest is drawn: the full list is never in memory,
+# only the PDF's finished (compressed) page streams are, until the file is written.
+MANIFEST_PAGE = int(os.getenv("SENTRY_REPORT_PAGE", "500"))
+_WRAP = 118  # Courier 7pt characters across the printable width
 
 class Reporter:
     """
@@ -11,16 +25,32 @@ class Reporter:
     for clients, detailing the cleaning operation.
     """
     
-    def __init__(self, export_dir="/app/reports"):
-        self.export_dir = export_dir
+    def __init__(self, export_dir=None):
+        self.export_dir = export_dir or REPORTS_DIR
         if not os.path.exists(self.export_dir):
             os.makedirs(self.export_dir)
 
-    def generate_report(self, mission_id, total_scanned, duplicates_removed, ghost_folders, target_paths):
-        filename = f"Sovereign_Sanitation_Report_{mission_id}.pdf"
+    def generate_report(self, mission_id, total_scanned, duplicates_removed, ghost_folders, target_paths,
+                        manifest: Optional[Iterable[dict]] = None, total_entries: Optional[int] = None,
+                        progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Certificate page, then one manifest line group per entry of `manifest` (see
+        journal_manifest) if given. `progress(entries, pages)` is called after each page.
+        Written to a temporary file and renamed, so a half-built report is never served.
+        """
+        filename = report_filename(mission_id)
         filepath = os.path.join(self.export_dir, filename)
-        
-        c = canvas.Canvas(filepath, pagesize=letter)
+        partial = filepath + ".part"
+
+        c = canvas.Canvas(partial, pagesize=letter, pageCompression=1)
+        self._certificate(c, mission_id, total_scanned, duplicates_removed, ghost_folders, target_paths, total_entries)
+        if manifest is not None:
+            self._manifest(c, mission_id, manifest, progress)
+        c.save()
+        os.replace(partial, filepath)
+        return filepath
+
+    def _certificate(self, c, mission_id, total_scanned, duplicates_removed, ghost_folders, target_paths, total_entries):
         width, height = letter
         
         # --- HEADER ---
@@ -63,6 +93,9 @@ class Reporter:
         c.drawString(0.7*inch, y - 1.6*inch, f"Duplicates Removed:  {duplicates_removed}")
         c.drawString(0.7*inch, y - 1.8*inch, f"Ghost Folders Purged: {ghost_folders}")
         c.drawString(0.7*inch, y - 2.0*inch, f"Target Drives:       {', '.join(target_paths)}")
+        if total_entries is not None:
+            c.setFont("Helvetica", 10)
+            c.drawString(0.5*inch, y - 2.8*inch, f"The file manifest ({total_entries} entries) follows on the next pages.")
 
         # --- FOOTER ---
         c.setFont("Helvetica-Oblique", 10)
@@ -70,5 +103,159 @@ class Reporter:
         c.drawString(0.5*inch, 0.85*inch, "using Sovereign Silicon's proprietary cryptographic deduplication engine.")
         c.drawString(0.5*inch, 0.5*inch, "https://sovereignsilicon.com")
 
-        c.save()
-        return filepath
+    def _manifest(self, c, mission_id, entries: Iterable[dict], progress=None):
+        width, height = letter
+        top, bottom, line = height - 0.9*inch, 0.8*inch, 9
+        page, done = 1, 0
+
+        def new_page():
+            nonlocal page
+            c.showPage()
+            page += 1
+            c.setFillColor(colors.black)
+            c.setFont("Helvetica-Bold", 11)
+            c.drawString(0.5*inch, height - 0.6*inch, f"FILE MANIFEST - Mission {mission_id}")
+            c.setFont("Helvetica-Oblique", 8)
+            c.drawRightString(width - 0.5*inch, 0.5*inch, f"Page {page}")
+            c.setFont("Courier", 7)
+            return top
+
+        y = new_page()
+        for entry in entries:
+            lines = self._entry_lines(entry)
+            if y - line * len(lines) < bottom:
+                if progress: progress(done, page)
+                y = new_page()
+            for text in lines:
+                c.drawString(0.5*inch, y, text)
+                y -= line
+            y -= 3
+            done += 1
+        if not done:
+            c.drawString(0.5*inch, y, "No Reaper actions were recorded for this mission.")
+        if progress: progress(done, page)
+
+    @staticmethod
+    def _entry_lines(entry: dict):
+        """Action, size and path (wrapped, never cut), then the hash and the keeper copy."""
+        head = f"{entry['action']:<10} {entry['status']:<11} {entry['size']:>15,} B  "
+        lines = textwrap.wrap(head + entry["path"], _WRAP, subsequent_indent=" " * len(head),
+                              break_on_hyphens=False, drop_whitespace=False) or [head]
+        detail = f"md5 {entry['hash']}" if entry["hash"] else f"folder, {entry['files']} files"
+        keeper = entry.get("keeper")
+        lines += textwrap.wrap(f"{detail}  keeper {keeper or '-'}", _WRAP, initial_indent=" " * 11,
+                               subsequent_indent=" " * 15, break_on_hyphens=False)
+        return lines
+
+
+def report_filename(mission_id) -> str:
+    return f"Sovereign_Sanitation_Report_{mission_id}.pdf"
+
+
+def journal_manifest(mission_id: int, page: int = MANIFEST_PAGE) -> Iterator[dict]:
+    """
+    The mission's Reaper journal in id order, `page` rows per query. Files removed without a
+    recorded keeper (delete/quarantine modes) get the path of a MASTER copy of the same content.
+    The read transaction is ended after every page, so writers are never held up by a slow PDF.
+    """
+    last = 0
+    with engine.connect() as conn:
+        session = Session(bind=conn)
+        catalog = Catalog(session)
+        while True:
+            rows = conn.exec_driver_sql(
+                "SELECT id, action, status, original_path, keeper_path, digest, size_bytes, files FROM reaperjournal "
+                "WHERE mission_id = ? AND id > ? ORDER BY id LIMIT ?", (mission_id, last, page)
+            ).fetchall()
+            if not rows:
+                return
+            digests = list({r[5] for r in rows if r[5] is not None and r[4] is None})
+            keepers = {}
+            if digests:
+                for digest, dir_id, filename in conn.exec_driver_sql(
+                    "SELECT digest, dir_id, filename FROM filerecord "
+                    f"WHERE tag = 'MASTER' AND digest IN ({','.join('?' * len(digests))})", tuple(digests)
+                ):
+                    keepers.setdefault(digest, os.path.join(catalog.dir_path(dir_id), filename))
+            conn.rollback()
+            for _, action, status, path, keeper, digest, size, files in rows:
+                yield {"action": action, "status": status, "path": path, "size": size, "files": files,
+                       "hash": digest.hex() if digest else None, "keeper": keeper or keepers.get(digest)}
+            last = rows[-1][0]
+
+
+# --- BACKGROUND REPORTS ---
+# filename -> {"status": QUEUED | RUNNING | DONE | FAILED, "entries", "total", "pages", ...}
+REPORT_JOBS: Dict[str, dict] = {}
+_BUILD_LOCK = threading.Lock()  # One report written at a time
+
+
+def _cache_key(mission_id: int, summary: dict) -> list:
+    with engine.connect() as conn:
+        count, last = conn.exec_driver_sql(
+            "SELECT count(*), coalesce(max(id), 0) FROM reaperjournal WHERE mission_id = ?", (mission_id,)
+        ).fetchone()
+    return [count, last, summary]
+
+
+def queue_report(mission_id: int, **summary) -> str:
+    """Marks the report as pending (downloads wait for it); run build_report next. Returns the filename."""
+    filename = report_filename(mission_id)
+    REPORT_JOBS[filename] = {"mission_id": mission_id, "status": "QUEUED", "entries": 0, "total": None, "pages": 0}
+    return filename
+
+
+def build_report(mission_id: int, export_dir: str = None, **summary) -> dict:
+    """
+    Writes the certificate and manifest of `mission_id` (`summary`: the generate_report
+    figures). A report already on disk for the same journal state and figures is kept
+    as is: its sidecar (.json) records what it was built from.
+    """
+    reporter = Reporter(export_dir)
+    filename = report_filename(mission_id)
+    filepath = os.path.join(reporter.export_dir, filename)
+    job = REPORT_JOBS.setdefault(filename, {"mission_id": mission_id, "entries": 0, "total": None, "pages": 0})
+    with _BUILD_LOCK:
+        try:
+            key = _cache_key(mission_id, summary)
+            sidecar = _read_sidecar(filepath)
+            if os.path.exists(filepath) and sidecar and sidecar.get("key") == key:
+                job.update(sidecar, status="DONE", cached=True)
+                return job
+            job.update(status="RUNNING", total=key[0], entries=0, pages=0, started_at=time.time(), cached=False)
+
+            def progress(entries, pages):
+                job.update(entries=entries, pages=pages)
+
+            reporter.generate_report(mission_id, manifest=journal_manifest(mission_id), total_entries=key[0],
+                                     progress=progress, **summary)
+            done = {"key": key, "entries": job["entries"], "total": key[0], "pages": job["pages"],
+                    "finished_at": time.time()}
+            with open(filepath + ".json", "w") as f:
+                json.dump(done, f)
+            job.update(done, status="DONE")
+        except Exception as e:
+            job.update(status="FAILED", error=str(e))
+            print(f"[Reporter] Report for mission {mission_id} failed: {e}")
+        return job
+
+
+def _read_sidecar(filepath: str) -> Optional[dict]:
+    try:
+        with open(filepath + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def report_status(filename: str, export_dir: str = None) -> Optional[dict]:
+    """The job's progress, or what the sidecar says of a report built before a restart."""
+    filename = os.path.basename(filename)
+    job = REPORT_JOBS.get(filename)
+    if job is not None:
+        return {k: v for k, v in job.items() if k != "key"}
+    filepath = os.path.join(export_dir or REPORTS_DIR, filename)
+    sidecar = _read_sidecar(filepath)
+    if sidecar and os.path.exists(filepath):
+        return {**{k: v for k, v in sidecar.items() if k != "key"}, "status": "DONE"}
+    return None
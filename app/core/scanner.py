@@ -1,50 +1,422 @@
 import os
+import queue
 import hashlib
 import time
+import threading
 from pathlib import Path
-from sqlmodel import Session
-from app.database.models import engine, ScanMission, FileRecord
+from typing import Callable, Optional
+from sqlmodel import Session, select
+from app.database.models import engine, ScanMission, FileRecord, Directory
+from app.database.catalog import Catalog, to_digest
 from app.core.ai_processor import AIProcessor
+from app.core.metrics import Metrics, REGISTRY, save_mission_metrics
+from app.core.profiler import track_job
+from app.core.throttle import Throttle, get_throttle
+from app.core.concurrency import WorkerPool, ConcurrencyController
+from app.core.ingest import IngestSpool
+from app.core.checkpoint import WalkCursor, root_entry, save_cursor
+from app.core.merkle import compute_tree_digests
+from app.core.chunking import Chunker, store_chunks
+from app.core.similarity import DOC_EXTS, TEXT_MAX_BYTES, extract_text, signature, store_signatures
+
+VISUAL_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
 
 class Scanner:
-    def __init__(self, mission_id: int):
+    def __init__(self, mission_id: int, throttle: Throttle = None,
+                 hash_workers: int = None, walk_workers: int = 2, adaptive: bool = True,
+                 ignore=(), progress_cb: Optional[Callable[[dict], None]] = None,
+                 chunk_min_file: Optional[int] = None, similarity: bool = False):
         self.mission_id = mission_id
         self.ai = AIProcessor()
+        self.metrics = Metrics(parent=REGISTRY)
+        self.throttle = throttle or get_throttle(mission_id)
+        self.hash_workers = hash_workers or min(4, os.cpu_count() or 1)
+        self.walk_workers = walk_workers
+        self.adaptive = adaptive
+        self.ignore = set(ignore)  # Directory names never descended into
+        self.progress_cb = progress_cb
+        self.chunk_min_file = chunk_min_file  # Files this big also get content-defined chunks; None = off
+        self.similarity = similarity  # MinHash signatures of text documents (near-duplicate analysis)
+        self.controller = None
 
-    def calculate_hash(self, filepath: str) -> str:
+    def calculate_hash(self, filepath: str, dev: int = None, chunker: Chunker = None) -> str:
         h = hashlib.md5()
+        m = self.metrics
         try:
             with open(filepath, "rb") as f:
-                while chunk := f.read(65536): h.update(chunk)
+                while True:
+                    with m.timer("read"):
+                        chunk = f.read(65536)
+                    if not chunk: break
+                    m.incr("bytes_read", len(chunk))
+                    with m.timer("throttle_wait"):
+                        self.throttle.read(dev, len(chunk))
+                    with m.cpu_timer("hash_cpu"):
+                        h.update(chunk)
+                    if chunker:
+                        with m.cpu_timer("chunk_cpu"):
+                            chunker.update(chunk)
             return h.hexdigest()
         except: return None
 
-    def scan_directory(self, root_path: str, tag: str, drive_id: str):
-        print(f"[Scanner] Indexing {root_path} as {tag}...")
-        visual_exts = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
-        
-        with Session(engine) as session:
-            count = 0
-            for root, dirs, files in os.walk(root_path):
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
-                for fname in files:
-                    if fname.startswith('.'): continue
-                    fpath = os.path.join(root, fname)
+    def fingerprint(self, fpath: str, fname: str, content: bool = True):
+        """Stat + content hash (+ visual hash for images) of one file. Runs on hashing workers."""
+        m = self.metrics
+        try:
+            ext = Path(fname).suffix.lower()
+            self.throttle.file()
+            with m.timer("stat"):
+                st = os.stat(fpath)
+            f_hash = v_hash = chunks = sig = None
+            chunker = None
+            if content and self.chunk_min_file is not None and st.st_size >= self.chunk_min_file:
+                chunker = Chunker()  # Same read pass as the MD5
+            if content:  # False on the metadata pass; hash_pending() fills these in later
+                f_hash = self.calculate_hash(fpath, dev=st.st_dev, chunker=chunker)
+            if chunker and f_hash:
+                with m.cpu_timer("chunk_cpu"):
+                    chunks = chunker.finish()
+                m.incr("files_chunked")
+            if content and ext in VISUAL_EXTS:
+                with m.timer("image_hash"):
+                    v_hash = self.ai.get_visual_hash(fpath)
+            if content and self.similarity and f_hash and ext in DOC_EXTS:
+                self.throttle.read(st.st_dev, min(st.st_size, TEXT_MAX_BYTES))  # Just read for the MD5: page cache
+                with m.timer("text_extract"):
+                    text = extract_text(fpath, ext)
+                if text:
+                    with m.cpu_timer("minhash_cpu"):
+                        sig = signature(text)
+                    if sig is not None: m.incr("documents_signed")
+            return {"path": fpath, "filename": fname, "extension": ext, "size": st.st_size,
+                    "mtime": st.st_mtime, "file_hash": f_hash, "visual_hash": v_hash,
+                    "chunks": chunks, "signature": sig}
+        except Exception:
+            m.incr("scan_errors")
+            return None
+
+    def _commit(self, session, cursor: WalkCursor = None, staged=(), tag: str = None):
+        mission = session.get(ScanMission, self.mission_id)
+        if cursor is not None:
+            # Rows and walk cursor land in the same transaction
+            cursor.files_committed(staged)
+            if mission:
+                save_cursor(session, mission, cursor, tag)
+        if mission:
+            save_mission_metrics(session, mission, "scanner", self.metrics)
+        with self.metrics.timer("db_commit"):
+            session.commit()
+
+    def _progress(self, current: str = None):
+        if not self.progress_cb: return
+        c = self.metrics.counters
+        indexed, skipped, errors = c.get("files_indexed", 0), c.get("files_skipped", 0), c.get("scan_errors", 0)
+        self.progress_cb({
+            "event": "progress", "mission_id": self.mission_id,
+            "scanned": indexed + skipped + errors, "indexed": indexed,
+            "skipped": skipped, "errors": errors, "bytes": c.get("bytes_read", 0),
+            "current": current, "ts": time.time(),
+        })
+
+    def _resume_cursor(self, session, catalog: Catalog, root_path: str):
+        """Walk cursor from the mission checkpoint + names already committed in in-flight dirs."""
+        mission = session.get(ScanMission, self.mission_id)
+        entry = root_entry(mission, root_path) if mission else None
+        cursor = WalkCursor(root_path, (entry or {}).get("done", ()), (entry or {}).get("in_flight", ()))
+        cursor.complete = bool(entry and entry.get("complete"))
+        committed = {}
+        for directory in cursor.resumed:
+            dir_id = catalog.dir_id(directory, create=False)
+            if dir_id is None: continue
+            committed[directory] = set(session.exec(
+                select(FileRecord.filename).where(FileRecord.dir_id == dir_id,
+                                                  FileRecord.mission_id == self.mission_id)
+            ).all())
+        return cursor, committed
+
+    def scan_directory(self, root_path: str, tag: str, drive_id: str, spool: IngestSpool = None,
+                       content: bool = True):
+        """
+        Indexes root_path into FileRecord, or appends to `spool` in fast-ingest mode.
+        Indexed scans checkpoint their walk cursor on every commit; calling this again
+        for the same mission resumes from the last checkpoint.
+        content=False is the metadata pass of largest-first scheduling: rows are stored
+        with a NULL digest and hashed afterwards by hash_pending().
+        """
+        m = self.metrics
+
+        # Walkers and hashers run in pools; this thread is the single SQLite writer.
+        with track_job("scan", self.mission_id), Session(engine) as session:
+            catalog = Catalog(session)
+            if spool is None:
+                cursor, committed = self._resume_cursor(session, catalog, root_path)
+            else:
+                cursor, committed = WalkCursor(root_path), {}  # spools don't survive a crash anyway
+            if cursor.complete:
+                print(f"[Scanner] {root_path} already complete, skipping.")
+                if content:
+                    self._tree_digests(session, catalog, root_path, tag, only_missing=True)
+                return
+            print(f"[Scanner] Indexing {root_path} as {tag}"
+                  f"{' (resuming)' if cursor.done or cursor.resumed else ''}...")
+
+            pipeline = _ScanPipeline(self, cursor, committed, content=content)
+            drive = catalog.drive_id(drive_id)
+            staged, signed = [], []
+            for directory, res in pipeline.results():
+                staged.append(directory)
+                if res is None:
+                    pass
+                elif spool is not None:
+                    spool.append(res["path"], res["size"], res["file_hash"], tag, drive_id)
+                    m.incr("files_spooled")
+                else:
+                    rec = FileRecord(
+                        mission_id=self.mission_id, drive_id=drive,
+                        dir_id=catalog.dir_id(directory),
+                        filename=res["filename"], ext_id=catalog.ext_id(res["extension"]),
+                        size_bytes=res["size"], mtime=res["mtime"],
+                        created_at=time.time(), digest=to_digest(res["file_hash"]),
+                        visual_hash=res["visual_hash"],
+                        tag=tag # <--- Stores the critical tag
+                    )
+                    session.add(rec)
+                    if res["chunks"]:
+                        session.flush()
+                        store_chunks(session, rec.id, res["chunks"])
+                    if res["signature"] is not None:
+                        signed.append((rec, res["signature"]))
+                    m.incr("files_indexed")
+                if len(staged) >= 100:
+                    self._store_signatures(session, signed)
+                    signed = []
+                    self._commit(session, cursor if spool is None else None, staged, tag)
+                    self._progress(res and res["path"])
+                    staged = []
+            self._store_signatures(session, signed)
+            self._commit(session, cursor if spool is None else None, staged, tag)
+            self._progress()
+            if spool is None and content:
+                self._tree_digests(session, catalog, root_path, tag)
+
+    def _store_signatures(self, session, signed):
+        if signed:
+            session.flush()  # Row ids for the batch, in one go
+            store_signatures(session, [(rec.id, sig) for rec, sig in signed])
+
+    def fingerprints(self, root_path: str):
+        """Yields fingerprint dicts for root_path without touching the database (scan agents)."""
+        with track_job("scan", self.mission_id):
+            for _, res in _ScanPipeline(self, WalkCursor(root_path)).results():
+                if res is not None:
+                    yield res
+
+    def hash_pending(self, roots=(), page: int = 1000):
+        """
+        Second phase of largest-first scheduling: hashes this mission's NULL-digest rows
+        in descending size order. Sizes present on both MASTER and TARGET go first (only
+        they can be reclaimed), so a scan cut short still finds the most bytes; the Reaper
+        can act on whatever has been hashed so far. Per-device read limits still apply
+        through the throttle. `roots` are (path, tag) pairs whose tree digests are
+        refreshed once everything is hashed.
+        """
+        # One pinned connection: the TEMP table must survive the per-page commits
+        with track_job("scan", self.mission_id), engine.connect() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS temp.candidate_sizes")
+            conn.exec_driver_sql(
+                "CREATE TEMP TABLE candidate_sizes AS SELECT size_bytes FROM filerecord "
+                "GROUP BY size_bytes HAVING sum(tag = 'MASTER') > 0 AND sum(tag = 'TARGET') > 0"
+            )
+            conn.commit()
+            with Session(bind=conn) as session:
+                self._hash_by_size(session, page)
+                catalog = Catalog(session)
+                for path, tag in roots:
+                    self._tree_digests(session, catalog, path, tag)
+
+    def _hash_by_size(self, session, page: int):
+        m = self.metrics
+        catalog = Catalog(session)
+        todo, done = queue.Queue(), queue.Queue()
+
+        def work(keep_going):
+            with track_job("scan", self.mission_id), self.throttle.priority():
+                while keep_going():
                     try:
-                        ext = Path(fname).suffix.lower()
-                        f_hash = self.calculate_hash(fpath)
-                        v_hash = self.ai.get_visual_hash(fpath) if ext in visual_exts else None
-                        
-                        rec = FileRecord(
-                            mission_id=self.mission_id, drive_id=drive_id,
-                            path=fpath, filename=fname, extension=ext,
-                            size_bytes=os.path.getsize(fpath),
-                            created_at=time.time(), file_hash=f_hash,
-                            visual_hash=v_hash, 
-                            tag=tag # <--- Stores the critical tag
+                        row_id, path = todo.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    done.put((row_id, self.fingerprint(path, os.path.basename(path))))
+
+        hashers = WorkerPool("sentry-hash", work, self.hash_workers)
+        try:
+            for candidates in (True, False):
+                where = "IN" if candidates else "NOT IN"
+                last = ()
+                while True:
+                    # Keyset pagination; rows that fail to hash keep a NULL digest and are not revisited
+                    keyset = "AND (size_bytes < ? OR (size_bytes = ? AND id > ?)) " if last else ""
+                    rows = session.connection().exec_driver_sql(
+                        f"SELECT id, dir_id, filename, size_bytes FROM filerecord "
+                        f"WHERE mission_id = ? AND digest IS NULL "
+                        f"AND size_bytes {where} (SELECT size_bytes FROM candidate_sizes) {keyset}"
+                        f"ORDER BY size_bytes DESC, id LIMIT ?",
+                        (self.mission_id, *last, page),
+                    ).fetchall()
+                    if not rows: break
+                    last = (rows[-1][3], rows[-1][3], rows[-1][0])
+                    for row_id, dir_id, filename, _ in rows:
+                        todo.put((row_id, os.path.join(catalog.dir_path(dir_id), filename)))
+                    updates = []
+                    for _ in rows:
+                        row_id, res = done.get()
+                        if res and res["file_hash"]:
+                            updates.append((to_digest(res["file_hash"]), res["size"], res["mtime"],
+                                            res["visual_hash"], row_id))
+                            if res["chunks"]:
+                                store_chunks(session, row_id, res["chunks"])
+                            if res["signature"] is not None:
+                                store_signatures(session, [(row_id, res["signature"])])
+                    if updates:
+                        session.connection().exec_driver_sql(
+                            "UPDATE filerecord SET digest = ?, size_bytes = ?, mtime = ?, visual_hash = ? WHERE id = ?",
+                            updates,
                         )
-                        session.add(rec)
-                        count += 1
-                        if count % 100 == 0: session.commit()
-                    except: continue
-            session.commit()
+                    m.incr("files_hashed", len(updates))
+                    if candidates:
+                        m.incr("candidate_bytes_hashed", sum(u[1] for u in updates))
+                    self._commit(session)
+                    self._progress(rows[-1][2])
+        finally:
+            hashers.stop()
+
+    def _tree_digests(self, session, catalog: Catalog, root_path: str, tag: str, only_missing: bool = False):
+        """Merkle digests for a finished root, so whole copied folders can be matched."""
+        root_id = catalog.dir_id(root_path, create=False)
+        if root_id is None: return
+        if only_missing and session.get(Directory, root_id).tree_tag is not None: return
+        with self.metrics.timer("tree_digest"):
+            compute_tree_digests(session, root_id, tag)
+        session.commit()
+
+
+class _ScanPipeline:
+    """
+    walk pool --(files queue)--> hash pool --(results queue)--> caller (DB writer)
+    Walkers list one directory at a time, so the walk itself is parallel too.
+    Both pools can be resized mid-scan by the ConcurrencyController.
+    """
+
+    def __init__(self, scanner: Scanner, cursor: WalkCursor,
+                 committed: dict = None, backlog: int = 2000, content: bool = True):
+        self.scanner = scanner
+        self.content = content
+        self.cursor = cursor
+        self.committed = committed or {}  # dir -> filenames already in the index (resume)
+        self.dirs = queue.Queue()
+        self.files = queue.Queue(maxsize=backlog)
+        self.out = queue.Queue()
+        self.walk_done = threading.Event()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._pending_dirs = 1
+        self._in_flight = 0
+        self.dirs.put(cursor.root)
+
+    def results(self):
+        sc = self.scanner
+        walkers = WorkerPool("sentry-walk", self._walk_worker, sc.walk_workers)
+        hashers = WorkerPool("sentry-hash", self._hash_worker, sc.hash_workers,
+                             max_size=max(sc.hash_workers, 2 * (os.cpu_count() or 1)))
+        if sc.adaptive:
+            sc.controller = ConcurrencyController(
+                hashers, walkers, sc.metrics,
+                backlog=lambda: self.files.qsize() / self.files.maxsize,
+            )
+            sc.controller.start()
+        try:
+            while True:
+                try:
+                    res = self.out.get(timeout=0.1)
+                except queue.Empty:
+                    if self.walk_done.is_set() and self._in_flight == 0:
+                        return
+                    continue
+                with self._lock:
+                    self._in_flight -= 1
+                yield res
+        finally:
+            self.stopped.set()
+            if sc.controller:
+                sc.controller.stop()
+            walkers.stop()
+            hashers.stop()
+
+    def _walk_worker(self, keep_going):
+        sc = self.scanner
+        with track_job("scan", sc.mission_id), sc.throttle.priority():
+            while keep_going() and not self.stopped.is_set():
+                try:
+                    directory = self.dirs.get(timeout=0.1)
+                except queue.Empty:
+                    if self.walk_done.is_set(): return
+                    continue
+                try:
+                    self._list(directory)
+                finally:
+                    with self._lock:
+                        self._pending_dirs -= 1
+                        if self._pending_dirs == 0: self.walk_done.set()
+
+    def _list(self, directory):
+        sc = self.scanner
+        m = sc.metrics
+        try:
+            with m.timer("walk"):
+                entries = list(os.scandir(directory))
+        except OSError:
+            m.incr("scan_errors")
+            entries = []
+
+        skip = self.committed.get(directory, ())
+        files, subdirs, done_subdirs = [], [], []
+        for entry in entries:
+            if entry.name.startswith('.'): continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                # Same as os.walk(): symlinked dirs are listed but not followed
+                if entry.is_symlink() or entry.name in sc.ignore: continue
+                (done_subdirs if self.cursor.skip(entry.path) else subdirs).append(entry.path)
+            elif entry.name in skip:
+                m.incr("files_skipped")
+            else:
+                files.append((entry.path, entry.name))
+
+        # Register with the cursor before anything below can complete
+        self.cursor.listed(directory, len(files), len(subdirs), done_subdirs)
+        with self._lock:
+            self._pending_dirs += len(subdirs)
+            self._in_flight += len(files)
+        for sub in subdirs:
+            self.dirs.put(sub)
+        for item in files:
+            while not self.stopped.is_set():
+                try:
+                    self.files.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def _hash_worker(self, keep_going):
+        sc = self.scanner
+        with track_job("scan", sc.mission_id), sc.throttle.priority():
+            while keep_going() and not self.stopped.is_set():
+                try:
+                    fpath, fname = self.files.get(timeout=0.1)
+                except queue.Empty:
+                    if self.walk_done.is_set(): return
+                    continue
+                self.out.put((os.path.dirname(fpath), sc.fingerprint(fpath, fname, self.content)))
@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+from typing import Optional
+
+from sqlmodel import Session
+
+from app.database.models import engine
+from app.database.catalog import Catalog
+
+# Filename/path search: `filesearch` is an FTS5 table keyed by FileRecord.id (see
+# models._create_search_index). New rows are picked up by id watermark instead of an
+# insert trigger, so bulk scans pay nothing; deletes and renames are handled by triggers.
+SYNC_PAGE = 50000
+_SYNC_LOCK = threading.Lock()
+
+
+def sync_search_index(blocking: bool = True) -> int:
+    """
+    Indexes every FileRecord above the watermark (the highest id already indexed), then
+    re-indexes rows renamed since the last sync. Returns the number of rows indexed.
+    With blocking=False an already running sync is left to finish and 0 is returned.
+    """
+    if not _SYNC_LOCK.acquire(blocking=blocking):
+        return 0
+    try:
+        indexed = 0
+        with engine.connect() as conn, Session(bind=conn) as session:
+            catalog = Catalog(session)
+            while True:
+                watermark = conn.exec_driver_sql("SELECT coalesce(max(id), 0) FROM filesearch_content").scalar()
+                rows = conn.exec_driver_sql(
+                    "SELECT f.id, f.dir_id, f.filename, e.name FROM filerecord f "
+                    "JOIN extension e ON e.id = f.ext_id WHERE f.id > ? ORDER BY f.id LIMIT ?", (watermark, SYNC_PAGE)
+                ).fetchall()
+                if not rows:
+                    break
+                _index(conn, catalog, rows)
+                conn.commit()
+                indexed += len(rows)
+
+            stale = [r[0] for r in conn.exec_driver_sql("SELECT id FROM searchstale").fetchall()]
+            for i in range(0, len(stale), 500):
+                ids = stale[i:i + 500]
+                marks = ",".join("?" * len(ids))
+                conn.exec_driver_sql(f"DELETE FROM filesearch WHERE rowid IN ({marks})", tuple(ids))
+                rows = conn.exec_driver_sql(
+                    "SELECT f.id, f.dir_id, f.filename, e.name FROM filerecord f "
+                    f"JOIN extension e ON e.id = f.ext_id WHERE f.id IN ({marks})", tuple(ids)
+                ).fetchall()
+                _index(conn, catalog, rows)
+                conn.exec_driver_sql(f"DELETE FROM searchstale WHERE id IN ({marks})", tuple(ids))
+                conn.commit()
+                indexed += len(rows)
+        return indexed
+    finally:
+        _SYNC_LOCK.release()
+
+
+def mark_stale(session: Session, dir_ids):
+    """
+    Queues every file in `dir_ids` for re-indexing. A moved or renamed folder changes the
+    path of each file below it without touching their filerecord rows, so the rename
+    trigger never fires for them (and SQLite triggers cannot walk the subtree).
+    """
+    conn = session.connection()
+    dir_ids = list(dir_ids)
+    for i in range(0, len(dir_ids), 500):
+        chunk = tuple(dir_ids[i:i + 500])
+        marks = ",".join("?" * len(chunk))
+        conn.exec_driver_sql(
+            f"DELETE FROM filesearch WHERE rowid IN (SELECT id FROM filerecord WHERE dir_id IN ({marks}))", chunk
+        )
+        conn.exec_driver_sql(
+            f"INSERT OR IGNORE INTO searchstale (id) SELECT id FROM filerecord WHERE dir_id IN ({marks})", chunk
+        )
+
+
+def _index(conn, catalog: Catalog, rows):
+    conn.exec_driver_sql(
+        "INSERT INTO filesearch (rowid, name, path, ext) VALUES (?, ?, ?, ?)",
+        [(file_id, filename, catalog.dir_path(dir_id), ext.lstrip(".")) for file_id, dir_id, filename, ext in rows],
+    )
+
+
+def _match(q: str, field: str, ext: Optional[str]) -> Optional[str]:
+    """User words -> FTS5 query: every word must match as a prefix, in `field` or anywhere."""
+    terms = ['"' + t.replace('"', '""') + '"*' for t in q.split() if re.search(r"\w", t)]
+    if not terms:
+        return None
+    expr = " AND ".join(terms)
+    if field != "any":
+        expr = f"{field} : ({expr})"
+    if ext:
+        ext = ext.lstrip(".").replace('"', "")
+        expr = f'({expr}) AND ext : "{ext}"'
+    return expr
+
+
+def search(q: str, field: str = "any", ext: Optional[str] = None, tag: Optional[str] = None,
+           drive: Optional[str] = None, min_size: Optional[int] = None, max_size: Optional[int] = None,
+           after: int = 0, limit: int = 100) -> dict:
+    """
+    Indexed files whose name/path words start with every word of `q`, in id order.
+    Keyset pagination: pass the returned `next` as `after` for the following page.
+    """
+    sync_search_index(blocking=False)  # Catch up on rows added since the last scan
+    expr = _match(q, field, ext)
+    if expr is None:
+        return {"results": [], "next": None}
+    sql = ("SELECT f.id, f.dir_id, f.filename, f.size_bytes, f.mtime, f.digest, f.tag, d.name "
+           "FROM filesearch s JOIN filerecord f ON f.id = s.rowid JOIN drive d ON d.id = f.drive_id "
+           "WHERE filesearch MATCH ? AND s.rowid > ?")
+    params = [expr, after]
+    if tag:
+        sql += " AND f.tag = ?"
+        params.append(tag)
+    if drive:
+        sql += " AND d.name = ?"
+        params.append(drive)
+    if min_size is not None:
+        sql += " AND f.size_bytes >= ?"
+        params.append(min_size)
+    if max_size is not None:
+        sql += " AND f.size_bytes <= ?"
+        params.append(max_size)
+    sql += " ORDER BY s.rowid LIMIT ?"
+    params.append(limit)
+
+    with Session(engine) as session:
+        catalog = Catalog(session)
+        rows = session.connection().exec_driver_sql(sql, tuple(params)).fetchall()
+        results = [{
+            "id": file_id, "path": os.path.join(catalog.dir_path(dir_id), filename),
+            "size": size, "mtime": mtime, "hash": digest.hex() if digest else None, "tag": tag_, "drive": drive_,
+        } for file_id, dir_id, filename, size, mtime, digest, tag_, drive_ in rows]
+    return {"results": results, "next": rows[-1][0] if len(rows) == limit else None}
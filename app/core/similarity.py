@@ -0,0 +1,140 @@
+import os
+import re
+import html
+import zlib
+import zipfile
+import hashlib
+from typing import List, Optional, Tuple
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app.database.models import engine, DocSignature, DocBand, FileRecord
+from app.database.catalog import Catalog
+
+# Near-duplicate documents: MinHash over word 5-shingles, LSH banding to find
+# candidate pairs without comparing every TARGET document with every MASTER one.
+TEXT_EXTS = {
+    ".txt", ".md", ".rst", ".tex", ".csv", ".tsv", ".log", ".json", ".yaml", ".yml", ".ini", ".cfg",
+    ".py", ".js", ".ts", ".java", ".c", ".h", ".cpp", ".hpp", ".cs", ".go", ".rs", ".rb", ".php",
+    ".sh", ".sql", ".css",
+}
+MARKUP_EXTS = {".html", ".htm", ".xml", ".svg"}
+ZIP_TEXT = {".docx": "word/document.xml", ".odt": "content.xml"}  # Office XML: text lives in one member
+DOC_EXTS = TEXT_EXTS | MARKUP_EXTS | set(ZIP_TEXT)
+TEXT_MAX_BYTES = int(os.getenv("SENTRY_TEXT_MAX_BYTES", 4 * 1024 * 1024))
+
+SHINGLE = 5
+MIN_SHINGLES = 10   # Shorter documents carry too little text to call them "similar"
+PERMUTATIONS = 128
+BANDS, ROWS = 16, 8  # Pairs become candidates from a Jaccard similarity of about (1/16)^(1/8) = 0.7
+_BLOCK = 8192
+
+# Multiply-shift hash family ((a * x + b) mod 2^64) >> 32; fixed seed so signatures are stable
+_rng = np.random.default_rng(0x51A1)
+_A = _rng.integers(1, 2 ** 63, PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, PERMUTATIONS, dtype=np.uint64)
+_WORD = re.compile(r"\w+")
+_TAG = re.compile(rb"<[^>]*>")
+
+
+def extract_text(path: str, ext: str) -> Optional[str]:
+    """Plain text of a document, None for anything that isn't text (or can't be read as such)."""
+    try:
+        if ext in ZIP_TEXT:
+            with zipfile.ZipFile(path) as z:
+                with z.open(ZIP_TEXT[ext]) as member:
+                    raw = _TAG.sub(b" ", member.read(TEXT_MAX_BYTES))
+                    return html.unescape(raw.decode("utf-8", "replace"))
+        with open(path, "rb") as f:
+            raw = f.read(TEXT_MAX_BYTES)
+    except Exception:  # Corrupt/encrypted zips raise zlib.error, RuntimeError, NotImplementedError...
+        return None  # ...and must only cost the signature, not the file's row
+    if raw.startswith((b"\xff\xfe", b"\xfe\xff")):
+        text = raw.decode("utf-16", "replace")
+    elif b"\0" in raw[:8192]:
+        return None  # Binary despite the extension
+    else:
+        text = raw.decode("utf-8", "replace")
+    if ext in MARKUP_EXTS:
+        text = html.unescape(_TAG.sub(b" ", text.encode("utf-8")).decode("utf-8"))
+    return text
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """128 x uint32 MinHash of the document's distinct word 5-shingles."""
+    words = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in _WORD.findall(text.lower())), dtype=np.uint64)
+    if len(words) < SHINGLE + MIN_SHINGLES - 1:
+        return None
+    # Polynomial hash of each window of SHINGLE words, folded to 32 bits
+    n = len(words) - SHINGLE + 1
+    sh = np.zeros(n, dtype=np.uint64)
+    for k in range(SHINGLE):
+        sh = sh * np.uint64(1000003) + words[k:k + n]
+    sh = np.unique((sh ^ (sh >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+    sig = np.full(PERMUTATIONS, 0xFFFFFFFF, dtype=np.uint64)
+    for i in range(0, len(sh), _BLOCK):
+        x = sh[i:i + _BLOCK, None]
+        sig = np.minimum(sig, ((x * _A + _B) >> np.uint64(32)).min(axis=0))
+    return sig.astype(np.uint32)
+
+
+def bands(sig: np.ndarray) -> List[int]:
+    """One LSH bucket per band; equal bucket = candidate pair."""
+    return [int.from_bytes(hashlib.blake2b(bytes([b]) + sig[b * ROWS:(b + 1) * ROWS].tobytes(),
+                                           digest_size=8).digest(), "big", signed=True)
+            for b in range(BANDS)]
+
+
+def store_signatures(session: Session, items: List[Tuple[int, Optional[np.ndarray]]]):
+    """Replaces the signature/band rows of (file_id, signature) pairs; a None signature just clears them."""
+    if not items:
+        return
+    conn = session.connection()
+    ids = [(file_id,) for file_id, _ in items]
+    conn.exec_driver_sql("DELETE FROM docsignature WHERE file_id = ?", ids)
+    conn.exec_driver_sql("DELETE FROM docband WHERE file_id = ?", ids)
+    signed = [(file_id, sig) for file_id, sig in items if sig is not None]
+    if signed:
+        session.execute(insert(DocSignature), [{"file_id": f, "signature": s.tobytes()} for f, s in signed])
+        session.execute(insert(DocBand), [{"file_id": f, "bucket": b} for f, s in signed for b in bands(s)])
+
+
+def similar_documents(threshold: float = 0.8, limit: int = 100) -> dict:
+    """
+    TARGET documents whose estimated Jaccard similarity with a MASTER document is at least
+    `threshold`, best match per target. Candidates come from shared LSH buckets only;
+    exact duplicates are left out (the Reaper handles them). Review only: nothing is deleted.
+    """
+    with Session(engine) as session:
+        conn = session.connection()
+        pairs = conn.exec_driver_sql(
+            "SELECT DISTINCT t.file_id, m.file_id FROM docband t "
+            "JOIN docband m ON m.bucket = t.bucket AND m.file_id != t.file_id "
+            "JOIN filerecord tf ON tf.id = t.file_id AND tf.tag = 'TARGET' "
+            "JOIN filerecord mf ON mf.id = m.file_id AND mf.tag = 'MASTER' "
+            "WHERE tf.digest IS NULL OR mf.digest IS NULL OR tf.digest != mf.digest"
+        ).fetchall()
+        wanted = sorted({f for pair in pairs for f in pair})
+        sigs = {}
+        for i in range(0, len(wanted), 500):
+            chunk = wanted[i:i + 500]
+            for file_id, blob in conn.exec_driver_sql(
+                f"SELECT file_id, signature FROM docsignature WHERE file_id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+            ):
+                sigs[file_id] = np.frombuffer(blob, dtype=np.uint32)
+
+        best = {}
+        for target, master in pairs:
+            score = float(np.mean(sigs[target] == sigs[master]))
+            if score >= threshold and score > best.get(target, (0.0, None))[0]:
+                best[target] = (score, master)
+
+        catalog = Catalog(session)
+        ranked = sorted(best.items(), key=lambda kv: kv[1][0], reverse=True)
+        matches = []
+        for target, (score, master) in ranked[:limit]:
+            t, m = session.get(FileRecord, target), session.get(FileRecord, master)
+            matches.append({"path": catalog.path_of(t), "size": t.size_bytes,
+                            "similar_to": catalog.path_of(m), "similarity": round(score, 3)})
+    return {"candidate_pairs": len(pairs), "similar": len(best), "threshold": threshold, "documents": matches}
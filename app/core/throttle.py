@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+import subprocess
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """
+    Classic token bucket. `rate` is units per second (bytes, files...);
+    a rate of 0/None means unlimited and consume() returns immediately.
+    Requests larger than the burst are allowed to go into debt, so a single
+    big read is paced correctly instead of deadlocking.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate=None, burst=None):
+        with self._lock:
+            self.rate = float(rate) if rate else 0.0
+            # Default burst: half a second worth of tokens
+            self.burst = float(burst) if burst else self.rate * 0.5
+            self.tokens = self.burst
+            self.updated = time.monotonic()
+
+    def consume(self, amount=1) -> float:
+        """Takes `amount` tokens, sleeping as needed. Returns seconds slept."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class Throttle:
+    """
+    I/O and CPU budget for one mission.
+    - read_bps:      read bandwidth per device (st_dev), so two disks don't share a budget
+    - files_per_sec: metadata budget (opens/unlinks), for chatty SMB shares
+    - nice / ionice: scheduling priority applied to the worker threads doing the I/O
+    Every setting can be changed while the mission runs (see update()).
+    """
+
+    def __init__(self, read_bps=None, files_per_sec=None, nice=None, ionice_class=None, ionice_level=None):
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._generation = 0
+        self._local = threading.local()
+        self.read_bps = None
+        self.files = TokenBucket()
+        self.nice = None
+        self.ionice_class = None
+        self.ionice_level = None
+        self.update(read_bps=read_bps, files_per_sec=files_per_sec, nice=nice,
+                    ionice_class=ionice_class, ionice_level=ionice_level)
+
+    def update(self, **settings):
+        with self._lock:
+            if "read_bps" in settings:
+                self.read_bps = settings["read_bps"] or None
+                for bucket in self._devices.values():
+                    bucket.set_rate(self.read_bps)
+            if "files_per_sec" in settings:
+                self.files.set_rate(settings["files_per_sec"])
+            for key in ("nice", "ionice_class", "ionice_level"):
+                if key in settings:
+                    setattr(self, key, settings[key])
+            self._generation += 1
+
+    def settings(self) -> dict:
+        return {
+            "read_bps": self.read_bps, "files_per_sec": self.files.rate or None,
+            "nice": self.nice, "ionice_class": self.ionice_class, "ionice_level": self.ionice_level,
+        }
+
+    def _device(self, dev):
+        bucket = self._devices.get(dev)
+        if bucket is None:
+            with self._lock:
+                bucket = self._devices.setdefault(dev, TokenBucket(self.read_bps))
+        return bucket
+
+    def read(self, dev, nbytes: int) -> float:
+        """Charges `nbytes` against the device's bandwidth budget."""
+        self._refresh_priority()
+        return self._device(dev).consume(nbytes)
+
+    def file(self, count: int = 1) -> float:
+        """Charges `count` metadata operations (open/stat/unlink)."""
+        self._refresh_priority()
+        return self.files.consume(count)
+
+    # --- Thread priority ---
+    def _refresh_priority(self):
+        # Cheap check; re-applies nice/ionice only when the API changed them
+        if getattr(self._local, "generation", None) != self._generation and getattr(self._local, "active", False):
+            self._apply()
+
+    def _apply(self):
+        self._local.generation = self._generation
+        tid = threading.get_native_id()
+        if self.nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+            except (OSError, AttributeError):
+                pass
+        if self.ionice_class is not None:
+            _ionice(tid, self.ionice_class, self.ionice_level)
+
+    @contextmanager
+    def priority(self):
+        """
+        Applies nice/ionice to the calling thread for the duration of a job and
+        restores it afterwards (server jobs run on pooled threads that get reused).
+        """
+        tid = threading.get_native_id()
+        try:
+            old_nice = os.getpriority(os.PRIO_PROCESS, tid)
+        except (OSError, AttributeError):
+            old_nice = None
+        self._local.active = True
+        self._apply()
+        try:
+            yield self
+        finally:
+            self._local.active = False
+            self._local.generation = None
+            if old_nice is not None and self.nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, old_nice)
+                except OSError:
+                    pass
+            if self.ionice_class is not None:
+                _ionice(tid, 0, None)
+
+
+def _ionice(tid: int, io_class: int, level=None):
+    # util-linux `ionice` (installed in the image) handles the ioprio_set syscall per arch
+    cmd = ["ionice", "-c", str(io_class)]
+    if level is not None and io_class in (1, 2):
+        cmd += ["-n", str(level)]
+    try:
+        subprocess.run(cmd + ["-p", str(tid)], capture_output=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+
+# mission_id -> Throttle, so the API can retune a running mission
+THROTTLES = {}
+
+
+def get_throttle(mission_id) -> Throttle:
+    throttle = THROTTLES.get(mission_id)
+    if throttle is None:
+        throttle = THROTTLES.setdefault(mission_id, Throttle())
+    return throttle
@@ -0,0 +1,201 @@
+import os
+from typing import Dict, List, Optional
+from sqlmodel import Session
+
+from app.database.models import engine
+from app.database.catalog import Catalog
+
+# Per-directory disk usage from the index (Directory.usage_*), subtree totals:
+#   bytes/files   everything indexed below the folder
+#   dup_bytes     files with at least one other copy anywhere in the index
+#   covered_bytes TARGET files whose content exists on MASTER (what the Reaper can reclaim)
+_CHUNK = 500
+
+
+def _ancestors(conn, dir_ids, parents: Dict[int, Optional[int]]):
+    """Fills `parents` (dir id -> parent id) for dir_ids and every ancestor, level by level."""
+    todo = [d for d in set(dir_ids) if d not in parents]
+    while todo:
+        found = []
+        for i in range(0, len(todo), _CHUNK):
+            chunk = todo[i:i + _CHUNK]
+            found += conn.exec_driver_sql(
+                f"SELECT id, parent_id FROM directory WHERE id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+            ).fetchall()
+        parents.update(found)
+        todo = list({p for _, p in found if p is not None and p not in parents})
+
+
+def compute_usage(session: Session) -> int:
+    """Full recompute over the whole index (dup/covered depend on every root). Caller commits."""
+    conn = session.connection()
+    direct = {r[0]: list(r[1:]) for r in conn.exec_driver_sql(
+        "SELECT f.dir_id, sum(f.size_bytes), count(*), "
+        "       sum(CASE WHEN g.copies IS NULL THEN 0 ELSE f.size_bytes END), "
+        "       sum(CASE WHEN f.tag = 'TARGET' AND g.masters > 0 THEN f.size_bytes ELSE 0 END) "
+        "FROM filerecord f LEFT JOIN hashgroup g ON g.digest = f.digest AND g.copies > 1 "
+        "GROUP BY f.dir_id"
+    )}
+    parents = dict(conn.exec_driver_sql("SELECT id, parent_id FROM directory").fetchall())
+
+    # Deepest folders first, so each one is complete before it is added to its parent
+    depth: Dict[int, int] = {}
+    for dir_id in parents:
+        chain = []
+        while dir_id is not None and dir_id not in depth:
+            chain.append(dir_id)
+            dir_id = parents.get(dir_id)
+        d = depth.get(dir_id, -1)
+        for node in reversed(chain):
+            d += 1
+            depth[node] = d
+    totals = {dir_id: direct.get(dir_id, [0, 0, 0, 0]) for dir_id in parents}
+    for dir_id in sorted(parents, key=depth.get, reverse=True):
+        parent = parents[dir_id]
+        if parent is not None:
+            totals[parent] = [a + b for a, b in zip(totals[parent], totals[dir_id])]
+
+    conn.exec_driver_sql(
+        "UPDATE directory SET usage_bytes = ?, usage_files = ?, usage_dup_bytes = ?, usage_covered_bytes = ? "
+        "WHERE id = ?", [(*t, dir_id) for dir_id, t in totals.items()],
+    )
+    return len(totals)
+
+
+class UsageDelta:
+    """
+    Index rows leaving (Reaper deletes, quarantines, consolidations) or coming back
+    (quarantine restores), applied to the usage of their folders and every ancestor at
+    the next apply(), instead of a full recompute. A copy left alone (or no longer alone)
+    changes its duplicate bytes too.
+    """
+
+    def __init__(self):
+        self._rows = []  # (dir_id, size, digest, tag) removed
+        self._added = []  # FileRecord objects added (ids known once flushed)
+
+    def remove(self, rec):
+        self._rows.append((rec.dir_id, rec.size_bytes, rec.digest, rec.tag))
+
+    def remove_dirs(self, session: Session, dir_ids: List[int]):
+        """Every row of these folders (a whole tree about to be deleted in SQL)."""
+        conn = session.connection()
+        for i in range(0, len(dir_ids), _CHUNK):
+            chunk = dir_ids[i:i + _CHUNK]
+            self._rows += conn.exec_driver_sql(
+                f"SELECT dir_id, size_bytes, digest, tag FROM filerecord WHERE dir_id IN ({','.join('?' * len(chunk))})",
+                tuple(chunk),
+            ).fetchall()
+
+    def add(self, rec):
+        self._added.append(rec)
+
+    def apply(self, session: Session):
+        """Call once the rows are deleted/added (pending ORM changes are flushed here), before commit."""
+        if not self._rows and not self._added:
+            return
+        session.flush()
+        conn = session.connection()
+        added = [(rec.id, rec.dir_id, rec.size_bytes, rec.digest, rec.tag) for rec in self._added]
+        removed: Dict[bytes, int] = {}
+        gained: Dict[bytes, List[int]] = {}  # digest -> ids of the rows added
+        for _, _, digest, _ in self._rows:
+            if digest is not None:
+                removed[digest] = removed.get(digest, 0) + 1
+        for file_id, _, _, digest, _ in added:
+            if digest is not None:
+                gained.setdefault(digest, []).append(file_id)
+        left: Dict[bytes, tuple] = {}  # digest -> (copies now, MASTER copies now, a remaining row)
+        digests = list(set(removed) | set(gained))
+        for i in range(0, len(digests), _CHUNK):
+            chunk = digests[i:i + _CHUNK]
+            for digest, n, m, dir_id, size in conn.exec_driver_sql(
+                "SELECT digest, count(*), sum(tag = 'MASTER'), min(dir_id), min(size_bytes) FROM filerecord "
+                f"WHERE digest IN ({','.join('?' * len(chunk))}) GROUP BY digest", tuple(chunk)
+            ):
+                left[digest] = (n, m, dir_id, size)
+
+        deltas: Dict[int, List[int]] = {}
+
+        def add(dir_id, size, files, dup, covered):
+            d = deltas.setdefault(dir_id, [0, 0, 0, 0])
+            d[0] += size; d[1] += files; d[2] += dup; d[3] += covered
+
+        def before(digest) -> int:
+            return left.get(digest, (0,))[0] + removed.get(digest, 0) - len(gained.get(digest, ()))
+
+        for dir_id, size, digest, tag in self._rows:
+            _, m, _, _ = left.get(digest, (0, 0, None, 0))
+            was_dup = digest is not None and before(digest) > 1
+            add(dir_id, -size, -1, -size if was_dup else 0, -size if tag == "TARGET" and m else 0)
+        for _, dir_id, size, digest, tag in added:
+            n, m, _, _ = left.get(digest, (1, 0, None, 0))
+            is_dup = digest is not None and n > 1
+            add(dir_id, size, 1, size if is_dup else 0, size if tag == "TARGET" and m else 0)
+        for digest, (n, _, dir_id, size) in left.items():
+            # The one copy that stayed put: the last copy left (no longer a duplicate of
+            # anything), or the lone copy that a restored row duplicates again
+            if n - len(gained.get(digest, ())) != 1 or (before(digest) > 1) == (n > 1):
+                continue
+            if digest in gained:
+                ids = gained[digest]
+                dir_id, size = conn.exec_driver_sql(
+                    f"SELECT dir_id, size_bytes FROM filerecord WHERE digest = ? AND id NOT IN ({','.join('?' * len(ids))}) "
+                    "LIMIT 1", (digest, *ids),
+                ).first()
+            add(dir_id, 0, 0, size if n > 1 else -size, 0)
+        self._rows, self._added = [], []
+
+        parents: Dict[int, Optional[int]] = {}
+        _ancestors(conn, deltas, parents)
+        totals: Dict[int, List[int]] = {}
+        for dir_id, delta in deltas.items():
+            node = dir_id
+            while node is not None:
+                t = totals.setdefault(node, [0, 0, 0, 0])
+                for k in range(4): t[k] += delta[k]
+                node = parents.get(node)
+        conn.exec_driver_sql(
+            "UPDATE directory SET usage_bytes = usage_bytes + ?, usage_files = usage_files + ?, "
+            "usage_dup_bytes = usage_dup_bytes + ?, usage_covered_bytes = usage_covered_bytes + ? WHERE id = ?",
+            [(*t, dir_id) for dir_id, t in totals.items()],
+        )
+
+
+def usage_tree(path: str = "/", depth: int = 1, limit: int = 50) -> Optional[dict]:
+    """
+    du-style tree from `path`, `depth` levels down, biggest folders first (at most `limit`
+    per folder; the rest are summed into "other"). None when the folder was never indexed.
+    """
+    with Session(engine) as session:
+        catalog = Catalog(session)
+        root = catalog.dir_id(path, create=False)
+        if root is None:
+            return None
+        conn = session.connection()
+        cols = "id, name, usage_bytes, usage_files, usage_dup_bytes, usage_covered_bytes"
+
+        def node(row, path, level):
+            dir_id, _, size, files, dup, covered = row
+            out = {"path": path, "bytes": size, "files": files, "dup_bytes": dup, "covered_bytes": covered}
+            if size is None:
+                out["stale"] = True  # Folder added since the last scan (watcher, restore)
+            if level < depth:
+                rows = conn.exec_driver_sql(
+                    f"SELECT {cols} FROM directory WHERE parent_id = ? ORDER BY usage_bytes DESC LIMIT ?",
+                    (dir_id, limit),
+                ).fetchall()
+                out["children"] = [node(r, os.path.join(path, r[1]), level + 1) for r in rows]
+                if len(rows) == limit:
+                    folders, total, count = conn.exec_driver_sql(
+                        "SELECT count(*), coalesce(sum(usage_bytes), 0), coalesce(sum(usage_files), 0) "
+                        "FROM directory WHERE parent_id = ?", (dir_id,)
+                    ).fetchone()
+                    if folders > limit:
+                        out["other"] = {"folders": folders - limit,
+                                        "bytes": total - sum(c["bytes"] or 0 for c in out["children"]),
+                                        "files": count - sum(c["files"] or 0 for c in out["children"])}
+            return out
+
+        row = conn.exec_driver_sql(f"SELECT {cols} FROM directory WHERE id = ?", (root,)).fetchone()
+        return node(row, catalog.dir_path(root), 0)
@@ -0,0 +1,448 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from sqlmodel import Session, select as sql_select
+
+from app.database.models import engine, Directory, FileRecord, ScanMission, WatchedRoot
+from app.database.catalog import Catalog, to_digest
+from app.core.merkle import compute_tree_digests, invalidate, subtree_dirs
+from app.core.metrics import Metrics, REGISTRY
+from app.core.chunking import store_chunks
+from app.core.similarity import store_signatures
+from app.core.search import mark_stale
+
+RECONCILE_S = float(os.getenv("SENTRY_RECONCILE_S", str(6 * 3600)))
+DEBOUNCE_S = float(os.getenv("SENTRY_WATCH_DEBOUNCE_S", "2"))
+RETRY_S = 5.0  # Pause after a failed pass (e.g. "database is locked" during a clean)
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ NUL-padded name)
+
+
+class Inotify:
+    """Minimal ctypes binding; fanotify would need CAP_SYS_ADMIN, inotify works unprivileged."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read(self):
+        """Yields (wd, mask, cookie, name) for every queued event."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            yield wd, mask, cookie, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Keeps one MASTER root's index fresh between missions.
+    inotify events are coalesced per path and applied once the path has been quiet
+    for `debounce` seconds; only those files are re-fingerprinted. Renames (matched
+    by cookie) just move the rows. A reconcile walk (size + mtime against the index)
+    runs every `reconcile_interval` seconds and after a queue overflow or watch-limit
+    exhaustion, so missed events are eventually caught. A pass that fails (database
+    locked, I/O error) is logged and schedules a reconcile; the thread keeps running.
+    """
+
+    def __init__(self, root: str, mission_id: int, scanner, debounce: float = DEBOUNCE_S,
+                 reconcile_interval: float = RECONCILE_S):
+        self.root = os.path.normpath(root)
+        self.mission_id = mission_id
+        self.scanner = scanner  # fingerprint() with the mission's throttle
+        self.debounce = debounce
+        self.reconcile_interval = reconcile_interval
+        self.metrics = Metrics(parent=REGISTRY)
+        self.drive = os.path.basename(self.root)
+        self.degraded = False  # Ran out of watches: rely on reconcile
+        self.last_reconcile = None
+        self.last_error = None  # {"error", "at"} of the latest failed pass
+        self._wds = {}  # wd -> directory
+        self._dirty = {}  # path -> last event time
+        self._moved = {}  # cookie -> (old path, is_dir, time)
+        self._renames = []
+        self._removed_dirs = set()
+        self._reconcile_due = True
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+    # --- Lifecycle ---
+    def start(self):
+        self._inotify = Inotify()
+        self._thread = threading.Thread(target=self._run, name=f"sentry-watch-{self.drive}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._inotify:
+            self._inotify.close()
+
+    def request_reconcile(self):
+        self._reconcile_due = True
+
+    def status(self) -> dict:
+        return {
+            "root": self.root, "mission_id": self.mission_id, "watches": len(self._wds),
+            "alive": self._thread is not None and self._thread.is_alive(),
+            "pending": len(self._dirty), "degraded": self.degraded,
+            "last_reconcile": self.last_reconcile, "last_error": self.last_error,
+            **self.metrics.snapshot()["counters"],
+        }
+
+    def _run(self):
+        try:
+            self._watch_tree(self.root)
+        except Exception as e:
+            self._failed(e)  # The reconcile below watches what it walks
+        next_reconcile = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._inotify.fd], [], [], min(self.debounce, 1.0))
+                if ready:
+                    for event in self._inotify.read():
+                        self._handle(*event)
+                now = time.monotonic()
+                if self._reconcile_due or now >= next_reconcile:
+                    self.reconcile()
+                    next_reconcile = now + self.reconcile_interval
+                else:
+                    self._flush(now)
+                self.metrics.set_gauge("watch_pending", len(self._dirty))
+            except Exception as e:
+                self._failed(e)
+                self._stop.wait(RETRY_S)
+
+    def _failed(self, e: Exception):
+        print(f"[Watcher] {self.root}: {e}")
+        self.metrics.incr("watch_errors")
+        self.last_error = {"error": str(e), "at": time.time()}
+        self._reconcile_due = True  # Whatever the failed pass missed, the walk finds again
+
+    # --- Watches ---
+    def _watch_tree(self, top: str):
+        """Watches every directory under `top`; returns the files found (for new/moved-in dirs)."""
+        files, stack = [], [top]
+        while stack:
+            directory = stack.pop()
+            try:
+                self._wds[self._inotify.add(directory)] = directory
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:  # fs.inotify.max_user_watches reached
+                    self.degraded = True
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'): continue
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink(): stack.append(entry.path)
+                    else:
+                        files.append(entry.path)
+                except OSError:
+                    continue
+        self.metrics.set_gauge("watch_dirs", len(self._wds))
+        return files
+
+    def _retarget(self, old: str, new: str):
+        """A directory moved: watches and not-yet-applied paths below it follow."""
+        def moved(path):
+            if path == old or path.startswith(old + os.sep):
+                return new + path[len(old):]
+            return path
+        self._wds = {wd: moved(d) for wd, d in self._wds.items()}
+        self._dirty = {moved(p): t for p, t in self._dirty.items()}
+        self._removed_dirs = {moved(p) for p in self._removed_dirs}
+
+    # --- Events ---
+    def _handle(self, wd: int, mask: int, cookie: int, name: str):
+        self.metrics.incr("watch_events")
+        now = time.monotonic()
+        if mask & IN_Q_OVERFLOW:
+            self._reconcile_due = True
+            return
+        if mask & (IN_IGNORED | IN_DELETE_SELF):
+            self._wds.pop(wd, None)
+            return
+        directory = self._wds.get(wd)
+        if directory is None or not name or name.startswith('.'):
+            return
+        path = os.path.join(directory, name)
+        is_dir = bool(mask & IN_ISDIR)
+
+        if mask & IN_MOVED_FROM:
+            self._moved[cookie] = (path, is_dir, now)
+        elif mask & IN_MOVED_TO and cookie in self._moved:
+            old, _, _ = self._moved.pop(cookie)
+            self._renames.append((old, path, is_dir))
+            if is_dir: self._retarget(old, path)
+        elif is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+            for f in self._watch_tree(path):
+                self._dirty[f] = now
+        elif is_dir and mask & IN_DELETE:
+            self._removed_dirs.add(path)
+        elif not is_dir:
+            self._dirty[path] = now
+
+    def _flush(self, now: float, force: bool = False):
+        # Moves out of the watched tree never get their MOVED_TO
+        for cookie, (path, is_dir, t) in list(self._moved.items()):
+            if force or now - t >= self.debounce:
+                del self._moved[cookie]
+                if is_dir: self._removed_dirs.add(path)
+                else: self._dirty[path] = t
+        ready = [p for p, t in self._dirty.items() if force or now - t >= self.debounce]
+        if not (ready or self._renames or self._removed_dirs):
+            return
+        for p in ready:
+            del self._dirty[p]
+        renames, self._renames = self._renames, []
+        removed, self._removed_dirs = self._removed_dirs, set()
+        try:
+            with self.scanner.throttle.priority(), Session(engine) as session:
+                catalog = Catalog(session)
+                touched = set()
+                for old, new, is_dir in renames:
+                    touched |= self._apply_rename(session, catalog, old, new, is_dir)
+                for directory in removed:
+                    touched |= self._drop_tree(session, catalog, directory)
+                for path in ready:
+                    touched |= self._refresh(session, catalog, path)
+                for dir_id in touched:
+                    invalidate(session, [], ancestor_of=dir_id)
+                session.commit()
+        except Exception:
+            # Rolled back: the batch goes back in the queue for the next pass
+            self._renames = renames + self._renames
+            self._removed_dirs |= removed
+            for p in ready:
+                self._dirty.setdefault(p, 0)
+            raise
+
+    # --- Index updates ---
+    def _refresh(self, session, catalog: Catalog, path: str) -> set:
+        m = self.metrics
+        rec = catalog.find(path)
+        if not os.path.isfile(path):
+            if rec:
+                session.delete(rec)
+                m.incr("watch_files_removed")
+                return {rec.dir_id}
+            return set()
+        res = self.scanner.fingerprint(path, os.path.basename(path))
+        if res is None:
+            return set()
+        if rec is None:
+            rec = FileRecord(
+                mission_id=self.mission_id, drive_id=catalog.drive_id(self.drive),
+                dir_id=catalog.dir_id(os.path.dirname(path)), filename=res["filename"],
+                ext_id=catalog.ext_id(res["extension"]), created_at=time.time(),
+                size_bytes=res["size"], tag="MASTER",
+            )
+        rec.size_bytes = res["size"]
+        rec.mtime = res["mtime"]
+        rec.digest = to_digest(res["file_hash"])
+        rec.visual_hash = res["visual_hash"]
+        session.add(rec)
+        session.flush()
+        store_chunks(session, rec.id, res["chunks"])  # Also drops stale chunks of a rewritten file
+        store_signatures(session, [(rec.id, res["signature"])])
+        m.incr("watch_files_updated")
+        return {rec.dir_id}
+
+    def _apply_rename(self, session, catalog: Catalog, old: str, new: str, is_dir: bool) -> set:
+        """Moves rows (or a whole Directory node) to the new name: no re-hashing."""
+        parent_id = catalog.dir_id(os.path.dirname(new))
+        if is_dir:
+            dir_id = catalog.dir_id(old, create=False)
+            if dir_id is None:
+                for f in self._watch_tree(new):  # never indexed: treat as new content
+                    self._dirty[f] = 0
+                return {parent_id}
+            if catalog.dir_id(new, create=False) is not None:  # Moved over an indexed folder
+                self._drop_tree(session, catalog, new)
+            node = session.get(Directory, dir_id)
+            touched = {node.parent_id, parent_id}
+            node.parent_id, node.name = parent_id, os.path.basename(new)
+            session.add(node)
+            mark_stale(session, subtree_dirs(session, dir_id))  # Every file below has a new path
+            self.metrics.incr("watch_dirs_moved")
+            return touched
+        rec = catalog.find(old)
+        if rec is None:
+            return self._refresh(session, catalog, new)
+        existing = catalog.find(new)  # Rename over an indexed file
+        if existing and existing.id != rec.id:
+            session.delete(existing)
+        touched = {rec.dir_id, parent_id}
+        rec.dir_id, rec.filename = parent_id, os.path.basename(new)
+        session.add(rec)
+        self.metrics.incr("watch_files_moved")
+        return touched
+
+    def _drop_tree(self, session, catalog: Catalog, directory: str) -> set:
+        dir_id = catalog.dir_id(directory, create=False)
+        if dir_id is None:
+            return set()
+        dirs = subtree_dirs(session, dir_id)
+        conn = session.connection()
+        for i in range(0, len(dirs), 500):
+            chunk = dirs[i:i + 500]
+            removed = conn.exec_driver_sql(
+                f"DELETE FROM filerecord WHERE dir_id IN ({','.join('?' * len(chunk))})", tuple(chunk)
+            ).rowcount
+            self.metrics.incr("watch_files_removed", removed)
+        invalidate(session, dirs)
+        return {session.get(Directory, dir_id).parent_id}
+
+    # --- Safety net ---
+    def reconcile(self):
+        """Walks the root and queues every file whose size/mtime differs from the index."""
+        m = self.metrics
+        self._reconcile_due = False
+        watched = set(self._wds.values())
+        with m.timer("watch_reconcile"), Session(engine) as session:
+            catalog = Catalog(session)
+            stack = [self.root]
+            while stack:
+                directory = stack.pop()
+                try:
+                    entries = list(os.scandir(directory))
+                except OSError:
+                    continue
+                if directory not in watched and not self.degraded:
+                    self._watch_tree_shallow(directory)
+                dir_id = catalog.dir_id(directory, create=False)
+                indexed, subdirs = {}, set()
+                if dir_id is not None:
+                    for rec in session.exec(sql_select(FileRecord).where(FileRecord.dir_id == dir_id)):
+                        indexed[rec.filename] = rec
+                    subdirs = {d.name for d in session.exec(sql_select(Directory).where(Directory.parent_id == dir_id))}
+                on_disk = set()
+                for entry in entries:
+                    if entry.name.startswith('.'): continue
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                stack.append(entry.path)
+                                on_disk.add(entry.name)
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    on_disk.add(entry.name)
+                    rec = indexed.get(entry.name)
+                    if rec is None or rec.size_bytes != st.st_size:
+                        self._dirty[entry.path] = 0
+                    elif rec.mtime is None:
+                        rec.mtime = st.st_mtime  # Indexed before mtimes were kept: trust the size match
+                        session.add(rec)
+                    elif rec.mtime != st.st_mtime:
+                        self._dirty[entry.path] = 0
+                for name in set(indexed) - on_disk:
+                    self._dirty[os.path.join(directory, name)] = 0
+                for name in subdirs - on_disk:
+                    self._removed_dirs.add(os.path.join(directory, name))
+            session.commit()
+        m.incr("watch_reconciles")
+        self._flush(time.monotonic(), force=True)
+        with Session(engine) as session:
+            root_id = Catalog(session).dir_id(self.root, create=False)
+            if root_id is not None:
+                compute_tree_digests(session, root_id, "MASTER")
+                session.commit()
+        self.last_reconcile = time.time()
+
+    def _watch_tree_shallow(self, directory: str):
+        try:
+            self._wds[self._inotify.add(directory)] = directory
+        except OSError as e:
+            if e.errno == errno.ENOSPC: self.degraded = True
+
+
+# --- Registry (one watcher per registered MASTER root) ---
+WATCHERS = {}
+
+
+def start_watch(path: str, scanner_factory) -> Watcher:
+    """Registers (or re-attaches) a MASTER root and starts its watcher."""
+    path = os.path.normpath(path)
+    if path in WATCHERS:
+        return WATCHERS[path]
+    with Session(engine) as session:
+        row = session.exec(sql_select(WatchedRoot).where(WatchedRoot.path == path)).first()
+        if row is None:
+            mission = ScanMission(timestamp=time.time(), root_paths=path, status="WATCHING")
+            session.add(mission)
+            session.flush()
+            row = WatchedRoot(path=path, mission_id=mission.id, created_at=time.time())
+            session.add(row)
+            session.commit()
+        mission_id = row.mission_id
+    watcher = Watcher(path, mission_id, scanner_factory(mission_id))
+    watcher.start()
+    WATCHERS[path] = watcher
+    return watcher
+
+
+def stop_watch(path: str, forget: bool = True) -> bool:
+    path = os.path.normpath(path)
+    watcher = WATCHERS.pop(path, None)
+    if watcher:
+        watcher.stop()
+    if forget:
+        with Session(engine) as session:
+            row = session.exec(sql_select(WatchedRoot).where(WatchedRoot.path == path)).first()
+            if row:
+                session.delete(row)
+                session.commit()
+    return watcher is not None
+
+
+def restore_watches(scanner_factory):
+    """Restarts watchers for every registered root (called at server startup)."""
+    with Session(engine) as session:
+        paths = [r.path for r in session.exec(sql_select(WatchedRoot)).all()]
+    for path in paths:
+        if os.path.isdir(path):
+            start_watch(path, scanner_factory)
@@ -0,0 +1,104 @@
+import os
+from typing import Optional
+from sqlmodel import Session, select
+from app.database.models import Drive, Directory, Extension, FileRecord
+
+
+def to_digest(file_hash: Optional[str]) -> Optional[bytes]:
+    """Hex MD5 -> 16 raw bytes (None for missing/garbage hashes)."""
+    try:
+        return bytes.fromhex(file_hash) if file_hash else None
+    except ValueError:
+        return None
+
+
+class Catalog:
+    """
+    Interns drives, directories and extensions for one Session and turns
+    (dir_id, filename) back into absolute paths. Lookups are cached, so a scan
+    touches the lookup tables once per new directory, not once per file.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self._drives = {}
+        self._exts = {}
+        self._dirs = {}   # path -> id
+        self._paths = {}  # id -> path
+
+    # --- Interning (write side) ---
+    def drive_id(self, name: str) -> int:
+        if name not in self._drives:
+            drive = self.session.exec(select(Drive).where(Drive.name == name)).first()
+            if not drive:
+                drive = Drive(name=name)
+                self.session.add(drive)
+                self.session.flush()
+            self._drives[name] = drive.id
+        return self._drives[name]
+
+    def ext_id(self, ext: str) -> int:
+        ext = ext or ""
+        if ext not in self._exts:
+            row = self.session.exec(select(Extension).where(Extension.name == ext)).first()
+            if not row:
+                row = Extension(name=ext)
+                self.session.add(row)
+                self.session.flush()
+            self._exts[ext] = row.id
+        return self._exts[ext]
+
+    def dir_id(self, path: str, create: bool = True) -> Optional[int]:
+        path = os.path.normpath(os.path.abspath(path))  # Relative paths would never reach a root
+        if path in self._dirs:
+            return self._dirs[path]
+
+        parent_path, name = os.path.split(path)
+        if not name or name == "." or parent_path in ("", ".", path):
+            parent_id, name = None, path  # filesystem root
+        else:
+            parent_id = self.dir_id(parent_path, create)
+            if parent_id is None:
+                return None
+
+        stmt = select(Directory.id).where(Directory.name == name)
+        stmt = stmt.where(Directory.parent_id == parent_id) if parent_id else stmt.where(Directory.parent_id.is_(None))
+        dir_id = self.session.exec(stmt).first()
+        if dir_id is None:
+            if not create:
+                return None
+            row = Directory(parent_id=parent_id, name=name)
+            self.session.add(row)
+            self.session.flush()
+            dir_id = row.id
+        self._dirs[path] = dir_id
+        self._paths[dir_id] = path
+        return dir_id
+
+    # --- Resolution (read side) ---
+    def dir_path(self, dir_id: int) -> str:
+        if dir_id not in self._paths:
+            row = self.session.get(Directory, dir_id)
+            path = row.name if row.parent_id is None else os.path.join(self.dir_path(row.parent_id), row.name)
+            self._paths[dir_id] = path
+            self._dirs[path] = dir_id
+        return self._paths[dir_id]
+
+    def path_of(self, record) -> str:
+        """Absolute path of a FileRecord (or any row with dir_id + filename)."""
+        return os.path.join(self.dir_path(record.dir_id), record.filename)
+
+    def find(self, path: str) -> Optional[FileRecord]:
+        dir_id = self.dir_id(os.path.dirname(path), create=False)
+        if dir_id is None:
+            return None
+        return self.session.exec(
+            select(FileRecord).where(FileRecord.dir_id == dir_id, FileRecord.filename == os.path.basename(path))
+        ).first()
+
+    def drive_name(self, drive_id: int) -> str:
+        for name, d_id in self._drives.items():
+            if d_id == drive_id: return name
+        drive = self.session.get(Drive, drive_id)
+        self._drives[drive.name] = drive_id
+        return drive.name
@@ -8,37 +8,40 @@ parent_dir = os.path.dirname(os.path.dirname(current_dir))
 sys.path.append(parent_dir)
 # --------------------------------------
 
-from sqlmodel import Session, select, func
-from app.database.models import FileRecord, engine
+from sqlmodel import Session
+from app.database.models import engine
+from app.database.catalog import Catalog
 
 def show_inventory():
     print("\n=== PROJECT SENTRY: DRIVE INVENTORY ===")
     
     with Session(engine) as session:
-        # Get all unique drive IDs
-        statement = select(FileRecord.drive_id).distinct()
-        drive_ids = session.exec(statement).all()
+        conn = session.connection()
+        # Per-drive totals come from the trigger-maintained dupstat table, not a pass over the index
+        statement = (
+            "SELECT d.id, d.name, sum(s.files), sum(s.bytes), sum(s.dup_files), sum(s.dup_bytes) "
+            "FROM dupstat s JOIN drive d ON d.id = s.drive_id GROUP BY d.id HAVING sum(s.files) > 0"
+        )
+        catalog = Catalog(session)
         
-        for d_id in drive_ids:
-            # Get file count
-            count = session.exec(select(func.count()).where(FileRecord.drive_id == d_id)).one()
-            
-            # Get a sample path to identify the drive name
-            sample = session.exec(select(FileRecord).where(FileRecord.drive_id == d_id)).first()
-            
+        for d_id, d_name, count, size, dup_count, dup_size in conn.exec_driver_sql(statement).fetchall():
             drive_name = "Unknown"
-            if sample:
+            # Any one directory of the drive
+            sample_dir = conn.exec_driver_sql("SELECT dir_id FROM filerecord WHERE drive_id = ? LIMIT 1", (d_id,)).scalar()
+            if sample_dir is not None:
                 # Try to extract readable name from path
                 # Example: /media/greg/MyDrive/folder -> MyDrive
-                parts = sample.path.split(os.sep)
+                sample_path = catalog.dir_path(sample_dir)
+                parts = sample_path.split(os.sep)
                 if len(parts) > 3 and parts[1] == "media":
                     drive_name = f"/media/{parts[2]}/{parts[3]}"
                 else:
-                    drive_name = os.path.dirname(sample.path)
+                    drive_name = sample_path
 
-            print(f"Drive ID: {d_id}")
+            print(f"Drive ID: {d_name}")
             print(f"   Name:  {drive_name}")
-            print(f"   Files: {count}")
+            print(f"   Files: {count} ({size / (1024 ** 3):.2f} GB)")
+            print(f"   Dupes: {dup_count} ({dup_size / (1024 ** 3):.2f} GB)")
             print("-" * 40)
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+import os
+
+from sqlalchemy import inspect, insert
+from sqlmodel import Session, SQLModel
+from app.database.models import FileRecord, engine
+from app.database.catalog import Catalog, to_digest
+
+BATCH = 5000
+
+def _guess_drive(path: str) -> str:
+    # Logic: Guess the drive name from the folder path
+    # Example: /media/greg/My Book/photos -> My Book
+    parts = path.split(os.sep)
+    if len(parts) > 3 and parts[1] == "media":
+        return parts[3]
+    return "System_Root"
+
+def migrate_legacy_layout() -> bool:
+    """
+    Converts a pre-compact index (absolute `path` + `filename`, string `drive_id`,
+    per-row `extension`, hex `file_hash`) into the compact layout: drive/extension/
+    directory lookup tables and a 16-byte `digest`. Row ids are preserved.
+    Also covers what repair.py used to do: rows without a drive_id get one
+    guessed from their path. Returns True if a migration ran.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("filerecord"):
+        return False
+    cols = {c["name"] for c in inspector.get_columns("filerecord")}
+    if "path" not in cols:
+        return False
+
+    print("🔧 [Migrate] Legacy index detected. Converting to compact layout...")
+    with engine.begin() as conn:
+        # Indexes keep their names across a rename and would clash with the new table's
+        for idx in inspector.get_indexes("filerecord"):
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{idx["name"]}"')
+        conn.exec_driver_sql("ALTER TABLE filerecord RENAME TO filerecord_legacy")
+    SQLModel.metadata.create_all(engine)
+
+    drive_col = "drive_id" if "drive_id" in cols else "NULL"
+    # Very old rows predate tags; keep them out of the Reaper's reach
+    tag_col = "tag" if "tag" in cols else "'UNTAGGED'"
+    ext_col = "extension" if "extension" in cols else "''"
+    query = (
+        f"SELECT id, mission_id, {drive_col}, path, filename, {ext_col}, size_bytes, "
+        f"created_at, file_hash, visual_hash, {tag_col} "
+        f"FROM filerecord_legacy WHERE id > ? ORDER BY id LIMIT ?"
+    )
+
+    migrated = 0
+    last_id = 0
+    with Session(engine) as session:
+        catalog = Catalog(session)
+        while True:
+            rows = session.connection().exec_driver_sql(query, (last_id, BATCH)).fetchall()
+            if not rows:
+                break
+            batch = []
+            for (row_id, mission_id, drive, path, filename, ext, size, created, f_hash, v_hash, tag) in rows:
+                filename = filename or os.path.basename(path)
+                batch.append({
+                    "id": row_id, "mission_id": mission_id,
+                    "drive_id": catalog.drive_id(drive or _guess_drive(path)),
+                    "dir_id": catalog.dir_id(os.path.dirname(path)),
+                    "filename": filename,
+                    "ext_id": catalog.ext_id(ext if ext is not None else os.path.splitext(filename)[1].lower()),
+                    "size_bytes": size or 0, "created_at": created or 0.0,
+                    "digest": to_digest(f_hash), "visual_hash": v_hash, "tag": tag or "UNTAGGED",
+                })
+            session.execute(insert(FileRecord), batch)
+            session.commit()
+            migrated += len(rows)
+            last_id = rows[-1][0]
+            print(f"   ...{migrated} records converted")
+
+        session.connection().exec_driver_sql("DROP TABLE filerecord_legacy")
+        session.commit()
+
+    # Hand the freed pages back to the filesystem
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+    print(f"✅ [Migrate] {migrated} records converted to the compact layout.")
+    return True
+
+if __name__ == "__main__":
+    # Usage: SENTRY_DB_PATH=/data/sentry.db python -m app.database.migrate
+    from app.database.models import init_db
+    init_db()
@@ -1,5 +1,6 @@
 import os
 from typing import Optional
+from sqlalchemy import Index, inspect, text
 from sqlmodel import Field, SQLModel, create_engine
 
 sqlite_file_name = os.getenv("SENTRY_DB_PATH", "/data/sentry.db")
@@ -11,19 +12,243 @@ class ScanMission(SQLModel, table=True):
     timestamp: float
     root_paths: str
     status: str = "PENDING"
+    metrics_json: Optional[str] = None  # Per-stage timers/counters (see app/core/metrics.py)
+    master_packs: Optional[str] = None  # ";"-joined fingerprint pack names protecting this mission
+    checkpoint_json: Optional[str] = None  # Per-root walk cursors (see app/core/checkpoint.py)
+    estimate_json: Optional[str] = None  # Sampled reclaimable-space estimate (mode="estimate")
+
+class WatchedRoot(SQLModel, table=True):
+    """A MASTER root kept fresh by the change-feed watcher (app/core/watcher.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    path: str = Field(index=True, unique=True)
+    mission_id: int = Field(foreign_key="scanmission.id")  # Owns the rows the watcher adds
+    created_at: float
+
+class ReaperJournal(SQLModel, table=True):
+    """One Reaper action on disk: the undo/purge manifest (see app/core/quarantine.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    mission_id: int = Field(foreign_key="scanmission.id", index=True)
+    action: str  # "DELETE" (os.remove/rmtree), "QUARANTINE" (renamed aside), "HARDLINK"/"REFLINK" (consolidated)
+    status: str = Field(index=True)  # DELETED | QUARANTINED | RESTORED | PURGED | LINKED
+    original_path: str
+    stored_path: Optional[str] = None  # Location inside .sentry_quarantine
+    keeper_path: Optional[str] = None  # MASTER copy a consolidated file now points to
+    drive_id: int = Field(foreign_key="drive.id")
+    digest: Optional[bytes] = None  # Files only
+    size_bytes: int
+    files: int = 1  # > 1 for whole-folder (tree) entries
+    manifest_json: Optional[str] = None  # Trees: index rows to restore, [relpath, size, md5 hex, mtime, visual]
+    created_at: float
+    finished_at: Optional[float] = None  # Restored / purged
+
+# --- LOOKUP TABLES (see app/database/catalog.py) ---
+# Strings that used to repeat on every FileRecord row are stored once here.
+
+class Drive(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+
+class Extension(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)  # ".jpg", "" when none
+
+class Directory(SQLModel, table=True):
+    __table_args__ = (Index("ix_directory_parent_name", "parent_id", "name"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    parent_id: Optional[int] = Field(default=None, foreign_key="directory.id")
+    name: str  # One path component; the filesystem root is stored as "/"
+    # Merkle summary of the subtree as last scanned (see app/core/merkle.py)
+    tree_digest: Optional[bytes] = Field(default=None, index=True)
+    tree_bytes: Optional[int] = None
+    tree_files: Optional[int] = None
+    tree_tag: Optional[str] = None
+    # Subtree disk usage from the index (see app/core/usage.py)
+    usage_bytes: Optional[int] = None
+    usage_files: Optional[int] = None
+    usage_dup_bytes: Optional[int] = None
+    usage_covered_bytes: Optional[int] = None
 
 class FileRecord(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     mission_id: int = Field(foreign_key="scanmission.id")
-    drive_id: str = Field(index=True)
-    path: str
+    drive_id: int = Field(foreign_key="drive.id")
+    dir_id: int = Field(foreign_key="directory.id", index=True)
     filename: str
-    extension: str
+    ext_id: int = Field(foreign_key="extension.id")
     size_bytes: int
+    mtime: Optional[float] = None  # st_mtime at fingerprint time (watcher/reconcile change detection)
     created_at: float
-    file_hash: Optional[str] = Field(index=True)
+    digest: Optional[bytes] = Field(default=None, index=True)  # Raw 16-byte MD5
     visual_hash: Optional[str] = None
     tag: str  # <--- CRITICAL NEW FIELD
 
+    @property
+    def file_hash(self) -> Optional[str]:
+        return self.digest.hex() if self.digest else None
+
+class FileChunk(SQLModel, table=True):
+    """Content-defined chunks of large files (see app/core/chunking.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_id: int = Field(foreign_key="filerecord.id", index=True)
+    digest: bytes = Field(index=True)  # 8-byte BLAKE2b of the chunk
+    size: int
+
+class DocSignature(SQLModel, table=True):
+    """MinHash of a text document (see app/core/similarity.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_id: int = Field(foreign_key="filerecord.id", index=True)
+    signature: bytes  # 128 x uint32
+
+class DocBand(SQLModel, table=True):
+    """LSH banding table: documents sharing a bucket are candidate near-duplicates."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_id: int = Field(foreign_key="filerecord.id", index=True)
+    bucket: int = Field(index=True)  # 64-bit hash of (band number, band rows)
+
+# --- DUPLICATE STATISTICS (see app/core/dupstats.py) ---
+# Kept current by triggers on filerecord, so every writer (scans, fast ingest, remote
+# agents, watcher, Reaper) updates them without a regroup of the whole index.
+
+SIZE_BUCKETS = [64 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 4 * 1024 ** 3]  # Upper bounds; last bucket open
+
+class HashGroup(SQLModel, table=True):
+    """Every copy of one content: the Reaper's GROUP BY digest, maintained incrementally."""
+    __table_args__ = {"sqlite_with_rowid": False}
+    digest: bytes = Field(primary_key=True)
+    size_bytes: int
+    copies: int
+    masters: int  # Copies tagged MASTER
+
+class DupStat(SQLModel, table=True):
+    """Index totals per (drive, extension, size bucket); dup_* = files with another copy anywhere."""
+    __table_args__ = {"sqlite_with_rowid": False}
+    drive_id: int = Field(primary_key=True)
+    ext_id: int = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)  # Index into SIZE_BUCKETS (len = the open-ended last bucket)
+    files: int = 0
+    bytes: int = 0
+    dup_files: int = 0
+    dup_bytes: int = 0
+
+def _create_triggers():
+    # Raw DELETEs (Reaper trees, watcher, ingest) never orphan per-file rows, and a reused
+    # rowid never inherits a deleted file's chunks or signature
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS filechunk_cascade AFTER DELETE ON filerecord "
+            "BEGIN DELETE FROM filechunk WHERE file_id = OLD.id; END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS docsignature_cascade AFTER DELETE ON filerecord "
+            "BEGIN DELETE FROM docsignature WHERE file_id = OLD.id; DELETE FROM docband WHERE file_id = OLD.id; END"
+        ))
+
+def _create_search_index():
+    # FTS5 over filename, directory path and extension (see app/core/search.py). The
+    # table holds its own copy of the text, so the delete trigger can drop a row by id.
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS filesearch USING fts5("
+            "name, path, ext, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text("CREATE TABLE IF NOT EXISTS searchstale (id INTEGER PRIMARY KEY)"))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS filesearch_delete AFTER DELETE ON filerecord "
+            "BEGIN DELETE FROM filesearch WHERE rowid = OLD.id; END"
+        ))
+        # Renames (watcher) keep their id, so the watermark would never see them again
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS filesearch_rename AFTER UPDATE OF dir_id, filename ON filerecord "
+            "BEGIN DELETE FROM filesearch WHERE rowid = OLD.id; INSERT OR IGNORE INTO searchstale (id) VALUES (NEW.id); END"
+        ))
+
+def _bucket(size: str) -> str:
+    return "CASE " + " ".join(f"WHEN {size} < {b} THEN {i}" for i, b in enumerate(SIZE_BUCKETS)) + f" ELSE {len(SIZE_BUCKETS)} END"
+
+def _stats_remove(old: str) -> str:
+    """Trigger statements taking row `old` (OLD/NEW) out of hashgroup/dupstat."""
+    return f"""
+        UPDATE dupstat SET files = files - 1, bytes = bytes - {old}.size_bytes,
+            dup_files = dup_files - (SELECT count(*) FROM hashgroup WHERE digest = {old}.digest AND copies > 1),
+            dup_bytes = dup_bytes - {old}.size_bytes * (SELECT count(*) FROM hashgroup WHERE digest = {old}.digest AND copies > 1)
+        WHERE drive_id = {old}.drive_id AND ext_id = {old}.ext_id AND bucket = {_bucket(f"{old}.size_bytes")};
+        UPDATE hashgroup SET copies = copies - 1, masters = masters - ({old}.tag = 'MASTER') WHERE digest = {old}.digest;
+        UPDATE dupstat SET dup_files = dup_files - 1, dup_bytes = dup_bytes - {old}.size_bytes
+        WHERE (SELECT copies FROM hashgroup WHERE digest = {old}.digest) = 1
+          AND (drive_id, ext_id) = (SELECT drive_id, ext_id FROM filerecord WHERE digest = {old}.digest AND id != {old}.id LIMIT 1)
+          AND bucket = {_bucket(f"{old}.size_bytes")};
+        DELETE FROM hashgroup WHERE digest = {old}.digest AND copies = 0;"""
+
+def _stats_add(new: str) -> str:
+    """Trigger statements adding row `new` to hashgroup/dupstat."""
+    return f"""
+        INSERT INTO hashgroup (digest, size_bytes, copies, masters)
+        SELECT {new}.digest, {new}.size_bytes, 1, {new}.tag = 'MASTER' WHERE {new}.digest IS NOT NULL
+        ON CONFLICT (digest) DO UPDATE SET copies = copies + 1, masters = masters + excluded.masters;
+        INSERT INTO dupstat (drive_id, ext_id, bucket, files, bytes, dup_files, dup_bytes)
+        SELECT {new}.drive_id, {new}.ext_id, {_bucket(f"{new}.size_bytes")}, 1, {new}.size_bytes, d, d * {new}.size_bytes
+        FROM (SELECT count(*) AS d FROM hashgroup WHERE digest = {new}.digest AND copies > 1) WHERE true
+        ON CONFLICT (drive_id, ext_id, bucket) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes,
+            dup_files = dup_files + excluded.dup_files, dup_bytes = dup_bytes + excluded.dup_bytes;
+        UPDATE dupstat SET dup_files = dup_files + 1, dup_bytes = dup_bytes + {new}.size_bytes
+        WHERE (SELECT copies FROM hashgroup WHERE digest = {new}.digest) = 2
+          AND (drive_id, ext_id) = (SELECT drive_id, ext_id FROM filerecord WHERE digest = {new}.digest AND id != {new}.id LIMIT 1)
+          AND bucket = {_bucket(f"{new}.size_bytes")};"""
+
+def _create_dup_stats():
+    # A copy turning the group's count from 1 to 2 (or back) flips the other copy's dup status too
+    # (same digest, same size: same bucket)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_hashgroup_wasted ON hashgroup (size_bytes * (copies - 1)) WHERE copies > 1"
+        ))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS dupstats_insert AFTER INSERT ON filerecord BEGIN {_stats_add('NEW')} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS dupstats_delete AFTER DELETE ON filerecord BEGIN {_stats_remove('OLD')} END"))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS dupstats_update AFTER UPDATE OF digest, size_bytes, tag, drive_id, ext_id "
+            "ON filerecord WHEN OLD.digest IS NOT NEW.digest OR OLD.size_bytes != NEW.size_bytes OR OLD.tag != NEW.tag "
+            "OR OLD.drive_id != NEW.drive_id OR OLD.ext_id != NEW.ext_id "
+            f"BEGIN {_stats_remove('OLD')} {_stats_add('NEW')} END"
+        ))
+        # Databases indexed before the tables existed (or by the legacy migration) start from one full pass
+        if conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM dupstat) AND EXISTS (SELECT 1 FROM filerecord)")).scalar():
+            conn.execute(text(
+                "INSERT INTO hashgroup (digest, size_bytes, copies, masters) "
+                "SELECT digest, min(size_bytes), count(*), sum(tag = 'MASTER') FROM filerecord "
+                "WHERE digest IS NOT NULL GROUP BY digest"
+            ))
+            conn.execute(text(
+                "INSERT INTO dupstat (drive_id, ext_id, bucket, files, bytes, dup_files, dup_bytes) "
+                f"SELECT f.drive_id, f.ext_id, {_bucket('f.size_bytes')} AS b, count(*), sum(f.size_bytes), "
+                "       sum(coalesce(g.copies, 0) > 1), sum(CASE WHEN g.copies > 1 THEN f.size_bytes ELSE 0 END) "
+                "FROM filerecord f LEFT JOIN hashgroup g ON g.digest = f.digest GROUP BY f.drive_id, f.ext_id, b"
+            ))
+
+def _add_missing_columns():
+    """
+    create_all() never alters existing tables, so databases from older
+    releases are topped up here with any new (nullable) columns and their indexes.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
 def init_db():
+    # Pre-compact databases (path/hex-hash rows) are converted in place first
+    from app.database.migrate import migrate_legacy_layout
+    migrate_legacy_layout()
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _create_triggers()
+    _create_search_index()
+    _create_dup_stats()
@@ -1,8 +1,9 @@
 import sys
 import os
 from datetime import datetime
-from sqlmodel import Session, select, func
-from app.database.models import FileRecord, engine
+from sqlmodel import Session
+from app.database.models import engine
+from app.core.export import duplicate_groups
 
 def generate_report():
     """Generates a text report and returns the filename."""
@@ -10,30 +11,24 @@ def generate_report():
     report_filename = f"mission_report_{timestamp}.txt"
     
     with Session(engine) as session:
-        statement = (
-            select(FileRecord.file_hash, func.count(FileRecord.id))
-            .group_by(FileRecord.file_hash)
-            .having(func.count(FileRecord.id) > 1)
-        )
-        duplicates = session.exec(statement).all()
+        # Group count from the summary table; groups and their copies stream in pages
+        total = session.connection().exec_driver_sql("SELECT count(*) FROM hashgroup WHERE copies > 1").scalar()
         
         with open(report_filename, "w", encoding="utf-8") as f:
             f.write(f"PROJECT SENTRY - DUPLICATE FILE REPORT\n")
             f.write(f"Generated: {datetime.now()}\n")
-            f.write(f"Total Duplicate Sets Found: {len(duplicates)}\n")
+            f.write(f"Total Duplicate Sets Found: {total}\n")
             f.write("="*60 + "\n\n")
 
-            if not duplicates:
+            if not total:
                 f.write("No duplicates found.\n")
             else:
-                for file_hash, count in duplicates:
-                    if not file_hash: continue
-                    f.write(f"MATCH GROUP (Hash: {file_hash[:8]}... | Count: {count})\n")
+                for group in duplicate_groups(session):
+                    f.write(f"MATCH GROUP (Hash: {group['hash'][:8]}... | Count: {group['copies']})\n")
                     
-                    files = session.exec(select(FileRecord).where(FileRecord.file_hash == file_hash)).all()
-                    for file_record in files:
-                        size_mb = file_record.size_bytes / (1024 * 1024)
-                        f.write(f"   - {file_record.path} ({size_mb:.2f} MB)\n")
+                    size_mb = group["size"] / (1024 * 1024)
+                    for copy in group["files"]:
+                        f.write(f"   - {copy['path']} ({size_mb:.2f} MB)\n")
                     f.write("-" * 40 + "\n")
     
     return report_filename
@@ -1,11 +1,18 @@
 from textual.app import App, ComposeResult
-from textual.widgets import Header, Footer, DirectoryTree, Button, Label, Input, Static
+from textual.widgets import Header, Footer, Button, Label, Input, Static
 from textual.containers import Container, Horizontal, Vertical
 from textual.screen import ModalScreen
-from textual import on
+from textual.worker import Worker, WorkerState
+from textual import on, work
 import os
+import time
 import subprocess
 from app.workers.scanner import run_scanner
+from app.tui.paged_tree import PagedDirectoryTree
+
+# progress_cb fires every 100 files from the scanner's threads; the status panel is
+# redrawn from the latest event at most this many times a second.
+REFRESH_HZ = float(os.getenv("SENTRY_TUI_REFRESH_HZ", "4"))
 
 class NetworkMountModal(ModalScreen):
     """Screen for mounting a remote drive."""
@@ -87,12 +94,15 @@ class SentryApp(App):
     ]
 
     selected_paths = set()
+    scan_worker = None
+    _progress = None  # Latest progress_cb event, written by the scan thread
+    _rate = None      # (ts, scanned, bytes, files/s, bytes/s) of the last redraw
 
     def compose(self) -> ComposeResult:
         yield Header()
         yield Container(
             Label("Navigate and Press [SPACE] to Select Folders. Press [M] to Mount Network Drive."),
-            DirectoryTree("/", id="tree_panel"),
+            PagedDirectoryTree("/", id="tree_panel"),
             id="main_container"
         )
         yield Static("Ready.", id="status_panel")
@@ -107,7 +117,7 @@ class SentryApp(App):
 
     def action_toggle_select(self):
         tree = self.query_one("#tree_panel")
-        if tree.cursor_node:
+        if tree.cursor_node and tree.cursor_node.data and not tree.cursor_node.data.more:
             path = tree.cursor_node.data.path
             path_str = str(path)
             
@@ -130,14 +140,63 @@ class SentryApp(App):
         if not self.selected_paths:
             self.query_one("#status_panel").update("NO TARGETS SELECTED!")
             return
-        
-        self.query_one("#status_panel").update("🚀 SCANNING INITIATED... Check Logs.")
-        
-        # Launch Scanner in Background
-        # In a real app we'd use a Worker, strictly calling the function here for V1
-        targets = list(self.selected_paths)
-        run_scanner(targets)
-        self.query_one("#status_panel").update("✅ Scan Complete.")
+        if self.scan_worker is not None and self.scan_worker.is_running:
+            self.query_one("#status_panel").update("A scan is already running.")
+            return
+
+        self.query_one("#status_panel").update("🚀 SCANNING INITIATED...")
+        self._progress, self._rate = None, None
+        self._ticker = self.set_interval(1 / REFRESH_HZ, self.render_progress)
+        self.scan_worker = self.run_scan(list(self.selected_paths))
+
+    @work(thread=True, exclusive=True, group="scan", exit_on_error=False)
+    def run_scan(self, targets):
+        # Runs off the UI thread; events are only stored here and drawn by render_progress
+        return run_scanner(targets, progress_cb=self.on_scan_progress)
+
+    def on_scan_progress(self, payload: dict):
+        if payload["event"] in ("progress", "complete"):
+            self._progress = payload
+
+    def render_progress(self):
+        p = self._progress
+        if p is None:
+            return
+        now = time.monotonic()
+        scanned, read = p["scanned"], p.get("bytes", 0)
+        if self._rate is None:
+            self._rate = (now, scanned, read, 0.0, 0.0)
+        else:
+            ts, last_scanned, last_read, fps, bps = self._rate
+            if now > ts:
+                # Smoothed, so a burst of resumed (skipped) files does not make it jump
+                fps = 0.7 * fps + 0.3 * (scanned - last_scanned) / (now - ts)
+                bps = 0.7 * bps + 0.3 * (read - last_read) / (now - ts)
+                self._rate = (now, scanned, read, fps, bps)
+        _, _, _, fps, bps = self._rate
+        current = p.get("current") or ""
+        if len(current) > 70:
+            current = "..." + current[-67:]
+        self.query_one("#status_panel").update(
+            f"🚀 SCANNING: {scanned:,} files ({fps:,.0f} files/s, {bps / 2**20:,.1f} MB/s)\n"
+            f"Indexed {p['indexed']:,} | Skipped {p['skipped']:,} | Errors {p['errors']:,}\n{current}"
+        )
+
+    def on_worker_state_changed(self, event: Worker.StateChanged):
+        if event.worker is not self.scan_worker or event.state not in (
+                WorkerState.SUCCESS, WorkerState.ERROR, WorkerState.CANCELLED):
+            return
+        self._ticker.stop()
+        if event.state == WorkerState.SUCCESS:
+            p = self._progress or {}
+            self.query_one("#status_panel").update(
+                f"✅ Scan Complete (mission {event.worker.result}): {p.get('scanned', 0):,} files, "
+                f"{p.get('indexed', 0):,} indexed, {p.get('errors', 0):,} errors."
+            )
+        elif event.state == WorkerState.ERROR:
+            self.query_one("#status_panel").update(f"❌ Scan failed: {event.worker.error}")
+        else:
+            self.query_one("#status_panel").update("Scan cancelled.")
 
 if __name__ == "__main__":
     import threading
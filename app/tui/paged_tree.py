@@ -0,0 +1,145 @@
+import os
+import threading
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from textual import work
+from textual.widgets import Tree
+from textual.widgets.tree import TreeNode
+
+# DirectoryTree lists and sorts a whole folder before showing any of it, which stalls
+# on folders with hundreds of thousands of entries. This tree reads PAGE entries at a
+# time in a worker thread (os.scandir, no stat calls), sorts each page on its own
+# (folders first) and ends the folder with a "more" row that loads the next page.
+# Each expanded folder keeps its scandir iterator open between pages, so every entry is
+# read once and none is skipped or repeated; collapsing the folder closes it.
+PAGE = int(os.getenv("SENTRY_TUI_PAGE", "500"))
+
+
+@dataclass
+class Entry:
+    path: Path
+    is_dir: bool
+    loaded: bool = False
+    more: bool = False  # The "more" row at the end of a partly listed folder
+    listing: Optional[object] = None  # Open os.scandir iterator while entries remain
+    carry: Optional[os.DirEntry] = None  # Entry read ahead to know whether more follow
+    listed: int = 0
+    epoch: int = 0  # Bumped when the listing is dropped: pages in flight are discarded
+
+
+class PagedDirectoryTree(Tree[Entry]):
+    def __init__(self, path: str, page: int = PAGE, **kwargs):
+        self.path = Path(path)
+        self.page = page
+        self._lock = threading.Lock()  # Listings are read by workers, closed by the UI thread
+        self._entries = {}  # id(Entry) -> Entry, for those with an open listing
+        self._generation = 0  # Bumped by reload(): pages listed before it are dropped
+        super().__init__(str(self.path), data=Entry(self.path, True), **kwargs)
+
+    def on_mount(self):
+        self.root.expand()
+
+    def reload(self):
+        """Forgets every listed folder and lists the root again (after a mount)."""
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._close(entry)
+            self._generation += 1
+        self.reset(str(self.path), Entry(self.path, True))
+        self.root.expand()
+
+    def on_unmount(self):
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._close(entry)
+
+    def _close(self, entry: Entry):
+        """Caller holds the lock."""
+        if entry.listing is not None:
+            entry.listing.close()
+        entry.listing, entry.carry = None, None
+        entry.epoch += 1
+        self._entries.pop(id(entry), None)
+
+    def on_tree_node_expanded(self, event: Tree.NodeExpanded[Entry]):
+        event.stop()
+        entry = event.node.data
+        if entry is not None and entry.is_dir and not entry.loaded:
+            entry.loaded = True
+            self._load_page(event.node, self._generation, entry.epoch, first=True)
+
+    def on_tree_node_collapsed(self, event: Tree.NodeCollapsed[Entry]):
+        event.stop()
+        entry = event.node.data
+        if entry is None or entry.listing is None and entry.carry is None:
+            return  # Fully listed (or never): keep what is shown
+        with self._lock:
+            self._close(entry)
+        entry.loaded, entry.listed = False, 0
+        event.node.remove_children()  # Listed again from the start on the next expand
+
+    def on_tree_node_selected(self, event: Tree.NodeSelected[Entry]):
+        entry = event.node.data
+        if entry is not None and entry.more:
+            event.stop()
+            entry.more = False  # Selected twice: loaded once
+            event.node.set_label("... loading")
+            folder = event.node.parent
+            self._load_page(folder, self._generation, folder.data.epoch, placeholder=event.node)
+
+    @work(thread=True, group="tree")
+    def _load_page(self, node: TreeNode[Entry], generation: int, epoch: int, first: bool = False,
+                   placeholder: TreeNode[Entry] = None):
+        entry = node.data
+        with self._lock:
+            if entry.epoch != epoch or generation != self._generation:
+                return  # Collapsed or reloaded before this worker ran
+            if first:
+                try:
+                    entry.listing = os.scandir(entry.path)
+                    self._entries[id(entry)] = entry
+                except OSError:
+                    entry.listing = None
+            rows, more = self._next_page(entry)
+        self.app.call_from_thread(self._add_page, node, generation, epoch, rows, more, placeholder)
+
+    def _next_page(self, entry: Entry) -> Tuple[List[Tuple[str, bool]], bool]:
+        """(name, is_dir) of the next `page` entries, sorted folders first, and whether more follow."""
+        def is_dir(e):
+            try:
+                return e.is_dir()
+            except OSError:
+                return False
+
+        batch = [entry.carry] if entry.carry is not None else []
+        entry.carry = None
+        if entry.listing is not None:
+            try:
+                batch += islice(entry.listing, self.page + 1 - len(batch))
+            except OSError:
+                pass
+        more = len(batch) > self.page
+        if more:
+            entry.carry = batch.pop()
+        elif entry.listing is not None:
+            entry.listing.close()  # Exhausted
+            entry.listing = None
+            self._entries.pop(id(entry), None)
+        entry.listed += len(batch)
+        rows = sorted(((e.name, is_dir(e)) for e in batch), key=lambda r: (not r[1], r[0].lower()))
+        return rows, more
+
+    def _add_page(self, node: TreeNode[Entry], generation: int, epoch: int, rows, more: bool, placeholder=None):
+        entry = node.data
+        if entry.epoch != epoch or generation != self._generation:
+            return  # Collapsed or reloaded meanwhile
+        if placeholder is not None:
+            placeholder.remove()
+        for name, is_dir in rows:
+            node.add(name, data=Entry(entry.path / name, is_dir), allow_expand=is_dir)
+        if more:
+            node.add_leaf(f"... more ({entry.listed:,} listed, select to load {self.page:,})",
+                          data=Entry(entry.path, False, more=True))
@@ -0,0 +1,99 @@
+import sys
+import os
+
+# --- PATH HACK ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+# -----------------
+
+import time
+import argparse
+import requests
+
+from app.core.scanner import Scanner
+from app.core.remote import encode_batch
+from app.workers.scanner import IGNORE_LIST
+
+# Remote scan agent: runs next to the disks (NAS, another PC), fingerprints locally
+# with the same scanner core and ships gzip'd index batches to the Sentry server.
+# Nothing but the index crosses the network.
+#
+#   python app/workers/agent.py --server http://sentry:8000 --drive nas-photos /volume1/photos
+
+BATCH_RECORDS = 5000
+BATCH_SECONDS = 2.0
+RETRIES = 5
+
+
+class Uplink:
+    def __init__(self, server: str, user: str, password: str):
+        self.server = server.rstrip("/")
+        self.http = requests.Session()
+        self.http.auth = (user, password)
+
+    def post(self, path: str, **kwargs) -> dict:
+        for attempt in range(RETRIES):
+            try:
+                r = self.http.post(self.server + path, timeout=60, **kwargs)
+                if r.status_code < 500:
+                    r.raise_for_status()  # 4xx: auth/request error, retrying won't help
+                    return r.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"⚠️  {e}")
+            time.sleep(2 ** attempt)
+        raise RuntimeError(f"Server unreachable after {RETRIES} attempts: {path}")
+
+
+def run_agent(root: str, uplink: Uplink, drive: str, tag: str = "TARGET",
+              root_as: str = None, mission_id: int = None) -> int:
+    root = os.path.abspath(root)
+    opened = uplink.post("/api/ingest", json={
+        "drive": drive, "tag": tag, "root": root_as, "mission_id": mission_id,
+    })
+    mission_id = opened["mission_id"]
+    print(f"📡 Mission {mission_id}: {root} -> {opened['root']} ({tag})")
+
+    scanner = Scanner(mission_id=mission_id, ignore=IGNORE_LIST)
+    batch, seq, sent, last_flush = [], 0, 0, time.monotonic()
+
+    def flush():
+        nonlocal batch, seq, sent, last_flush
+        if batch:
+            body = encode_batch(batch)
+            uplink.post(f"/api/ingest/{mission_id}/batch", params={"drive": drive, "seq": seq}, data=body,
+                        headers={"Content-Type": "application/gzip"})
+            sent += len(batch)
+            print(f"   batch {seq}: {len(batch)} files, {len(body) // 1024} KiB ({sent} total)")
+            seq += 1
+            batch = []
+        last_flush = time.monotonic()
+
+    for res in scanner.fingerprints(root):
+        batch.append({
+            "p": os.path.relpath(res["path"], root), "s": res["size"], "m": res["mtime"],
+            "h": res["file_hash"], "v": res["visual_hash"],
+        })
+        if len(batch) >= BATCH_RECORDS or time.monotonic() - last_flush >= BATCH_SECONDS:
+            flush()
+    flush()
+
+    done = uplink.post(f"/api/ingest/{mission_id}/complete", params={"drive": drive})
+    print(f"✅ {sent} files indexed, mission {mission_id} {done['status']}")
+    return mission_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Project Sentry remote scan agent")
+    parser.add_argument("root", help="Directory to fingerprint on this host")
+    parser.add_argument("--server", required=True, help="Sentry server URL, e.g. http://sentry:8000")
+    parser.add_argument("--drive", required=True, help="Drive name the files are recorded under")
+    parser.add_argument("--tag", default="TARGET", choices=("MASTER", "TARGET"))
+    parser.add_argument("--root-as", help="Path of this root as seen by the server (e.g. its SMB mount)")
+    parser.add_argument("--mission-id", type=int, help="Add this drive to an existing mission")
+    parser.add_argument("--user", default=os.getenv("SENTRY_USER", "admin"))
+    parser.add_argument("--password", default=os.getenv("SENTRY_PASS", "change-this-now"))
+    args = parser.parse_args()
+
+    run_agent(args.root, Uplink(args.server, args.user, args.password), args.drive,
+              tag=args.tag, root_as=args.root_as, mission_id=args.mission_id)
@@ -7,67 +7,35 @@ parent_dir = os.path.dirname(os.path.dirname(current_dir))
 sys.path.append(parent_dir)
 # -----------------
 
-from sqlmodel import Session, select, func
-from app.database.models import FileRecord, engine
+import argparse
+from app.core.export import write_export
 
 # === CONFIGURATION ===
 MASTER_DRIVE_ID = "My Book"  # The Survivor
 # =====================
 
-def generate_kill_list():
+def generate_kill_list(fmt: str = "ndjson", compress: bool = False, report_file: str = None,
+                       keep_drive: str = MASTER_DRIVE_ID):
     print(f"💀 INITIALIZING REAPER PROTOCOL (Dry Run)...")
-    print(f"🛡️  MASTER DRIVE (PROTECTED): {MASTER_DRIVE_ID}")
+    print(f"🛡️  MASTER DRIVE (PROTECTED): {keep_drive}")
     
-    report_file = "kill_list_preview.txt"
-    bytes_to_save = 0
-    files_to_delete = 0
-    
-    with Session(engine) as session:
-        # 1. Find all hashes that have duplicates
-        # (This SQL is optimized for speed)
-        statement = (
-            select(FileRecord.file_hash)
-            .group_by(FileRecord.file_hash)
-            .having(func.count(FileRecord.id) > 1)
-        )
-        duplicate_hashes = session.exec(statement).all()
-        
-        print(f"🔍 Analyzing {len(duplicate_hashes)} duplicate groups...")
-        
-        with open(report_file, "w") as f:
-            f.write("PROJECT SENTRY: DELETION PREVIEW\n")
-            f.write(f"Master Drive Rule: KEEP files on '{MASTER_DRIVE_ID}'\n")
-            f.write("=" * 60 + "\n\n")
-            
-            for file_hash in duplicate_hashes:
-                # Get all files in this group
-                files = session.exec(select(FileRecord).where(FileRecord.file_hash == file_hash)).all()
-                
-                # Sort them: Keepers vs. Candidates
-                keepers = [x for x in files if x.drive_id == MASTER_DRIVE_ID]
-                candidates = [x for x in files if x.drive_id != MASTER_DRIVE_ID]
-                
-                # LOGIC CHECK:
-                # We only delete if we actually HAVE a safe copy on the Master Drive.
-                if keepers and candidates:
-                    f.write(f"HASH: {file_hash[:8]}...\n")
-                    
-                    for keep in keepers:
-                        f.write(f"  ✅ KEEP: {keep.path}\n")
-                        
-                    for kill in candidates:
-                        f.write(f"  ❌ KILL: {kill.path}\n")
-                        bytes_to_save += kill.size_bytes
-                        files_to_delete += 1
-                        
-                    f.write("-" * 40 + "\n")
+    # Same streaming exporter as GET /api/export/kill-list: one row per file to delete,
+    # with its hash and the copy kept on the master drive
+    report_file = report_file or f"kill_list_preview.{fmt}" + (".gz" if compress else "")
+    stats = write_export("kill-list", report_file, fmt, compress, keep_drive=keep_drive)
 
     # Summary
-    gb_saved = bytes_to_save / (1024**3)
+    gb_saved = stats["bytes"] / (1024**3)
     print(f"\n✅ ANALYSIS COMPLETE.")
     print(f"📄 Preview saved to: {report_file}")
     print(f"📉 Potential Storage Reclaimed: {gb_saved:.2f} GB")
-    print(f"🗑️  Files marked for death: {files_to_delete}")
+    print(f"🗑️  Files marked for death: {stats['rows']}")
 
 if __name__ == "__main__":
-    generate_kill_list()
+    parser = argparse.ArgumentParser(description="Project Sentry kill-list preview (nothing is deleted)")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--output", help="Default: kill_list_preview.<format>[.gz]")
+    parser.add_argument("--keep-drive", default=MASTER_DRIVE_ID, help="Drive whose copies are kept")
+    args = parser.parse_args()
+    generate_kill_list(args.format, args.gzip, args.output, args.keep_drive)
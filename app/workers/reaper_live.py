@@ -8,7 +8,8 @@ sys.path.append(parent_dir)
 # --------------------------------------
 
 from sqlmodel import Session, select, func
-from app.database.models import FileRecord, engine
+from app.database.models import Drive, FileRecord, engine
+from app.database.catalog import Catalog
 
 # === CONFIGURATION ===
 MASTER_DRIVE_ID = "My Book"
@@ -33,29 +34,33 @@ def execute_reaper():
         # 1. Get the list of duplicate groups
         print("🔍 Scanning database for targets...")
         statement = (
-            select(FileRecord.file_hash)
-            .group_by(FileRecord.file_hash)
+            select(FileRecord.digest)
+            .where(FileRecord.digest.is_not(None))
+            .group_by(FileRecord.digest)
             .having(func.count(FileRecord.id) > 1)
         )
         duplicate_hashes = session.exec(statement).all()
+        master_drive = session.exec(select(Drive.id).where(Drive.name == MASTER_DRIVE_ID)).first()
+        catalog = Catalog(session)
         total_groups = len(duplicate_hashes)
         
         print(f"🎯 Found {total_groups} duplicate sets. Starting deletion...")
         
-        for index, file_hash in enumerate(duplicate_hashes):
+        for index, digest in enumerate(duplicate_hashes):
             # Fetch all files in this group
-            files = session.exec(select(FileRecord).where(FileRecord.file_hash == file_hash)).all()
+            files = session.exec(select(FileRecord).where(FileRecord.digest == digest)).all()
             
-            keepers = [x for x in files if x.drive_id == MASTER_DRIVE_ID]
-            candidates = [x for x in files if x.drive_id != MASTER_DRIVE_ID]
+            keepers = [x for x in files if x.drive_id == master_drive]
+            candidates = [x for x in files if x.drive_id != master_drive]
             
             # SAFETY CHECK: Only delete if we have a SAFE MASTER COPY
             if keepers and candidates:
                 for target in candidates:
+                    target_path = catalog.path_of(target)
                     try:
                         # A. DELETE FROM DISK
-                        if os.path.exists(target.path):
-                            os.remove(target.path)
+                        if os.path.exists(target_path):
+                            os.remove(target_path)
                         
                         # B. DELETE FROM DATABASE
                         session.delete(target)
@@ -63,10 +68,10 @@ def execute_reaper():
                         # Stats
                         bytes_reclaimed += target.size_bytes
                         deleted_count += 1
-                        print(f"  [DEL] {target.path}")
+                        print(f"  [DEL] {target_path}")
                         
                     except Exception as e:
-                        print(f"  [ERR] Could not delete {target.path}: {e}")
+                        print(f"  [ERR] Could not delete {target_path}: {e}")
                         errors += 1
 
             # Commit changes to DB every 100 groups to save progress
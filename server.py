@@ -1,22 +1,40 @@
 import os
+import json
 import time
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from fastapi import FastAPI, Request, BackgroundTasks, Depends, HTTPException, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlmodel import Session, select, func
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import Session, select
 from pydantic import BaseModel
 
 # Unified Core Imports
-from app.database.models import init_db, engine, ScanMission, FileRecord
+from app.database.models import init_db, engine, ScanMission
 from app.core.drive_manager import DriveManager
 from app.core.scanner import Scanner
 from app.core.reaper import Reaper
 from app.core.janitor import Janitor
-from app.core.reporter import Reporter  # <--- NEW IMPORT
+from app.core.reporter import REPORTS_DIR, REPORT_JOBS, queue_report, build_report, report_filename, report_status
+from app.core.metrics import render_prometheus, save_mission_metrics
+from app.core import profiler
+from app.core.throttle import get_throttle
+from app.core.fingerprint_pack import FingerprintPack, PACKS_DIR, pack_path
+from app.core.ingest import IngestSpool
+from app.core.checkpoint import plan_checkpoint, checkpoint_mode, RESUMABLE_MODES
+from app.core.estimator import Estimator
+from app.core.watcher import WATCHERS, start_watch, stop_watch, restore_watches
+from app.core.remote import decode_batch, open_ingest, merge_batch, finish_ingest
+from app.core.chunking import CHUNK_MIN_FILE, chunk_overlap
+from app.core.similarity import similar_documents
+from app.core.search import search as search_index, sync_search_index
+from app.core.usage import compute_usage, usage_tree
+from app.core.dupstats import dup_stats, file_count
+from app.core.export import EXPORTS, export_stream, export_filename
+from app.core.quarantine import PURGER, HOLD_S, restore, purge, summary as quarantine_summary
 
 app = FastAPI(title="Project Sentry | Command Center")
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,6 +53,14 @@ def get_current_user(credentials: HTTPBasicCredentials = Depends(security)):
 @app.on_event("startup")
 def on_startup():
     init_db()
+    # Missions cut off by a crash/power loss can be resumed from their checkpoint
+    with Session(engine) as session:
+        for mission in session.exec(select(ScanMission).where(ScanMission.status == "RUNNING")).all():
+            mission.status = "INTERRUPTED"
+            session.add(mission)
+        session.commit()
+    restore_watches(watch_scanner)
+    PURGER.start()
     print("🚀 Sentry Command Center Online.")
 
 # --- DATA MODELS ---
@@ -43,32 +69,126 @@ class MountRequest(BaseModel):
     username: str
     password: str
 
+class ThrottleSettings(BaseModel):
+    read_mbps: Optional[float] = None      # Per-device read bandwidth (MB/s); None = unlimited
+    files_per_sec: Optional[float] = None  # Opens/unlinks per second (SMB-friendly)
+    nice: Optional[int] = None             # 0..19 for worker threads
+    ionice_class: Optional[int] = None     # 1=realtime, 2=best-effort, 3=idle
+    ionice_level: Optional[int] = None     # 0..7 within the class
+
+    def apply(self, throttle):
+        # Only touch the knobs the caller actually sent
+        settings = self.model_dump(exclude_unset=True)
+        if "read_mbps" in settings:
+            mbps = settings.pop("read_mbps")
+            settings["read_bps"] = mbps * 1024 * 1024 if mbps else None
+        throttle.update(**settings)
+
 class ScanRequest(BaseModel):
     gold_paths: List[str]
     target_paths: List[str]
+    throttle: Optional[ThrottleSettings] = None
+    master_packs: List[str] = []  # Fingerprint packs protecting this mission (no gold drive needed)
+    mode: str = "index"  # "fast": spill-to-disk ingest, only duplicate groups reach the index; "estimate": sample only
+    schedule: str = "walk"  # "largest": metadata pass first, then hash biggest candidate files first
+    chunking: bool = False  # Content-defined chunks for files >= SENTRY_CHUNK_MIN_FILE (partial duplicates)
+    similarity: bool = False  # MinHash signatures of text documents (near-duplicates, /api/similar)
+
+class WatchRequest(BaseModel):
+    path: str
+
+class IngestRequest(BaseModel):
+    drive: str                         # Name of the remote drive (new Drive row)
+    tag: str = "TARGET"
+    root: Optional[str] = None         # Index path for the agent's root (default /remote/<drive>)
+    mission_id: Optional[int] = None   # Add the drive to an existing mission
+
+class PackRequest(BaseModel):
+    name: str
+    bloom: bool = True
 
 class CleanRequest(BaseModel):
     target_paths: List[str]
+    mode: str = "delete"  # "quarantine": rename into <mount>/.sentry_quarantine, purged after SENTRY_QUARANTINE_HOLD_S
+                          # "consolidate": keep the paths, as reflinks/hardlinks to the MASTER copy
+    link: str = "auto"    # consolidate only: "auto"/"reflink" (copy-on-write, files that cannot be reflinked are
+                          # skipped) or "hardlink": the target then IS the MASTER file (same inode), and an
+                          # in-place write through the target path changes the protected copy
+    verify: bool = True   # Re-stat + sampled block compare against the MASTER copy before deleting
+
+class QuarantineRequest(BaseModel):
+    mission_id: Optional[int] = None
+    ids: List[int] = []                 # Journal entries; all of the mission's when empty
+    older_than_s: Optional[float] = 0   # Purge only: 0 empties the quarantine now
+
+class ProfileRequest(BaseModel):
+    job: str = "scan"             # "scan" or "reaper"
+    interval_ms: int = 10         # Stack sampling period
+    tracemalloc: bool = False     # Also capture top allocations (adds overhead while on)
+    max_duration_s: int = 300     # Auto-stop safety net
+
+def latest_mission_packs():
+    """Fingerprint packs attached to the most recent mission (memory-mapped, cheap to open)."""
+    with Session(engine) as session:
+        latest = session.exec(select(ScanMission).order_by(ScanMission.id.desc())).first()
+    if not latest or not latest.master_packs:
+        return []
+    return [FingerprintPack(pack_path(name)) for name in latest.master_packs.split(";")]
 
 # --- BACKGROUND TASKS ---
-def background_scan_task(gold_paths: List[str], target_paths: List[str], mission_id: int):
-    scanner = Scanner(mission_id=mission_id)
+def background_scan_task(gold_paths: List[str], target_paths: List[str], mission_id: int,
+                         mode: str = "index", schedule: str = "walk", chunking: bool = False,
+                         similarity: bool = False):
+    scanner = Scanner(mission_id=mission_id, chunk_min_file=CHUNK_MIN_FILE if chunking else None,
+                      similarity=similarity)
+    spool = IngestSpool(mission_id, metrics=scanner.metrics) if mode == "fast" else None
     with Session(engine) as session:
         mission = session.get(ScanMission, mission_id)
         mission.status = "RUNNING"
         session.add(mission)
         session.commit()
+        largest_first = schedule == "largest"
         try:
             for path in gold_paths:
                 drive_id = os.path.basename(path)
-                scanner.scan_directory(path, tag="MASTER", drive_id=drive_id)
+                scanner.scan_directory(path, tag="MASTER", drive_id=drive_id, spool=spool, content=not largest_first)
             for path in target_paths:
                 drive_id = os.path.basename(path)
-                scanner.scan_directory(path, tag="TARGET", drive_id=drive_id)
+                scanner.scan_directory(path, tag="TARGET", drive_id=drive_id, spool=spool, content=not largest_first)
+            if largest_first:
+                roots = [(p, "MASTER") for p in gold_paths] + [(p, "TARGET") for p in target_paths]
+                scanner.hash_pending(roots)
+            if spool:
+                packs = [FingerprintPack(pack_path(n)) for n in mission.master_packs.split(";")] if mission.master_packs else []
+                print(f"[Scanner] Fast ingest: {spool.load(packs=packs)}")
+                save_mission_metrics(session, mission, "scanner", scanner.metrics)
             mission.status = "COMPLETE"
         except Exception as e:
             print(f"Scan Error: {e}")
             mission.status = "ERROR"
+        finally:
+            if spool: spool.close()
+        session.add(mission)
+        session.commit()
+        compute_usage(session)  # Duplicate/covered bytes depend on every root, not just this scan
+        session.commit()
+    sync_search_index()  # New rows searchable without the first /api/search paying for them
+
+def background_estimate_task(gold_paths: List[str], target_paths: List[str], mission_id: int):
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        mission.status = "RUNNING"
+        session.add(mission)
+        session.commit()
+        packs = [FingerprintPack(pack_path(n)) for n in mission.master_packs.split(";")] if mission.master_packs else []
+        try:
+            estimator = Estimator(Scanner(mission_id=mission_id), packs=packs)
+            mission.estimate_json = json.dumps(estimator.estimate(target_paths, gold_paths))
+            save_mission_metrics(session, mission, "estimator", estimator.metrics)
+            mission.status = "ESTIMATED"
+        except Exception as e:
+            print(f"Estimate Error: {e}")
+            mission.status = "ERROR"
         session.add(mission)
         session.commit()
 
@@ -94,14 +214,37 @@ def get_drives(user: str = Depends(get_current_user)):
 async def start_scan(req: ScanRequest, background_tasks: BackgroundTasks, user: str = Depends(get_current_user)):
     all_paths = req.gold_paths + req.target_paths
     if not all_paths: return JSONResponse({"error": "No paths selected"}, status_code=400)
+    relative = [p for p in all_paths if not os.path.isabs(p)]
+    if relative: return JSONResponse({"error": f"Paths must be absolute: {', '.join(relative)}"}, status_code=400)
+    if req.mode not in ("index", "fast", "estimate"): return JSONResponse({"error": f"Unknown scan mode: {req.mode}"}, status_code=400)
+    if req.schedule not in ("walk", "largest"): return JSONResponse({"error": f"Unknown schedule: {req.schedule}"}, status_code=400)
+    if req.mode == "fast" and req.schedule == "largest":
+        return JSONResponse({"error": "Fast ingest does not support largest-first scheduling"}, status_code=400)
+    if req.mode == "fast" and (req.chunking or req.similarity):
+        return JSONResponse({"error": "Fast ingest does not keep chunk fingerprints or document signatures"}, status_code=400)
 
     with Session(engine) as session:
-        mission = ScanMission(timestamp=time.time(), root_paths=";".join(all_paths), status="PENDING")
+        for name in req.master_packs:
+            if not os.path.exists(pack_path(name)):
+                return JSONResponse({"error": f"Unknown fingerprint pack: {name}"}, status_code=400)
+        mission = ScanMission(
+            timestamp=time.time(), root_paths=";".join(all_paths), status="PENDING",
+            master_packs=";".join(req.master_packs) or None,
+            checkpoint_json=plan_checkpoint(req.gold_paths, req.target_paths, req.schedule,
+                                            req.chunking, req.similarity, req.mode),
+        )
         session.add(mission)
         session.commit()
         session.refresh(mission)
+
+    if req.throttle:
+        req.throttle.apply(get_throttle(mission.id))
         
-    background_tasks.add_task(background_scan_task, req.gold_paths, req.target_paths, mission.id)
+    if req.mode == "estimate":
+        background_tasks.add_task(background_estimate_task, req.gold_paths, req.target_paths, mission.id)
+    else:
+        background_tasks.add_task(background_scan_task, req.gold_paths, req.target_paths, mission.id,
+                                  req.mode, req.schedule, req.chunking, req.similarity)
     return {"status": "Started", "mission_id": mission.id}
 
 # --- FILESYSTEM BROWSER ---
@@ -139,59 +282,361 @@ async def fs_list(path: str = Query("/mnt/sentry"), user: str = Depends(get_curr
 @app.get("/api/status")
 def get_status(user: str = Depends(get_current_user)):
     with Session(engine) as session:
-        count = session.exec(select(func.count(FileRecord.id))).one()
+        count = file_count(session)  # Polled by the UI: a lookup, not a COUNT over the index
         latest = session.exec(select(ScanMission).order_by(ScanMission.id.desc())).first()
         status = latest.status if latest else "IDLE"
         return {"file_count": count, "status": status}
 
+@app.get("/api/missions/{mission_id}/throttle")
+def read_throttle(mission_id: int, user: str = Depends(get_current_user)):
+    return get_throttle(mission_id).settings()
+
+@app.post("/api/missions/{mission_id}/throttle")
+def update_throttle(mission_id: int, req: ThrottleSettings, user: str = Depends(get_current_user)):
+    # Takes effect on the next read/unlink of the running mission
+    throttle = get_throttle(mission_id)
+    req.apply(throttle)
+    return throttle.settings()
+
+@app.get("/api/missions/{mission_id}/metrics")
+def mission_metrics(mission_id: int, user: str = Depends(get_current_user)):
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        if not mission: raise HTTPException(status_code=404, detail="Mission not found")
+        return json.loads(mission.metrics_json) if mission.metrics_json else {}
+
+@app.get("/api/missions/{mission_id}/estimate")
+def mission_estimate(mission_id: int, user: str = Depends(get_current_user)):
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        if not mission: raise HTTPException(status_code=404, detail="Mission not found")
+        if not mission.estimate_json: return {"status": mission.status}
+        return {"status": mission.status, **json.loads(mission.estimate_json)}
+
+@app.post("/api/missions/{mission_id}/resume")
+def resume_mission(mission_id: int, background_tasks: BackgroundTasks, user: str = Depends(get_current_user)):
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        if not mission: raise HTTPException(status_code=404, detail="Mission not found")
+        if mission.status not in ("INTERRUPTED", "ERROR") or not mission.checkpoint_json:
+            return JSONResponse({"error": f"Mission is {mission.status}, nothing to resume"}, status_code=409)
+        checkpoint = json.loads(mission.checkpoint_json)
+        roots = checkpoint.get("roots", [])
+    mode = checkpoint_mode(checkpoint)
+    if mode not in RESUMABLE_MODES:
+        return JSONResponse({"error": f"{mode} missions keep no walk cursor; start a new one"}, status_code=409)
+    # Completed roots are skipped; the rest continue from their walk cursor (fast ingest walks again)
+    gold = [r["path"] for r in roots if r["tag"] == "MASTER"]
+    targets = [r["path"] for r in roots if r["tag"] == "TARGET"]
+    background_tasks.add_task(background_scan_task, gold, targets, mission_id, mode=mode,
+                              schedule=checkpoint.get("schedule", "walk"), chunking=checkpoint.get("chunking", False),
+                              similarity=checkpoint.get("similarity", False))
+    return {"status": "Resumed", "mission_id": mission_id, "mode": mode,
+            "pending_roots": [r["path"] for r in roots if not r.get("complete")]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(user: str = Depends(get_current_user)):
+    # Prometheus text format (scrape with basic_auth)
+    return render_prometheus()
+
+# --- CONTINUOUS GOLD MASTER INDEXING ---
+def watch_scanner(mission_id: int) -> Scanner:
+    # Gold copies are what partial/near duplicates are measured against: chunk and sign them
+    return Scanner(mission_id=mission_id, adaptive=False, chunk_min_file=CHUNK_MIN_FILE, similarity=True)
+
+@app.get("/api/watch")
+def list_watches(user: str = Depends(get_current_user)):
+    return [w.status() for w in WATCHERS.values()]
+
+@app.post("/api/watch")
+def add_watch(req: WatchRequest, user: str = Depends(get_current_user)):
+    if not os.path.isdir(req.path):
+        return JSONResponse({"error": f"Not a directory: {req.path}"}, status_code=400)
+    return start_watch(req.path, watch_scanner).status()
+
+@app.delete("/api/watch")
+def remove_watch(path: str, user: str = Depends(get_current_user)):
+    # Indexed rows stay; the root just stops being kept fresh
+    return {"stopped": stop_watch(path)}
+
+@app.post("/api/watch/reconcile")
+def reconcile_watch(path: str, user: str = Depends(get_current_user)):
+    watcher = WATCHERS.get(os.path.normpath(path))
+    if not watcher: raise HTTPException(status_code=404, detail="Not watched")
+    watcher.request_reconcile()
+    return {"status": "Reconcile queued"}
+
+# --- REMOTE SCAN AGENTS (app/workers/agent.py) ---
+@app.post("/api/ingest")
+def ingest_open(req: IngestRequest, user: str = Depends(get_current_user)):
+    if req.tag not in ("MASTER", "TARGET"): return JSONResponse({"error": f"Unknown tag: {req.tag}"}, status_code=400)
+    if req.root is not None and not os.path.isabs(req.root):
+        return JSONResponse({"error": f"Root must be absolute: {req.root}"}, status_code=400)
+    try:
+        return open_ingest(req.drive, req.tag, req.root, req.mission_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Mission not found")
+
+@app.post("/api/ingest/{mission_id}/batch")
+async def ingest_batch(mission_id: int, request: Request, drive: str, seq: int, user: str = Depends(get_current_user)):
+    # Body is gzip(NDJSON); decoding and the bulk insert run off the event loop
+    body = await request.body()
+    try:
+        records = await run_in_threadpool(decode_batch, body)
+    except (OSError, ValueError):
+        return JSONResponse({"error": "Malformed batch"}, status_code=400)
+    try:
+        return await run_in_threadpool(merge_batch, mission_id, drive, seq, records)
+    except ValueError as e:
+        return JSONResponse({"error": f"Malformed batch: {e}"}, status_code=400)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Drive not open on this mission")
+
+@app.post("/api/ingest/{mission_id}/complete")
+def ingest_complete(mission_id: int, drive: str, user: str = Depends(get_current_user)):
+    try:
+        return finish_ingest(mission_id, drive)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Drive not open on this mission")
+
+# --- GOLD MASTER FINGERPRINT PACKS ---
+@app.get("/api/packs")
+def list_packs(user: str = Depends(get_current_user)):
+    if not os.path.isdir(PACKS_DIR): return []
+    return [
+        {**FingerprintPack(os.path.join(PACKS_DIR, f)).info(), "name": f[:-4]}
+        for f in sorted(os.listdir(PACKS_DIR)) if f.endswith(".fpk")
+    ]
+
+@app.post("/api/packs/export")
+def export_pack(req: PackRequest, user: str = Depends(get_current_user)):
+    # Snapshot of every MASTER fingerprint currently in the index
+    info = FingerprintPack.export(pack_path(req.name), tag="MASTER", bloom=req.bloom)
+    return {**info, "name": os.path.basename(info["path"])[:-4]}
+
+@app.post("/api/missions/{mission_id}/packs")
+def attach_pack(mission_id: int, req: PackRequest, user: str = Depends(get_current_user)):
+    if not os.path.exists(pack_path(req.name)):
+        raise HTTPException(status_code=404, detail="Pack not found")
+    with Session(engine) as session:
+        mission = session.get(ScanMission, mission_id)
+        if not mission: raise HTTPException(status_code=404, detail="Mission not found")
+        names = [n for n in (mission.master_packs or "").split(";") if n]
+        if req.name not in names: names.append(req.name)
+        mission.master_packs = ";".join(names)
+        session.add(mission)
+        session.commit()
+        return {"mission_id": mission_id, "master_packs": names}
+
+# --- ON-DEMAND PROFILING ---
+@app.post("/api/profile/start")
+def profile_start(req: ProfileRequest, user: str = Depends(get_current_user)):
+    if req.job not in ("scan", "reaper"):
+        raise HTTPException(status_code=400, detail="job must be 'scan' or 'reaper'")
+    try:
+        profiler.start_profile(
+            req.job, interval=max(req.interval_ms, 1) / 1000.0,
+            trace_malloc=req.tracemalloc, max_duration=req.max_duration_s,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.profile_status()
+
+@app.post("/api/profile/stop")
+def profile_stop(user: str = Depends(get_current_user)):
+    try:
+        reports = profiler.stop_profile()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    urls = {k: f"/reports/{v}" for k, v in reports.items() if k in ("collapsed", "allocations")}
+    return {**reports, "urls": urls}
+
+@app.get("/api/profile")
+def profile_state(user: str = Depends(get_current_user)):
+    return profiler.profile_status()
+
 @app.get("/api/analyze")
-def analyze(user: str = Depends(get_current_user)):
-    reaper = Reaper()
-    kill_list = reaper.analyze_duplicates()
+def analyze(method: Optional[str] = Query(None, pattern="^(sql|numpy)$"), user: str = Depends(get_current_user)):
+    reaper = Reaper(packs=latest_mission_packs())
+    kill_list = reaper.analyze_duplicates(method=method)
     total_size = sum(f['size'] for f in kill_list) / (1024**3)
+    trees = [f for f in kill_list if f.get('kind') == 'tree']
     return {
         "count": len(kill_list),
         "size_gb": round(total_size, 2),
-        "files": [f['path'] for f in kill_list[:10]]
+        "trees": len(trees),
+        "tree_files": sum(t['files'] for t in trees),
+        "strategies": reaper.reclaim_report(kill_list),  # Eligible files/bytes per clean mode
+        "files": [f['path'] for f in kill_list[:10]],
+        "export": "/api/export/kill-list",  # The full list, streamed (?format=csv&gzip=true)
     }
 
+@app.get("/api/export/{kind}")
+def export(kind: str, format: str = Query("ndjson", pattern="^(ndjson|csv)$"), gzip: bool = False,
+           user: str = Depends(get_current_user)):
+    # Generator-backed: rows are read page by page while the response is sent
+    if kind not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export; one of {', '.join(EXPORTS)}")
+    kwargs = {"packs": latest_mission_packs()} if kind == "kill-list" else {}
+    media = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f'attachment; filename="{export_filename(kind, format, gzip)}"'}
+    if gzip:
+        media = "application/gzip"
+    return StreamingResponse(export_stream(kind, format, gzip, **kwargs), media_type=media, headers=headers)
+
+@app.get("/api/analyze/partial")
+def analyze_partial(min_ratio: float = Query(0.5, ge=0, le=1), limit: int = Query(100, ge=1, le=1000),
+                    user: str = Depends(get_current_user)):
+    # Report only: files sharing most of their content-defined chunks with a MASTER file
+    return chunk_overlap(min_ratio, limit)
+
+@app.get("/api/stats")
+def stats(top: int = Query(20, ge=0, le=1000), paths: int = Query(5, ge=0, le=100),
+          user: str = Depends(get_current_user)):
+    # Duplicate bytes by drive / extension / size bucket and the largest duplicate groups
+    return dup_stats(top, paths)
+
+@app.get("/api/usage")
+def usage(path: str = Query("/"), depth: int = Query(1, ge=0, le=4), limit: int = Query(50, ge=1, le=500),
+          user: str = Depends(get_current_user)):
+    # du-style view from the index: where the bytes, and the duplicate bytes, live
+    if not os.path.isabs(path): return JSONResponse({"error": f"Path must be absolute: {path}"}, status_code=400)
+    tree = usage_tree(path, depth, limit)
+    if tree is None:
+        return JSONResponse({"error": "Path not indexed"}, status_code=404)
+    return tree
+
+@app.get("/api/search")
+def search(q: str = Query(..., min_length=1), field: str = Query("any", pattern="^(any|name|path)$"),
+           ext: Optional[str] = None, tag: Optional[str] = Query(None, pattern="^(MASTER|TARGET)$"),
+           drive: Optional[str] = None, min_size: Optional[int] = Query(None, ge=0),
+           max_size: Optional[int] = Query(None, ge=0), after: int = Query(0, ge=0),
+           limit: int = Query(100, ge=1, le=1000), user: str = Depends(get_current_user)):
+    # Every word of q is a prefix ("inv 2023" finds invoice_2023_final.pdf); page with after=<next>
+    return search_index(q, field, ext, tag, drive, min_size, max_size, after, limit)
+
+@app.get("/api/similar")
+def similar(threshold: float = Query(0.8, ge=0, le=1), limit: int = Query(100, ge=1, le=1000),
+            user: str = Depends(get_current_user)):
+    # Review only: edited copies are never deleted automatically
+    return similar_documents(threshold, limit)
+
+# --- CLEAN JOBS ---
+# mission id -> state of its clean; the Reaper's counters are read live for progress
+CLEAN_JOBS = {}
+CLEAN_COUNTERS = ("files_deleted", "trees_deleted", "bytes_deleted", "bytes_quarantined", "files_reflinked",
+                  "files_hardlinked", "bytes_linked", "delete_errors", "link_errors", "link_ineligible")
+
+def background_clean_task(req: CleanRequest, mission_id: int, job: dict):
+    throttle = get_throttle(mission_id) if mission_id else None
+    try:
+        # 1. Execute Reaper (Delete Duplicates)
+        reaper = job["reaper"] = Reaper(throttle=throttle, packs=latest_mission_packs(), mission_id=mission_id or None,
+                                        mode=req.mode, link=req.link, verify=req.verify)
+        job["status"], job["phase"] = "RUNNING", "reaper"
+        cleanup_stats = reaper.execute_cleanup()
+
+        # 2. Execute Janitor (Delete Ghost Folders)
+        job["phase"] = "janitor"
+        janitor = Janitor(throttle=throttle)
+        ghosts_removed = janitor.cleanup_ghosts(req.target_paths)
+
+        with Session(engine) as session:
+            total_scanned = file_count(session)
+            mission = session.get(ScanMission, mission_id) if mission_id else None
+            if mission:
+                save_mission_metrics(session, mission, "reaper", reaper.metrics)
+                save_mission_metrics(session, mission, "janitor", janitor.metrics)
+                session.commit()
+        job["result"] = {
+            "mode": req.mode,
+            "files_deleted": cleanup_stats['deleted'],
+            "files_linked": cleanup_stats.get('linked', 0),
+            "trees_removed": cleanup_stats['trees'],
+            "verification": cleanup_stats.get('verification'),
+            "ghost_folders_removed": ghosts_removed,
+        }
+        job["status"], job["phase"] = "DONE", "report"
+    except Exception as e:
+        print(f"Clean Error: {e}")
+        job["status"], job["error"] = "FAILED", str(e)
+        REPORT_JOBS[report_filename(mission_id)].update(status="FAILED", error="Clean failed")
+        return
+
+    # 3. Generate Report (PDF): the manifest can run to thousands of pages
+    build_report(mission_id, total_scanned=total_scanned,
+                 duplicates_removed=cleanup_stats['deleted'] + cleanup_stats.get('linked', 0),
+                 ghost_folders=ghosts_removed, target_paths=req.target_paths)
+
 @app.post("/api/clean")
-def clean(req: CleanRequest, user: str = Depends(get_current_user)):
-    # 1. Execute Reaper (Delete Duplicates)
-    reaper = Reaper()
-    cleanup_stats = reaper.execute_cleanup()
-
-    # 2. Execute Janitor (Delete Ghost Folders)
-    janitor = Janitor()
-    ghosts_removed = janitor.cleanup_ghosts(req.target_paths)
-    
-    # 3. Generate Report (PDF)
-    reporter = Reporter()
-    
-    # Retrieve stats for the report
+def clean(req: CleanRequest, background_tasks: BackgroundTasks, user: str = Depends(get_current_user)):
+    if req.mode not in ("delete", "quarantine", "consolidate"): return JSONResponse({"error": f"Unknown clean mode: {req.mode}"}, status_code=400)
+    if req.link not in ("auto", "reflink", "hardlink"): return JSONResponse({"error": f"Unknown link strategy: {req.link}"}, status_code=400)
     with Session(engine) as session:
-        total_scanned = session.exec(select(func.count(FileRecord.id))).one()
         latest_mission = session.exec(select(ScanMission).order_by(ScanMission.id.desc())).first()
-        mission_id = latest_mission.id if latest_mission else 0
-
-    pdf_path = reporter.generate_report(
-        mission_id=mission_id,
-        total_scanned=total_scanned,
-        duplicates_removed=cleanup_stats['deleted'],
-        ghost_folders=ghosts_removed,
-        target_paths=req.target_paths
-    )
-    
+    if req.mode == "quarantine" and not latest_mission:
+        return JSONResponse({"error": "Quarantine needs a mission"}, status_code=400)
+    if any(job["status"] in ("QUEUED", "RUNNING") for job in CLEAN_JOBS.values()):
+        return JSONResponse({"error": "A clean is already running"}, status_code=409)
+    mission_id = latest_mission.id if latest_mission else 0
+
+    # Throttled deletes and verifier reads can take hours: the clean runs in the background
+    job = CLEAN_JOBS[mission_id] = {"status": "QUEUED", "phase": None, "started_at": time.time()}
+    filename = queue_report(mission_id)  # Downloads answer 202 until the clean and its report are done
+    background_tasks.add_task(background_clean_task, req, mission_id, job)
+    return JSONResponse({
+        "status": "Queued",
+        "mission_id": mission_id,
+        "status_url": f"/api/clean/{mission_id}",
+        "report_status_url": f"/api/reports/{mission_id}",
+        "report_url": f"/reports/{filename}",
+    }, status_code=202)
+
+@app.get("/api/clean/{mission_id}")
+def clean_progress(mission_id: int, user: str = Depends(get_current_user)):
+    job = CLEAN_JOBS.get(mission_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No clean for this mission")
+    reaper = job.get("reaper")
+    counters = reaper.metrics.counters if reaper else {}
     return {
-        "files_deleted": cleanup_stats['deleted'],
-        "ghost_folders_removed": ghosts_removed,
-        "report_url": f"/reports/{os.path.basename(pdf_path)}"
+        **{k: v for k, v in job.items() if k != "reaper"},
+        "planned": reaper.planned if reaper else None,
+        "counters": {k: counters[k] for k in CLEAN_COUNTERS if k in counters},
+        "report_url": f"/reports/{report_filename(mission_id)}",
     }
 
+# --- QUARANTINE (clean mode="quarantine") ---
+@app.get("/api/quarantine")
+def quarantine_state(user: str = Depends(get_current_user)):
+    return {"hold_s": HOLD_S, "missions": quarantine_summary()}
+
+@app.post("/api/quarantine/restore")
+def quarantine_restore(req: QuarantineRequest, user: str = Depends(get_current_user)):
+    # Renames only: instant, and the index rows come back from the journal
+    return restore(req.mission_id, req.ids or None)
+
+@app.post("/api/quarantine/purge")
+def quarantine_purge(req: QuarantineRequest, background_tasks: BackgroundTasks, user: str = Depends(get_current_user)):
+    background_tasks.add_task(purge, req.older_than_s or 0, req.mission_id)
+    return {"status": "Purge queued"}
+
+@app.get("/api/reports/{mission_id}")
+def report_progress(mission_id: int, user: str = Depends(get_current_user)):
+    state = report_status(report_filename(mission_id))
+    if state is None:
+        raise HTTPException(status_code=404, detail="No report for this mission")
+    return {**state, "report_url": f"/reports/{report_filename(mission_id)}"}
+
 # NEW: Endpoint to download the generated PDF
 @app.get("/reports/{filename}")
 def download_report(filename: str, user: str = Depends(get_current_user)):
-    file_path = os.path.join("/app/reports", filename)
+    file_path = os.path.join(REPORTS_DIR, os.path.basename(filename))
+    state = report_status(filename)
+    if state and state["status"] in ("QUEUED", "RUNNING"):
+        # Never served half-built (or stale while rebuilding): poll until DONE
+        return JSONResponse(state, status_code=202, headers={"Retry-After": "2"})
     if os.path.exists(file_path):
-        return FileResponse(file_path, media_type='application/pdf', filename=filename)
+        # PDFs and profiler captures (.txt) share this directory
+        return FileResponse(file_path, filename=filename)
     raise HTTPException(status_code=404, detail="Report not found")